@@ -0,0 +1,109 @@
+import copy
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from bitrecord import BitRecord
+from gameconfig import GameConfig
+from udpgameengine import UDPGameEngine
+
+def MakeEngine(fast_mode, size):
+    '''Return an engine configured with or without fast mode.'''
+    e = UDPGameEngine()
+    conf = GameConfig()
+    conf.buffer_size = size
+    conf.fast_mode = fast_mode
+    conf.Apply(e)
+    return e
+
+def ProfileReplay(e, frames, replays, seed):
+    '''Return the number of frames per second replayed by e.
+    Each replay rewinds up to the size of the buffer and plays it back, and
+    updates the histories as a received event would.'''
+    rand = random.Random(seed)
+    size = e.buffer_size
+    bitrec = BitRecord()
+    bitrec.frame = frames
+    for i in range(0, 3):
+        bitrec.bits[i] = rand.getrandbits(size)
+    s = copy.deepcopy(e.state)
+    updates = [rand.getrandbits(size) for i in range(0, replays)]
+    start = time.time()
+    for update in updates:
+        s.frame = frames - size
+        e.PlayFromState(s, bitrec, e.rec, frames, size)
+        bits = e.UpdateHistory(frames, bitrec.bits[0], frames - 8, update,
+                size)
+        bits = e.SetBit(bits, frames % size, 1, size)
+        e.GetBit(bits, (frames - 1) % size)
+        e.IsAcked(frames - 4, bits, frames, size)
+    return replays * size / (time.time() - start)
+
+def ProfileClientReplay(e, frames, replays, seed):
+    '''Return the number of frames per second replayed by e as a client,
+    which keeps its own object in the frames flagged in bits[3].'''
+    rand = random.Random(seed)
+    size = e.buffer_size
+    bitrec = BitRecord()
+    bitrec.frame = frames
+    for i in range(0, 4):
+        bitrec.bits[i] = rand.getrandbits(size)
+    s = copy.deepcopy(e.state)
+    # Record the frames the flagged ones are restored from.
+    s.frame = frames - size
+    e.PlayFromState(s, bitrec, e.rec, frames, size)
+    start = time.time()
+    for i in range(0, replays):
+        s.frame = frames - size
+        e.PlayFromStateWithPlayer(s, bitrec, e.rec, frames, 1, size)
+    return replays * size / (time.time() - start)
+
+def ProfileBitOps(e, calls, seed):
+    '''Return the number of history updates per second made by e.'''
+    rand = random.Random(seed)
+    size = e.buffer_size
+    args = []
+    for i in range(0, calls):
+        frame = rand.randrange(size, 4 * size)
+        args.append((frame, rand.getrandbits(size), rand.getrandbits(size)))
+    start = time.time()
+    for (frame, bits, update) in args:
+        bits = e.UpdateHistory(frame, bits, frame - 8, update, size)
+        bits = e.SetBit(bits, frame % size, 1, size)
+        e.GetBit(bits, (frame - 1) % size)
+        e.IsAcked(frame - 4, bits, frame, size)
+    return calls / (time.time() - start)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=\
+            'Compare replays with and without fast mode.')
+    parser.add_argument('--size', type=int, default=64,
+            help='The number of frames replayed each time.')
+    parser.add_argument('--replays', type=int, default=2000,
+            help='The number of replays.')
+    parser.add_argument('--seed', type=int, default=0,
+            help='The seed of the histories.')
+    args = parser.parse_args()
+    frames = 10 * args.size
+    before = ProfileReplay(MakeEngine(False, args.size), frames,
+            args.replays, args.seed)
+    after = ProfileReplay(MakeEngine(True, args.size), frames, args.replays,
+            args.seed)
+    print('Replay checked:   {0:.0f} frames/sec'.format(before))
+    print('Replay fast mode: {0:.0f} frames/sec'.format(after))
+    print('Replay speed-up:  {0:.2f}x'.format(after / before))
+    before = ProfileClientReplay(MakeEngine(False, args.size), frames,
+            args.replays, args.seed)
+    after = ProfileClientReplay(MakeEngine(True, args.size), frames,
+            args.replays, args.seed)
+    print('Client checked:   {0:.0f} frames/sec'.format(before))
+    print('Client fast mode: {0:.0f} frames/sec'.format(after))
+    print('Client speed-up:  {0:.2f}x'.format(after / before))
+    calls = args.replays * args.size
+    before = ProfileBitOps(MakeEngine(False, args.size), calls, args.seed)
+    after = ProfileBitOps(MakeEngine(True, args.size), calls, args.seed)
+    print('Bits checked:     {0:.0f} updates/sec'.format(before))
+    print('Bits fast mode:   {0:.0f} updates/sec'.format(after))
+    print('Bits speed-up:    {0:.2f}x'.format(after / before))
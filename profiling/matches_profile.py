@@ -0,0 +1,90 @@
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from gameconfig import GameConfig
+from gameevent import GameEvent
+from gamestate import GameState
+from matchserver import MatchServer
+from match import Match
+
+class LoopbackClient:
+    '''A client of a Match that sends synthetic keyboard events and
+    serializes the states sent to it, without a socket.'''
+    def __init__(self, player_id, rand, event_rate, lag):
+        self.player_id = player_id
+        self.rand = rand
+        self.event_rate = event_rate
+        self.lag = lag
+        self.frame = 0
+        self.sent_bytes = 0
+
+    def ReadEvents(self):
+        if self.rand.random() >= self.event_rate:
+            return []
+        evt = GameEvent()
+        evt.frame = max(0, self.frame - self.lag)
+        evt.keybits = self.rand.getrandbits(8)
+        return [evt]
+
+    def SendEvent(self, evt):
+        if isinstance(evt, GameState):
+            self.frame = evt.frame
+        self.sent_bytes += len(evt.Serialize())
+        return 0
+
+    def Close(self):
+        pass
+
+def ProfileMatches(n, players, frame_rate, seconds, seed,
+        client_class=LoopbackClient):
+    '''Play n matches on one simulated tick loop, ticking once per frame.
+    The clients are instances of client_class, a LoopbackClient.
+    Return value:
+    The MatchServer that played the matches.
+    '''
+    rand = random.Random(seed)
+    conf = GameConfig()
+    conf.player_size = players
+    conf.frames_per_sec = frame_rate
+    conf.game_length = seconds
+    conf.post_game_time = 0
+    svr = MatchServer(conf)
+    for i in range(0, n):
+        clients = [client_class(p, rand, 0.2, 4) for p in range(0, players)]
+        svr.matches[i] = Match(i, clients, conf, 0.0)
+    start = min([m.scheduler.start for m in svr.matches.values()])
+    tick = 0
+    while len(svr.matches) > 0:
+        svr.Tick(start + tick / float(frame_rate))
+        tick += 1
+    return svr
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=\
+            'Measure how many matches one core can play.')
+    parser.add_argument('--matches', type=int, default=20,
+            help='The number of matches.')
+    parser.add_argument('--players', type=int, default=3,
+            help='The number of players per match.')
+    parser.add_argument('--fps', type=int, default=60,
+            help='The frame rate.')
+    parser.add_argument('--time', type=int, default=10,
+            help='The length of each match in seconds.')
+    parser.add_argument('--seed', type=int, default=0,
+            help='The seed of the synthetic events.')
+    args = parser.parse_args()
+    start = time.time()
+    svr = ProfileMatches(args.matches, args.players, args.fps, args.time,
+            args.seed)
+    elapsed = time.time() - start
+    for stats in svr.finished:
+        print(stats)
+    print('Frames:      {0}'.format(svr.frames))
+    print('Busy:        {0:.3f} s of {1:.3f} s'.format(svr.busy_time, elapsed))
+    print('Frame cost:  {0:.1f} usec'.format(
+        1000000.0 * svr.busy_time / svr.frames))
+    print('Capacity:    {0:.0f} matches per core at {1} fps'.format(
+        svr.GetCapacity(args.fps), args.fps))
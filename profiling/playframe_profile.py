@@ -0,0 +1,53 @@
+import copy
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from bitrecord import BitRecord
+from gameconfig import GameConfig
+from gameevent import GameEvent
+from udpgameengine import UDPGameEngine
+
+def MakeKeys(frames, seed):
+    '''Make a sequence of key flags with occasional flaps.'''
+    rand = random.Random(seed)
+    keys = []
+    for i in range(0, frames):
+        k = GameEvent.EVENT_NO_OP
+        if rand.random() < 0.05:
+            k |= GameEvent.EVENT_FLAP_LEFT_PADDLE
+        if rand.random() < 0.05:
+            k |= GameEvent.EVENT_FLAP_RIGHT_PADDLE
+        if rand.random() < 0.1:
+            k |= GameEvent.EVENT_FLAP_BALL
+        keys.append(k)
+    return keys
+
+def ProfilePlayFrame(play_frame, state, keys):
+    '''Return the number of frames per second played by play_frame.'''
+    s = copy.deepcopy(state)
+    bitrec = BitRecord()
+    start = time.time()
+    for k in keys:
+        play_frame(s, k, bitrec)
+    return len(keys) / (time.time() - start)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=\
+            'Compare PlayFrame with the step function specialized by ' +
+            'GameConfig.Apply.')
+    parser.add_argument('--frames', type=int, default=200000,
+            help='The number of frames to play.')
+    parser.add_argument('--seed', type=int, default=0,
+            help='The seed of the key sequence.')
+    args = parser.parse_args()
+    e = UDPGameEngine()
+    GameConfig().Apply(e)
+    keys = MakeKeys(args.frames, args.seed)
+    before = ProfilePlayFrame(e.PlayFrame, e.state, keys)
+    after = ProfilePlayFrame(e.play_frame, e.state, keys)
+    print('PlayFrame:   {0:.0f} frames/sec'.format(before))
+    print('Specialized: {0:.0f} frames/sec'.format(after))
+    print('Speed-up:    {0:.2f}x'.format(after / before))
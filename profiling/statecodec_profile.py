@@ -0,0 +1,112 @@
+import os
+import sys
+import timeit
+sys.path.append(os.path.abspath('src'))
+from gameconfig import GameConfig
+from gamestate import GameState
+from matches_profile import LoopbackClient
+from matches_profile import ProfileMatches
+from statecodec import StateCodec
+
+class RecordingClient(LoopbackClient):
+    '''A LoopbackClient that keeps a copy of each state sent to it.'''
+    def __init__(self, player_id, rand, event_rate, lag):
+        LoopbackClient.__init__(self, player_id, rand, event_rate, lag)
+        self.states = []
+
+    def SendEvent(self, evt):
+        if isinstance(evt, GameState):
+            s = GameState()
+            evt.Copy(s)
+            s.bits[0:3] = evt.bits[0:3]
+            self.states.append(s)
+        return LoopbackClient.SendEvent(self, evt)
+
+def RecordStates(frame_rate, seconds, seed):
+    '''Return the states sent to the first player of a simulated match.'''
+    clients = []
+    class Client(RecordingClient):
+        def __init__(self, *args):
+            RecordingClient.__init__(self, *args)
+            clients.append(self)
+    ProfileMatches(1, 3, frame_rate, seconds, seed, Client)
+    return clients[0].states
+
+def ProfileFormat(name, states, lag, encode, decode, number):
+    '''Print the bytes per update and the time per update of a format.
+    Arguments:
+    states -- The updates, oldest first.
+    lag    -- The number of updates between an update and its baseline, or
+              0 for none.
+    encode -- encode(buf, s, base) writes s into buf and returns the end.
+    decode -- decode(buf, t, base) reads buf into t.
+    number -- The number of times to encode and decode each update.
+    '''
+    buf = bytearray(600)
+    t = GameState()
+    size = 0
+    encode_time = 0.0
+    decode_time = 0.0
+    for i in range(lag, len(states)):
+        s = states[i]
+        base = None
+        if lag > 0:
+            base = states[i - lag]
+        end = encode(buf, s, base)
+        size += end
+        view = memoryview(buf)[:end]
+        encode_time += timeit.timeit(lambda: encode(buf, s, base),
+                number=number)
+        decode(view, t, base)
+        assert t.GetDeltaFields() == s.GetDeltaFields()
+        assert t.frame == s.frame and t.bits[0:3] == s.bits[0:3]
+        decode_time += timeit.timeit(lambda: decode(view, t, base),
+                number=number)
+    n = len(states) - lag
+    print('{0:<16} {1:6.1f} bytes  encode {2:5.2f} usec  decode {3:5.2f} usec'
+            .format(name, float(size) / n, 1e6 * encode_time / n / number,
+                1e6 * decode_time / n / number))
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=\
+            'Compare the encodings of state updates.')
+    parser.add_argument('--fps', type=int, default=60,
+            help='The frame rate.')
+    parser.add_argument('--time', type=int, default=20,
+            help='The length of the match in seconds.')
+    parser.add_argument('--lag', type=int, default=6,
+            help='The number of updates between a delta and its baseline.')
+    parser.add_argument('--number', type=int, default=100,
+            help='The number of times to time each update.')
+    parser.add_argument('--seed', type=int, default=0,
+            help='The seed of the synthetic events.')
+    args = parser.parse_args()
+    states = RecordStates(args.fps, args.time, args.seed)
+    conf = GameConfig()
+    conf.frames_per_sec = args.fps
+    conf.game_length = args.time
+    conf.post_game_time = 0
+    codec = StateCodec(conf)
+    print('{0} updates, baseline {1} updates old'.format(len(states),
+        args.lag))
+    def Full(buf, s, base):
+        return s.SerializeInto(buf, 0)
+    def ReadFull(buf, t, base):
+        t.Deserialize(buf, 4)
+    def Delta(buf, s, base):
+        return s.SerializeDeltaInto(buf, 0, base, 0)
+    def ReadDelta(buf, t, base):
+        t.DeserializeDelta(buf, 4, base)
+    def Packed(buf, s, base):
+        codec.state = s
+        codec.base = base
+        codec.seq = 1
+        return codec.SerializeInto(buf, 0)
+    def ReadPacked(buf, t, base):
+        codec.Deserialize(buf, 4, t, base)
+    ProfileFormat('full', states, 0, Full, ReadFull, args.number)
+    ProfileFormat('delta', states, args.lag, Delta, ReadDelta, args.number)
+    ProfileFormat('packed', states, 0, Packed, ReadPacked, args.number)
+    ProfileFormat('packed delta', states, args.lag, Packed, ReadPacked,
+            args.number)
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from eventtype import EventType
+import tplogger
+from tpmessage import TPMessage
+from udpeventsocket import UDPEventSocket
+
+logger = tplogger.getTPLogger('asynceventsocket.log', logging.DEBUG)
+
+class AsyncEventSocket(UDPEventSocket):
+    '''The asyncio version of UDPEventSocket.
+    ReadEvent, WriteEvent, Sync and RecvSync are coroutines. ReadEvents and
+    SendEvent do not wait and are shared with UDPEventSocket.
+    Attribute:
+    sock -- An AsyncUDPSocket.
+    '''
+    def __init__(self, sock):
+        UDPEventSocket.__init__(self, sock)
+
+    def GetPeerName(self):
+        return self.sock.peer
+
+    async def ReadEvent(self, timeout=0):
+        '''Wait up to timeout seconds for an event. As with
+        UDPEventSocket.ReadEvent, events of a pooled type are only valid
+        until the next read.
+        Return value:
+        The event, or None on timeout.
+        '''
+        if self.should_read_buffer:
+            self.should_read_buffer = False
+            return self.buffered_event
+        datagram = await self.sock.Recv(timeout)
+        if datagram == None:
+            return None
+        self.ReleaseEvents()
+        evt = self.Decode(datagram)
+        if evt == None:
+            return None
+        self.buffered_event = evt
+        return evt
+
+    def SendEvent(self, evt):
+        '''Send evt once without waiting, suppressing self.errlim
+        consecutive errors.
+        Return value:
+        Return 0 on success and -1 if the event was not sent.
+        '''
+        if evt == None:
+            return -1
+        try:
+            self.Write(evt)
+            self.errc = 0
+        except Exception as ex:
+            self.errc += 1
+            if self.errc > self.errlim:
+                raise ex
+            logger.info('Suppressing error')
+            logger.exception(ex)
+            return -1
+        return 0
+
+    async def WriteEvent(self, evt, timeout=0.0, resend=1):
+        '''Send evt resend times, spaced evenly over timeout seconds.
+        Return value:
+        Return 0 on success and -1 if no events were sent.
+        '''
+        assert resend > 0
+        if evt == None:
+            return -1
+        time_between_send = float(timeout) / resend
+        did_send = False
+        for i in range(0, resend):
+            if i > 0:
+                await asyncio.sleep(time_between_send)
+            if self.SendEvent(evt) == 0:
+                did_send = True
+        if not did_send:
+            return -1
+        return 0
+
+    async def Sync(self, timeout, sync_rate):
+        '''The coroutine version of UDPEventSocket.Sync().
+        Return value: 0 on success and -1 on error.
+        '''
+        assert timeout >= 0
+        assert sync_rate > 0
+        time_between_send = 1.0 / sync_rate
+        end_time = time.time() + timeout
+        n = 0
+        average_rtt = 0
+        min_rtt = 1000000
+        msg = TPMessage()
+        msg.method = TPMessage.METHOD_SYNC
+        while time.time() < end_time:
+            expected_ack = self.sock.seq
+            msg.seq = self.sock.seq
+            try:
+                start_trip = time.time()
+                self.SendEvent(msg)
+                seq_end_time = min(start_trip + time_between_send, end_time)
+                # Read until we find the expected response or timeout.
+                reply = None
+                while True:
+                    evt = await self.ReadEvent(
+                            max(0, seq_end_time - time.time()))
+                    if evt == None:
+                        break
+                    end_trip = time.time()
+                    if evt.event_type != EventType.HANDSHAKE:
+                        continue
+                    if evt.method != TPMessage.METHOD_SYNC:
+                        continue
+                    if evt.ack != expected_ack:
+                        logger.info('Reply was out of order')
+                        continue
+                    reply = evt
+                    break
+                # Wait out the rest of the sync period.
+                await asyncio.sleep(max(0, seq_end_time - time.time()))
+                if reply == None:
+                    continue
+                rtt = int((end_trip - start_trip) * 1000)
+                delta = reply.timestamp - int(start_trip * 1000)
+                if rtt < min_rtt:
+                    min_rtt = rtt
+                    self.delta = int(delta - (min_rtt // 2))
+                average_rtt = (average_rtt * n + rtt) / (n + 1)
+                n += 1
+            except Exception as e:
+                logger.exception(e)
+                return -1
+        self.latency = int(average_rtt // 2)
+        if n == 0:
+            logger.info('Failed to get any sync data')
+            return -1
+        return 0
+
+    async def RecvSync(self, timeout):
+        '''The coroutine version of UDPEventSocket.RecvSync().
+        Return value:
+        0 on success and -1 on failure.
+        '''
+        end_time = time.time() + timeout
+        reply = TPMessage()
+        reply.method = TPMessage.METHOD_SYNC
+        while time.time() < end_time:
+            try:
+                msg = await self.ReadEvent(max(0, end_time - time.time()))
+                if msg == None:
+                    continue
+                reply.timestamp = int(time.time() * 1000)
+                if msg.event_type != EventType.HANDSHAKE:
+                    # Let the handshake read it.
+                    self.UnreadEvent()
+                    break
+                if msg.method != TPMessage.METHOD_SYNC:
+                    self.UnreadEvent()
+                    break
+                reply.ack = msg.seq
+                self.SendEvent(reply)
+            except Exception as e:
+                logger.exception(e)
+                return -1
+        return 0
@@ -0,0 +1,37 @@
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from tickscheduler import TickScheduler
+
+class AsyncTickScheduler(TickScheduler):
+    '''A TickScheduler that can also wait in a coroutine, for the asyncio
+    servers and clients.
+    '''
+    async def WaitUntilAsync(self, deadline, event=None):
+        '''The coroutine version of WaitUntil.
+        Arguments:
+        deadline -- The monotonic time to wake up at.
+        event    -- An asyncio.Event set when a socket is readable, or None.
+                    It is cleared when it ends the wait.
+        Return value:
+        True if event was set before the deadline.
+        '''
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            # Yield anyway, so a caller behind schedule cannot starve the
+            # loop.
+            await asyncio.sleep(0)
+            return False
+        if event != None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+                event.clear()
+                return True
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(timeout)
+        self.RecordWakeup(deadline)
+        return False
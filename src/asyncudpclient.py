@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from asynceventsocket import AsyncEventSocket
+from asynctickscheduler import AsyncTickScheduler
+from asyncudpgameengine import AsyncUDPGameEngine
+from asyncudpsocket import AsyncUDPSocket
+from eventtype import EventType
+from gameconfig import GameConfig
+from gameevent import GameEvent
+import tplogger
+from tpmessage import TPMessage
+from udpclient import UDPClient
+logger = tplogger.getTPLogger('asyncudpclient.log', logging.DEBUG)
+
+class AsyncUDPClient(UDPClient):
+    '''The asyncio version of UDPClient.
+    Handshake, PlayFrames and Run are coroutines. The game logic of a tick
+    is shared with UDPClient.
+    '''
+    def __init__(self):
+        UDPClient.__init__(self)
+        self.scheduler = AsyncTickScheduler()
+
+    async def ReadUntil(self, svr, end_time, event_type):
+        '''Return the next event of event_type read before end_time, or
+        None.'''
+        while time.time() < end_time:
+            try:
+                msg = await svr.ReadEvent(max(0, end_time - time.time()))
+            except Exception as e:
+                logger.exception(e)
+                continue
+            if msg != None and msg.event_type == event_type:
+                return msg
+        return None
+
+    async def Handshake(self, svr, resend, timeout):
+        '''The coroutine version of UDPClient.Handshake().
+        Return value:
+        True if the handshake succeeded and False otherwise.
+        '''
+        logger.info('Waiting for server to initiate handshake.')
+        msg = await self.ReadUntil(svr, time.time() + timeout,
+                EventType.CONFIGURE)
+        if msg == None:
+            logger.info('Handshake timed out. Failing.')
+            return False
+        self.conf = msg
+        logger.info('Sending confirmation.')
+        reply = TPMessage()
+        reply.method = TPMessage.METHOD_CONFIRM
+        try:
+            status = await svr.WriteEvent(reply, 0.5, resend)
+        except Exception as e:
+            logger.exception(e)
+            return False
+        if status != 0:
+            logger.error('Failed to send confirmation.')
+            return False
+        logger.info('Waiting for start of game.')
+        end_time = time.time() + 0.5
+        while True:
+            msg = await self.ReadUntil(svr, end_time, EventType.HANDSHAKE)
+            if msg == None:
+                logger.info('Handshake timed out.')
+                return False
+            if msg.method == TPMessage.METHOD_STARTGAME:
+                self.conf.start_time = msg.timestamp
+                break
+        logger.info('Handshake succeeded.')
+        return True
+
+    async def PlayFrames(self, e, s, start_time, max_frame, frame_rate):
+        '''The coroutine version of UDPClient.PlayFrames().'''
+        assert e != None
+        assert s != None
+        assert frame_rate > 0
+        end_frame = s.frame + max_frame
+        self.next_send = 0.0
+        msg = GameEvent()
+        sched = self.scheduler
+        sched.SetStart(start_time, frame_rate)
+        ready = None
+        if e.server != None:
+            ready = e.server.sock.ready
+        while s.frame < end_frame:
+            now = sched.Now()
+            target_frame = max(0, sched.GetFrame(now))
+            self.PlayTick(e, s, now, target_frame, end_frame, msg)
+            deadline = sched.GetFrameTime(s.frame + 1)
+            if e.server == None:
+                ready = None
+            else:
+                deadline = min(deadline, self.next_send)
+            await sched.WaitUntilAsync(deadline, ready)
+
+    async def Run(self, svraddr, renderer, keyboard, user_conf, tries, resend,
+            timeout):
+        '''The coroutine version of UDPClient.Run().
+        Return value:
+        True if a game was completed successfully and False otherwise.
+        '''
+        e = AsyncUDPGameEngine()
+        sock = AsyncUDPSocket()
+        await sock.Open()
+        for i in range(0, tries):
+            logger.info('Connecting to server.')
+            if not await sock.Connect(svraddr, 1):
+                logger.info('Connection failed.')
+                continue
+            svr = AsyncEventSocket(sock)
+            if user_conf.do_sync:
+                logger.info('Syncing clock with server.')
+                await svr.RecvSync(user_conf.sync_timeout * 3)
+            if not await self.Handshake(svr, resend, timeout):
+                logger.info('Handshake failed.')
+                continue
+            # The step cache and fast mode are local settings.
+            self.conf.step_cache_size = user_conf.step_cache_size
+            self.conf.fast_mode = user_conf.fast_mode
+            self.conf.Apply(e)
+            logger.info('Starting game as player {0}.'.format(e.player_id))
+            e.server = svr
+            e.is_client = True
+            e.is_server = True
+            e.renderer = renderer
+            e.keyboard = keyboard
+            await e.PlayAsAsync(e.state, self, self.conf.start_time / 1000.0)
+            logger.info('Game ended.')
+            self.trace.Dump(logger)
+            self.trace.Clear()
+            sock.Close()
+            return True
+        logger.info('Failed to start game.')
+        sock.Close()
+        return False
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=\
+            'The Triplepong client, asyncio version.')
+    parser.add_argument('--ip', type=str, default='127.0.0.1',
+            help='The IP address of the server.')
+    parser.add_argument('--port', type=int, default=8090, help='The port.')
+    parser.add_argument('--tries', type=int, default=60,
+            help='The number of attempts to connect to the server.')
+    parser.add_argument('--resend', type=int, default=9,
+            help='The number of duplicate messages to send during handshake.')
+    parser.add_argument('--timeout', type=int, default=10,
+            help='The time allowed for each connection and handshake.')
+    parser.add_argument('--nosync', default=False, action='store_true',
+            help='Allow server to measure latency and clock.')
+    args = parser.parse_args()
+    conf = GameConfig()
+    conf.do_sync = not args.nosync
+    c = AsyncUDPClient()
+    from renderer import Renderer
+    r = Renderer()
+    r.Init()
+    conf.ApplyRenderer(r)
+    if not asyncio.run(c.Run((args.ip, args.port), r, r, conf, args.tries,
+            args.resend, args.timeout)):
+        print('Timed out.')
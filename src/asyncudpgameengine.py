@@ -0,0 +1,31 @@
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from asynctickscheduler import AsyncTickScheduler
+import tplogger
+from udpgameengine import UDPGameEngine
+logger = tplogger.getTPLogger('asyncudpgameengine.log', logging.DEBUG)
+
+class AsyncUDPGameEngine(UDPGameEngine):
+    '''A UDPGameEngine that can also play in a coroutine, for the asyncio
+    servers and clients.
+    '''
+    async def PlayAsAsync(self, s, player, start_time):
+        '''The coroutine version of PlayAs. player.PlayFrames must be a 
+        coroutine.
+        '''
+        assert s != None
+        frame_rate = s.frames_per_sec 
+        logger.info('Starting game at {0}: Now {1}'.format(start_time, 
+            time.time()))
+        sched = AsyncTickScheduler()
+        sched.SetStart(start_time, frame_rate)
+        await sched.WaitUntilAsync(sched.start)
+        for rotation_length in self.Rotations(s):
+            await player.PlayFrames(self, s, float(start_time),
+                    rotation_length, frame_rate) 
+        self.FinishGame(s, player)
+        await player.PlayFrames(self, s, float(start_time), 
+                frame_rate * self.post_game_time, frame_rate)
@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import struct
+import sys
+sys.path.append(os.path.abspath('src'))
+from asyncudpsocket import AsyncUDPSocket
+import tplogger
+from udpdatagram import UDPDatagram
+from udpsocket import UDPSocket
+logger = tplogger.getTPLogger('asyncudpmux.log', logging.DEBUG)
+
+class MuxConnection(AsyncUDPSocket):
+    '''One connection served by an AsyncUDPMux. It keeps the seq, ack and
+    ackbits of its peer like an AsyncUDPSocket, but has no socket of its
+    own: the mux hands it the datagrams of its peer and sends for it.
+
+    Attributes:
+    mux      -- The AsyncUDPMux.
+    conn_id  -- The connection ID the peer sends before each datagram.
+    accepted -- An asyncio.Event set when the peer completes the handshake.
+    '''
+    def __init__(self, mux, conn_id):
+        AsyncUDPSocket.__init__(self)
+        self.mux = mux
+        self.conn_id = conn_id
+        self.sock = mux.sock
+        self.accepted = asyncio.Event()
+
+    def Send(self, payload):
+        '''Send payload to the peer without waiting.
+        Return value:
+        True if this method succeeded.
+        '''
+        self.mux.SendTo(self.Pack(payload), self.peer)
+        return self.OnSent()
+
+    def Write(self, evt):
+        '''Send the datagram carrying evt without waiting.
+        Return value:
+        True if this method succeeded.
+        '''
+        self.mux.SendTo(self.PackEvent(evt), self.peer)
+        return self.OnSent()
+
+    def Close(self):
+        self.mux.Remove(self)
+
+class AsyncUDPMux(AsyncUDPSocket):
+    '''A server transport that serves all connections from one bound socket.
+    Accept() gives each peer a connection ID in the reply to GUID_1, along
+    with the port of the mux itself. The peer sends the ID before each
+    datagram, and the datagrams are dispatched by source address and ID to
+    the MuxConnection of the peer.
+    The socket is drained each time it is readable, since an asyncio
+    datagram transport reads only one datagram per iteration of the loop.
+
+    Attributes:
+    connections -- The MuxConnection of each (address, connection ID).
+    pending     -- The MuxConnection of each connection ID whose peer has
+                   not completed the handshake.
+    ids         -- The connection IDs in use.
+    dropped     -- The number of datagrams of no known connection, or not
+                   sent because the socket buffer was full.
+    '''
+    def __init__(self):
+        AsyncUDPSocket.__init__(self)
+        self.connections = {}
+        self.pending = {}
+        self.ids = set()
+        self.dropped = 0
+        self.rand = random.SystemRandom()
+
+    async def Open(self, addr=('0.0.0.0', 0)):
+        '''Open a socket bound to addr.'''
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.sock.bind(addr)
+        asyncio.get_running_loop().add_reader(self.sock.fileno(),
+                self.OnReadable)
+
+    def Close(self):
+        if self.sock != None:
+            asyncio.get_running_loop().remove_reader(self.sock.fileno())
+            self.sock.close()
+
+    def OnReadable(self):
+        '''Dispatch every pending datagram.'''
+        while True:
+            try:
+                (buf, addr) = self.sock.recvfrom(UDPDatagram.MAX_DATAGRAM +
+                        UDPSocket.CONN_ID_STRUCT.size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as ex:
+                logger.info('Socket error: {0}'.format(ex))
+                return
+            self.OnDatagram(buf, addr)
+
+    def SendTo(self, buf, addr):
+        '''Send buf to addr without waiting. The datagram is dropped if the
+        socket buffer is full.'''
+        try:
+            self.sock.sendto(buf, addr)
+        except (BlockingIOError, InterruptedError):
+            self.dropped += 1
+
+    def OnDatagram(self, data, addr):
+        if data == UDPSocket.GUID_1:
+            # A new peer, for Accept().
+            AsyncUDPSocket.OnDatagram(self, data, addr)
+            return
+        size = UDPSocket.CONN_ID_STRUCT.size
+        if len(data) < size:
+            self.dropped += 1
+            return
+        (conn_id,) = UDPSocket.CONN_ID_STRUCT.unpack_from(data)
+        c = self.connections.get((addr, conn_id))
+        if c != None:
+            c.OnDatagram(memoryview(data)[size:], addr)
+            return
+        c = self.pending.get(conn_id)
+        if c != None and data[size:] == UDPSocket.GUID_3:
+            # Depending on the NAT method, the peer port might change.
+            c.peer = addr
+            c.accepted.set()
+            return
+        self.dropped += 1
+
+    def NewConnectionID(self):
+        while True:
+            conn_id = self.rand.getrandbits(32)
+            if not conn_id in self.ids:
+                self.ids.add(conn_id)
+                return conn_id
+
+    async def Accept(self, timeout):
+        '''Try to accept a connection.
+        Return value:
+        A MuxConnection with the address of a peer, or None if the
+        handshake failed.
+        '''
+        item = await self.RecvFrom(timeout)
+        if item == None:
+            logger.info('Accept timed out.')
+            return None
+        (_, addr) = item
+        conn_id = self.NewConnectionID()
+        logger.info('Initiating handshake with {0} as connection {1}'.format(
+            addr, conn_id))
+        c = MuxConnection(self, conn_id)
+        self.pending[conn_id] = c
+        try:
+            (_, port) = self.sock.getsockname()
+            self.SendTo(struct.pack(UDPSocket.MUX_FORMAT, port, conn_id),
+                    addr)
+            await asyncio.wait_for(c.accepted.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.info('Timed out while waiting for reply.')
+            self.ids.discard(conn_id)
+            return None
+        except Exception as e:
+            logger.exception(e)
+            logger.info('Handshake failed.')
+            self.ids.discard(conn_id)
+            return None
+        finally:
+            del self.pending[conn_id]
+        self.connections[(c.peer, conn_id)] = c
+        logger.info('Connection accepted.')
+        c.ttl = UDPSocket.MAX_TIME_TO_LIVE
+        return c
+
+    def Remove(self, c):
+        '''Stop dispatching datagrams to c.'''
+        if self.connections.get((c.peer, c.conn_id)) is c:
+            del self.connections[(c.peer, c.conn_id)]
+            self.ids.discard(c.conn_id)
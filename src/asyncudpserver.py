@@ -0,0 +1,250 @@
+import asyncio
+import copy
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from asynceventsocket import AsyncEventSocket
+from asynctickscheduler import AsyncTickScheduler
+from asyncudpgameengine import AsyncUDPGameEngine
+from asyncudpsocket import AsyncUDPSocket
+from endgameevent import EndGameEvent
+from eventtype import EventType
+from gameconfig import GameConfig
+from statecodec import StateCodec
+import tplogger
+from tpmessage import TPMessage
+from udpserver import UDPServer
+logger = tplogger.getTPLogger('asyncudpserver.log', logging.DEBUG)
+
+class AsyncUDPServer(UDPServer):
+    '''The asyncio version of UDPServer.
+    AcceptN, Handshake, PlayFrames and Run are coroutines, so several games
+    can be accepted, synced and played concurrently in one event loop. The
+    game logic of a tick is shared with UDPServer.
+    '''
+    def __init__(self):
+        UDPServer.__init__(self)
+        self.scheduler = AsyncTickScheduler()
+
+    async def AcceptN(self, svr, socks, n, timeout):
+        '''Accept until socks has n AsyncEventSocket clients.
+        '''
+        for i in range(0, n - len(socks)):
+            sock = await svr.Accept(timeout)
+            if sock != None:
+                logger.info('Accepted connection from {0}.'.format(
+                        sock.peer))
+                socks.append(AsyncEventSocket(sock))
+        return socks
+
+    async def WaitForConfirm(self, c, end_time):
+        '''Return True if c confirms the configuration before end_time.'''
+        while time.time() < end_time:
+            reply = await c.ReadEvent(max(0, end_time - time.time()))
+            if reply == None:
+                continue
+            if reply.event_type == EventType.HANDSHAKE and \
+                    reply.method == TPMessage.METHOD_CONFIRM:
+                return True
+            logger.info('Incorrect message received.')
+        return False
+
+    async def Handshake(self, conns, conf, timeout):
+        '''The coroutine version of UDPServer.Handshake(). The clients are
+        configured and confirmed concurrently.
+        Return value:
+        0 if the handshake succeeded. -1 if the handshake failed. 1 if at least
+        one client died after the start of game.
+        '''
+        logger.info('Starting handshake.')
+        start_time = time.time()
+        resend = conf.resend
+        send_time = (timeout / 4.0) / 3.0
+        sends = []
+        for player_id in range(0, len(conns)):
+            c = conns[player_id]
+            c.player_id = player_id
+            c.send_deltas = conf.do_delta
+            if conf.do_pack:
+                c.codec = StateCodec(conf)
+            # Each client gets its own copy, since the sends interleave.
+            msg = copy.copy(conf)
+            msg.player_id = player_id
+            sends.append(c.WriteEvent(msg, send_time, resend))
+        try:
+            statuses = await asyncio.gather(*sends)
+        except Exception as e:
+            logger.exception(e)
+            return -1
+        if -1 in statuses:
+            logger.error('Failed to send config.')
+            return -1
+        logger.info('Waiting for confirmation.')
+        end_time = start_time + (timeout / 2.0)
+        try:
+            confirmed = await asyncio.gather(
+                    *[self.WaitForConfirm(c, end_time) for c in conns])
+        except Exception as e:
+            logger.exception(e)
+            logger.info('Bad client. Failing.')
+            return -1
+        if not all(confirmed):
+            logger.info('Did not get confirmation from all. Failing.')
+            for (c, ok) in list(zip(conns, confirmed)):
+                if not ok:
+                    c.Close()
+                    conns.remove(c)
+            return -1
+        logger.info('Sending start message.')
+        self.game_start_time = int(time.time() * 1000 + self.buffer_time)
+        did_lose_client = False
+        for c in list(conns):
+            msg = TPMessage()
+            msg.method = TPMessage.METHOD_STARTGAME
+            msg.timestamp = int(self.game_start_time + c.delta)
+            logger.info('Telling client {0} to start at {1}'.format(
+                c.player_id, msg.timestamp))
+            try:
+                status = await c.WriteEvent(msg, send_time, resend)
+                if status != 0:
+                    raise Exception('send to {0} failed'.format(c.player_id))
+            except Exception as e:
+                did_lose_client = True
+                logger.exception(e)
+                logger.warning('A client died just before the start')
+                c.Close()
+                conns.remove(c)
+        logger.info('Handshake succeeded.')
+        if did_lose_client:
+            return 1
+        return 0
+
+    async def PlayFrames(self, e, s, start_time, max_frame, frame_rate):
+        '''The coroutine version of UDPServer.PlayFrames().'''
+        assert e != None
+        assert s != None
+        assert isinstance(start_time, float)
+        assert frame_rate > 0.0
+        end_frame = s.frame + max_frame
+        sched = self.scheduler
+        sched.SetStart(start_time, frame_rate)
+        next_send = 0.0
+        # Wake up when any client receives a datagram.
+        ready = asyncio.Event()
+        for c in e.clients:
+            c.sock.ready = ready
+        while s.frame < end_frame:
+            now = sched.Now()
+            batch = self.ReadClients(e)
+            target_frame = min(max(0, sched.GetFrame(now)), end_frame)
+            should_send = self.PlayTick(e, s, batch, target_frame)
+            if next_send < now or should_send:
+                next_send = sched.Now() + (1.0/self.send_rate)
+                self.SendState(e, s)
+            await sched.WaitUntilAsync(min(sched.GetFrameTime(s.frame + 1),
+                next_send), ready)
+
+    async def SyncClients(self, clients, conf):
+        '''Measure the latency and clock of all clients concurrently.
+        Return value:
+        0 on success and -1 if any client failed.
+        '''
+        logger.info('Syncing for {0} sec at rate {1}'.format(
+            conf.sync_timeout, conf.sync_rate))
+        statuses = await asyncio.gather(*[c.Sync(conf.sync_timeout,
+            conf.sync_rate) for c in clients])
+        for c in clients:
+            logger.info('client {0}: Latency {1} Delta {2}'.format(
+                c.GetPeerName(), c.latency, c.delta))
+        if -1 in statuses:
+            return -1
+        return 0
+
+    async def Run(self, sock, conf, tries, timeout):
+        '''The coroutine version of UDPServer.Run(), without UPnP.
+        Arguments:
+        sock     -- The open AsyncUDPSocket to accept clients on.
+        conf     -- The GameConfig of the game.
+        tries    -- The number of times to try to start a game.
+        timeout  -- The timeout of each AcceptN.
+        Return value: 0 if the game ran normally, 1 if a client died during
+        handshake, and -1 on failure.
+        '''
+        for i in range(0, tries):
+            clients = []
+            logger.info('Accepting clients.')
+            await self.AcceptN(sock, clients, conf.player_size, timeout)
+            if len(clients) < conf.player_size:
+                logger.info('Not enough clients.')
+                for c in clients:
+                    c.Close()
+                continue
+            if conf.do_sync and await self.SyncClients(clients, conf) != 0:
+                logger.info('Sync failed.')
+                for c in clients:
+                    c.Close()
+                continue
+            status = await self.Handshake(clients, conf, 2.0)
+            if status == -1:
+                for c in clients:
+                    c.Close()
+                continue
+            if status == 1:
+                logger.info('Cancelling game.')
+                evt = EndGameEvent()
+                for c in clients:
+                    c.SendEvent(evt)
+                    c.Close()
+                continue
+            logger.info('Starting game.')
+            e = AsyncUDPGameEngine()
+            e.is_server = True
+            e.is_client = False
+            e.clients = clients
+            conf.Apply(e)
+            await e.PlayAsAsync(e.state, self, self.game_start_time / 1000.0)
+            logger.info('Game ended.')
+            self.trace.Dump(logger)
+            self.trace.Clear()
+            for c in clients:
+                c.Close()
+            return status
+        return -1
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=\
+            'The triplepong game server, asyncio version.')
+    parser.add_argument('--port', type=int, default=8090,
+            help='The port number.')
+    parser.add_argument('--players', type=int, default=3,
+            help='The number of players.')
+    parser.add_argument('--fps', type=int, default=60,
+            help='The frame rate in seconds')
+    parser.add_argument('--tries', type=int, default=100,
+            help='The number of attempts to run the game.')
+    parser.add_argument('--timeout', type=int, default=60,
+            help='The time allowed for AcceptN.')
+    parser.add_argument('--nosync', default=False, action='store_true',
+            help='Measure latency and clock of clients.')
+    parser.add_argument('--nodelta', default=False, action='store_true',
+            help='Send every state in full instead of as a delta.')
+    parser.add_argument('--nopack', default=False, action='store_true',
+            help='Send states without bit-packing them.')
+    args = parser.parse_args()
+    conf = GameConfig()
+    conf.player_size = args.players
+    conf.frames_per_sec = args.fps
+    conf.do_sync = not args.nosync
+    conf.do_delta = not args.nodelta
+    conf.do_pack = not args.nopack
+    async def Main():
+        sock = AsyncUDPSocket()
+        await sock.Open(('0.0.0.0', args.port))
+        s = AsyncUDPServer()
+        status = await s.Run(sock, conf, args.tries, args.timeout)
+        sock.Close()
+        return status
+    asyncio.run(Main())
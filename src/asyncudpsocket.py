@@ -0,0 +1,208 @@
+import asyncio
+import collections
+import logging
+import os
+import socket
+import struct
+import sys
+sys.path.append(os.path.abspath('src'))
+import tplogger
+from udpdatagram import UDPDatagram
+from udpsocket import UDPSocket
+logger = tplogger.getTPLogger('asyncudpsocket.log', logging.DEBUG)
+
+class DatagramQueue(asyncio.DatagramProtocol):
+    '''Hand the datagrams received by a transport to an AsyncUDPSocket.'''
+    def __init__(self, owner):
+        self.owner = owner
+
+    def datagram_received(self, data, addr):
+        self.owner.OnDatagram(data, addr)
+
+    def error_received(self, ex):
+        logger.info('Transport error: {0}'.format(ex))
+
+class AsyncUDPSocket(UDPSocket):
+    '''The asyncio version of UDPSocket. The datagrams and the seq, ack and
+    ackbits semantics are the same, so it can talk to a UDPSocket.
+    The methods that wait are coroutines and must run in the event loop
+    that opened the socket.
+
+    Attributes:
+    transport -- The asyncio.DatagramTransport.
+    peer      -- The address of the peer, or None if the socket accepts
+                 datagrams from any address.
+    datagrams -- The received (bytes, address) pairs not read yet.
+    ready     -- An asyncio.Event set when a datagram is received. Several
+                 sockets may share one event to wait on all of them.
+    '''
+    def __init__(self):
+        UDPSocket.__init__(self)
+        self.transport = None
+        self.peer = None
+        self.datagrams = collections.deque()
+        self.ready = asyncio.Event()
+
+    @staticmethod
+    async def Pair():
+        s = AsyncUDPSocket()
+        t = AsyncUDPSocket()
+        await s.Open(('127.0.0.1', 0))
+        await t.Open(('127.0.0.1', 0))
+        s.peer = t.sock.getsockname()
+        t.peer = s.sock.getsockname()
+        s.ttl = UDPSocket.MAX_TIME_TO_LIVE
+        t.ttl = UDPSocket.MAX_TIME_TO_LIVE
+        return s, t
+
+    async def Open(self, addr=('0.0.0.0', 0), sock=None):
+        '''Open a transport bound to addr.
+        Arguments:
+        addr -- The local address.
+        sock -- A bound socket to use instead of opening one, e.g. one
+                accepted by another process. addr is ignored.
+        '''
+        loop = asyncio.get_running_loop()
+        if sock != None:
+            sock.setblocking(False)
+            (self.transport, _) = await loop.create_datagram_endpoint(
+                    lambda: DatagramQueue(self), sock=sock)
+        else:
+            (self.transport, _) = await loop.create_datagram_endpoint(
+                    lambda: DatagramQueue(self), local_addr=addr,
+                    family=socket.AF_INET)
+        self.sock = self.transport.get_extra_info('socket')
+
+    def Close(self):
+        if self.transport != None:
+            self.transport.close()
+
+    def OnDatagram(self, data, addr):
+        if self.peer != None and addr != self.peer:
+            return
+        self.datagrams.append((data, addr))
+        self.ready.set()
+
+    def Send(self, payload):
+        '''Send payload to the peer without waiting.
+        Return value:
+        True if this method succeeded.
+        '''
+        self.transport.sendto(self.Pack(payload), self.peer)
+        return self.OnSent()
+
+    def Write(self, evt):
+        '''Send the datagram carrying evt without waiting.
+        Return value:
+        True if this method succeeded.
+        '''
+        self.transport.sendto(self.PackEvent(evt), self.peer)
+        return self.OnSent()
+
+    async def RecvFrom(self, timeout):
+        '''Wait up to timeout seconds for a raw datagram.
+        Return value:
+        The (bytes, address) pair, or None on timeout.
+        '''
+        loop = asyncio.get_running_loop()
+        end_time = loop.time() + timeout
+        while len(self.datagrams) == 0:
+            remaining = end_time - loop.time()
+            if remaining <= 0:
+                return None
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+        return self.datagrams.popleft()
+
+    async def Recv(self, timeout=0):
+        '''Wait up to timeout seconds for a datagram from the peer.
+        Return value:
+        The datagram, or None on timeout or if it is ignored.
+        '''
+        item = await self.RecvFrom(timeout)
+        if item == None:
+            return None
+        return self.Receive(item[0])
+
+    def RecvAll(self):
+        '''Receive every pending datagram without waiting.
+        Return value:
+        The list of received datagrams that are not ignored, oldest first.
+        '''
+        result = []
+        while len(self.datagrams) > 0:
+            (buf, _) = self.datagrams.popleft()
+            datagram = self.Receive(buf)
+            if datagram != None:
+                result.append(datagram)
+        return result
+
+    async def Connect(self, addr, timeout):
+        '''Attempt to establish a connection. The peer at addr should call
+        Accept().
+        Return value: True if the handshake succeeded.
+        '''
+        try:
+            self.transport.sendto(UDPSocket.GUID_1, addr)
+            item = await self.RecvFrom(timeout)
+            if item == None:
+                logger.info('Connect timed out.')
+                return False
+            # Connect to the port provided by the peer.
+            port = self.OnPortReply(item[0])
+            logger.info('Connecting to ({0}, {1})'.format(addr[0], port))
+            self.peer = (addr[0], port)
+            self.datagrams.clear()
+            self.transport.sendto(self.prefix + UDPSocket.GUID_3, self.peer)
+            logger.info('Handshake succeeded.')
+            self.ttl = UDPSocket.MAX_TIME_TO_LIVE
+            return True
+        except Exception as e:
+            logger.exception(e)
+            return False
+
+    async def Accept(self, timeout):
+        '''Try to accept a connection.
+        Return value:
+        An AsyncUDPSocket with the address of a peer, or None if the
+        handshake failed.
+        '''
+        item = await self.RecvFrom(timeout)
+        if item == None:
+            logger.info('Accept timed out.')
+            return None
+        (buf, addr) = item
+        if buf != UDPSocket.GUID_1:
+            logger.info("Incorrect GUID_1 received")
+            return None
+        logger.info('Initiating handshake with {0}'.format(addr))
+        s = AsyncUDPSocket()
+        try:
+            await s.Open((self.sock.getsockname()[0], 0))
+            (_, port) = s.sock.getsockname()
+            logger.info('Opening port {0}'.format(port))
+            # Tell the client to use this port.
+            self.transport.sendto(struct.pack(UDPSocket.PORT_FORMAT, port),
+                    addr)
+            item = await s.RecvFrom(timeout)
+            if item == None:
+                s.Close()
+                logger.info('Timed out while waiting for reply.')
+                return None
+            # Depending on the NAT method, the client port might change.
+            (buf, s.peer) = item
+            if buf != UDPSocket.GUID_3:
+                s.Close()
+                logger.info('Incorrect GUID received.')
+                return None
+            logger.info('Connection accepted.')
+            s.ttl = UDPSocket.MAX_TIME_TO_LIVE
+            return s
+        except Exception as e:
+            logger.exception(e)
+            logger.info('Handshake failed.')
+            s.Close()
+            return None
@@ -0,0 +1,287 @@
+import os
+import sys
+import numpy
+sys.path.append(os.path.abspath('src'))
+from gameevent import GameEvent
+from gamestate import GameState
+from udpgameengine import UDPGameEngine
+
+class BatchEngine:
+    '''This class plays many games in lockstep.
+
+    The dynamic state of each game is kept in NumPy arrays with one element
+    per game (struct-of-arrays), so that one call to PlayFrame advances every
+    game by a frame. The result for each game is identical to calling
+    UDPGameEngine.PlayFrame on the corresponding GameState. All games share
+    the static geometry (walls, goals, paddle x positions and object sizes) of
+    the state given to Configure().
+
+    Attributes:
+    size             -- The number of games.
+    buffer_size      -- The size of the score bit history.
+    ball_pos_x
+    ball_pos_y
+    ball_vel_x
+    ball_vel_y       -- The ball of each game.
+    paddle_left_pos_y
+    paddle_left_vel_y
+    paddle_right_pos_y
+    paddle_right_vel_y -- The paddles of each game.
+    frame            -- The frame of each game.
+    is_ended         -- True for games that have ended.
+    scores           -- scores[i, p] is the score of player p in game i.
+    ball_player      -- The ID of the player with the ball role in each game.
+    score_bits       -- The bitrec.bits[4] of each game, in WORD_BITS-bit
+                        words with the lowest bits first. This is used for
+                        score double-count avoidance.
+    '''
+    WORD_BITS = 64
+
+    def __init__(self, size):
+        '''
+        Argument:
+        size -- The number of games to play.
+        '''
+        assert size > 0
+        self.size = size
+        self.ball_pos_x = numpy.zeros(size, dtype=numpy.int64)
+        self.ball_pos_y = numpy.zeros(size, dtype=numpy.int64)
+        self.ball_vel_x = numpy.zeros(size, dtype=numpy.int64)
+        self.ball_vel_y = numpy.zeros(size, dtype=numpy.int64)
+        self.paddle_left_pos_y = numpy.zeros(size, dtype=numpy.int64)
+        self.paddle_left_vel_y = numpy.zeros(size, dtype=numpy.int64)
+        self.paddle_right_pos_y = numpy.zeros(size, dtype=numpy.int64)
+        self.paddle_right_vel_y = numpy.zeros(size, dtype=numpy.int64)
+        self.frame = numpy.zeros(size, dtype=numpy.int64)
+        self.is_ended = numpy.zeros(size, dtype=bool)
+        self.scores = numpy.zeros((size, 3), dtype=numpy.int64)
+        self.ball_player = numpy.zeros(size, dtype=numpy.int64)
+        self.score_bits = numpy.zeros((size, 1), dtype=numpy.uint64)
+        self.index = numpy.arange(size)
+        e = UDPGameEngine()
+        s = GameState()
+        self.Configure(e, s)
+        for i in range(0, size):
+            self.LoadState(i, s)
+
+    def Configure(self, e, s):
+        '''Take the engine parameters and static geometry of the games.
+        The score bits of every game are cleared if the number of words of
+        e.buffer_size differs, so this is called before LoadState().
+        Arguments:
+        e -- The UDPGameEngine whose parameters to use.
+        s -- A GameState with the static geometry to use.
+        '''
+        assert 0 < e.buffer_size
+        self.buffer_size = e.buffer_size
+        words = -(-e.buffer_size // BatchEngine.WORD_BITS)
+        if self.score_bits.shape[1] != words:
+            self.score_bits = numpy.zeros((self.size, words),
+                    dtype=numpy.uint64)
+        self.should_apply_gravity = e.should_apply_gravity
+        self.should_apply_collision = e.should_apply_collision
+        self.paddle_flap_vel = e.paddle_flap_vel
+        self.ball_flap_vel = e.ball_flap_vel
+        self.ball_half_width = s.ball.half_width
+        self.ball_half_height = s.ball.half_height
+        self.paddle_left_pos_x = s.paddle_left.pos_x
+        self.paddle_right_pos_x = s.paddle_right.pos_x
+        self.paddle_left_half_width = s.paddle_left.half_width
+        self.paddle_left_half_height = s.paddle_left.half_height
+        self.paddle_right_half_width = s.paddle_right.half_width
+        self.paddle_right_half_height = s.paddle_right.half_height
+        self.ball_wall_top = s.ball_wall_top
+        self.ball_wall_bottom = s.ball_wall_bottom
+        self.paddle_wall_top = s.paddle_wall_top
+        self.paddle_wall_bottom = s.paddle_wall_bottom
+        self.goal_left = s.goal_left
+        self.goal_right = s.goal_right
+
+    def LoadState(self, i, s, bitrec=None):
+        '''Set game i to the state s.
+        Arguments:
+        i      -- The index of the game.
+        s      -- The GameState to load.
+        bitrec -- The BitRecord to take the score bits from, if any.
+        '''
+        self.ball_pos_x[i] = s.ball.pos_x
+        self.ball_pos_y[i] = s.ball.pos_y
+        self.ball_vel_x[i] = s.ball.vel_x
+        self.ball_vel_y[i] = s.ball.vel_y
+        self.paddle_left_pos_y[i] = s.paddle_left.pos_y
+        self.paddle_left_vel_y[i] = s.paddle_left.vel_y
+        self.paddle_right_pos_y[i] = s.paddle_right.pos_y
+        self.paddle_right_vel_y[i] = s.paddle_right.vel_y
+        self.frame[i] = s.frame
+        self.is_ended[i] = s.is_ended
+        self.scores[i] = s.scores
+        self.ball_player[i] = s.players[GameState.ROLE_BALL]
+        if bitrec != None:
+            bits = bitrec.bits[4]
+            mask = (1 << BatchEngine.WORD_BITS) - 1
+            for w in range(0, self.score_bits.shape[1]):
+                self.score_bits[i, w] = (bits >> (w * BatchEngine.WORD_BITS)) \
+                        & mask
+
+    def StoreState(self, i, s, bitrec=None):
+        '''Copy game i into the state s.
+        Arguments:
+        i      -- The index of the game.
+        s      -- The GameState to store into.
+        bitrec -- The BitRecord to put the score bits in, if any.
+        '''
+        s.ball.pos_x = int(self.ball_pos_x[i])
+        s.ball.pos_y = int(self.ball_pos_y[i])
+        s.ball.vel_x = int(self.ball_vel_x[i])
+        s.ball.vel_y = int(self.ball_vel_y[i])
+        s.paddle_left.pos_y = int(self.paddle_left_pos_y[i])
+        s.paddle_left.vel_y = int(self.paddle_left_vel_y[i])
+        s.paddle_right.pos_y = int(self.paddle_right_pos_y[i])
+        s.paddle_right.vel_y = int(self.paddle_right_vel_y[i])
+        s.frame = int(self.frame[i])
+        s.is_ended = bool(self.is_ended[i])
+        s.scores = [int(x) for x in self.scores[i]]
+        if bitrec != None:
+            bits = 0
+            for w in range(0, self.score_bits.shape[1]):
+                bits |= int(self.score_bits[i, w]) << \
+                        (w * BatchEngine.WORD_BITS)
+            bitrec.bits[4] = bits
+
+    def IsCollidingWith(self, x, y, half_width, half_height, other):
+        '''Vectorized GameObject.IsCollidingWith against a static object.
+        Objects sharing a border are overlapping.
+        Arguments:
+        x, y        -- The positions of the moving objects.
+        half_width
+        half_height -- The size of the moving objects.
+        other       -- The static GameObject.
+        Return value:
+        A boolean array.
+        '''
+        return ((numpy.abs(x - other.pos_x) <= half_width + other.half_width) &
+                (numpy.abs(y - other.pos_y) <=
+                    half_height + other.half_height))
+
+    def ApplyGravity(self):
+        PADDLE_TERM_VELOCITY = UDPGameEngine.PADDLE_TERM_VELOCITY
+        BALL_TERM_VELOCITY   = UDPGameEngine.BALL_TERM_VELOCITY
+        self.paddle_left_vel_y += \
+                self.paddle_left_vel_y < PADDLE_TERM_VELOCITY
+        self.paddle_right_vel_y += \
+                self.paddle_right_vel_y < PADDLE_TERM_VELOCITY
+        self.ball_vel_y += self.ball_vel_y < BALL_TERM_VELOCITY
+
+    def ApplyEvents(self, keys):
+        numpy.copyto(self.paddle_left_vel_y, self.paddle_flap_vel,
+                where=(keys & GameEvent.EVENT_FLAP_LEFT_PADDLE) != 0)
+        numpy.copyto(self.paddle_right_vel_y, self.paddle_flap_vel,
+                where=(keys & GameEvent.EVENT_FLAP_RIGHT_PADDLE) != 0)
+        numpy.copyto(self.ball_vel_y, self.ball_flap_vel,
+                where=(keys & GameEvent.EVENT_FLAP_BALL) != 0)
+
+    def ApplyLogic(self):
+        self.ball_pos_x += self.ball_vel_x
+        self.ball_pos_y += self.ball_vel_y
+        self.paddle_left_pos_y += self.paddle_left_vel_y
+        self.paddle_right_pos_y += self.paddle_right_vel_y
+
+    def ApplyScoring(self):
+        '''Vectorized UDPGameEngine.ApplyScoring for games that have not
+        ended.'''
+        n = self.frame % self.buffer_size
+        word = n // BatchEngine.WORD_BITS
+        bit = numpy.left_shift(numpy.uint64(1),
+                (n % BatchEngine.WORD_BITS).astype(numpy.uint64))
+        words = self.score_bits[self.index, word]
+        counted = (words & bit) != 0
+        scored = (self.IsCollidingWith(self.ball_pos_x, self.ball_pos_y,
+                    self.ball_half_width, self.ball_half_height,
+                    self.goal_left).astype(numpy.int64) +
+                self.IsCollidingWith(self.ball_pos_x, self.ball_pos_y,
+                    self.ball_half_width, self.ball_half_height,
+                    self.goal_right))
+        scored[counted | self.is_ended] = 0
+        self.scores[self.index, self.ball_player] += scored
+        self.score_bits[self.index, word] = words | \
+                numpy.where(scored > 0, bit, numpy.uint64(0))
+
+    def ApplyCollision(self):
+        '''Vectorized UDPGameEngine.ApplyCollision. The tests are applied in
+        the same order so that each sees the effect of the previous.'''
+        bx = self.ball_pos_x
+        by = self.ball_pos_y
+        bvx = self.ball_vel_x
+        bvy = self.ball_vel_y
+        bhw = self.ball_half_width
+        bhh = self.ball_half_height
+        ly = self.paddle_left_pos_y
+        lvy = self.paddle_left_vel_y
+        ry = self.paddle_right_pos_y
+        rvy = self.paddle_right_vel_y
+        lhh = self.paddle_left_half_height
+        rhh = self.paddle_right_half_height
+        hit = ((numpy.abs(bx - self.paddle_left_pos_x) <=
+                    bhw + self.paddle_left_half_width) &
+                (numpy.abs(by - ly) <= bhh + lhh))
+        numpy.copyto(bx, self.paddle_left_pos_x +
+                self.paddle_left_half_width + bhw, where=hit)
+        numpy.negative(bvx, out=bvx, where=hit)
+        hit = ((numpy.abs(bx - self.paddle_right_pos_x) <=
+                    bhw + self.paddle_right_half_width) &
+                (numpy.abs(by - ry) <= bhh + rhh))
+        numpy.copyto(bx, self.paddle_right_pos_x -
+                self.paddle_right_half_width - bhw, where=hit)
+        numpy.negative(bvx, out=bvx, where=hit)
+        w = self.ball_wall_top
+        hit = self.IsCollidingWith(bx, by, bhw, bhh, w)
+        numpy.copyto(by, w.pos_y + w.half_height + bhh, where=hit)
+        numpy.negative(bvy, out=bvy, where=hit)
+        w = self.ball_wall_bottom
+        hit = self.IsCollidingWith(bx, by, bhw, bhh, w)
+        numpy.copyto(by, w.pos_y - w.half_height - bhh, where=hit)
+        numpy.negative(bvy, out=bvy, where=hit)
+        w = self.paddle_wall_top
+        hit = self.IsCollidingWith(self.paddle_left_pos_x, ly,
+                self.paddle_left_half_width, lhh, w)
+        numpy.copyto(ly, w.pos_y + w.half_height + lhh, where=hit)
+        numpy.negative(lvy, out=lvy, where=hit)
+        hit = self.IsCollidingWith(self.paddle_right_pos_x, ry,
+                self.paddle_right_half_width, rhh, w)
+        numpy.copyto(ry, w.pos_y + w.half_height + rhh, where=hit)
+        numpy.negative(rvy, out=rvy, where=hit)
+        w = self.paddle_wall_bottom
+        hit = self.IsCollidingWith(self.paddle_left_pos_x, ly,
+                self.paddle_left_half_width, lhh, w)
+        numpy.copyto(ly, w.pos_y - w.half_height - lhh, where=hit)
+        numpy.negative(lvy, out=lvy, where=hit)
+        hit = self.IsCollidingWith(self.paddle_right_pos_x, ry,
+                self.paddle_right_half_width, rhh, w)
+        numpy.copyto(ry, w.pos_y - w.half_height - rhh, where=hit)
+        numpy.negative(rvy, out=rvy, where=hit)
+        center_x = (self.goal_right.pos_x + self.goal_left.pos_x) // 2
+        center_y = (self.ball_wall_top.pos_y +
+                self.ball_wall_bottom.pos_y) // 2
+        for goal in (self.goal_left, self.goal_right):
+            hit = self.IsCollidingWith(bx, by, bhw, bhh, goal)
+            numpy.copyto(bx, center_x, where=hit)
+            numpy.copyto(by, center_y, where=hit)
+            numpy.negative(bvx, out=bvx, where=hit)
+            numpy.copyto(bvy, 0, where=hit)
+
+    def PlayFrame(self, keys):
+        '''Move every game forward by one frame.
+        Argument:
+        keys -- An integer array of key flags, one for each game. See
+                UDPGameEngine.ApplyEvents().
+        '''
+        assert len(keys) == self.size
+        keys = numpy.asarray(keys, dtype=numpy.int64)
+        if self.should_apply_gravity:
+            self.ApplyGravity()
+        self.ApplyEvents(keys)
+        self.ApplyLogic()
+        self.ApplyScoring()
+        if self.should_apply_collision:
+            self.ApplyCollision()
+        self.frame += 1
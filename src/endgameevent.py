@@ -10,6 +10,8 @@ class EndGameEvent:
     '''
     FORMAT = '!iiii'
     SUBFORMAT = '!iii'
+    STRUCT = struct.Struct(FORMAT)
+    SUBSTRUCT = struct.Struct(SUBFORMAT)
     def __init__(self):
         self.event_type = EventType.END_GAME
         self.score_0 = 0
@@ -25,17 +27,27 @@ class EndGameEvent:
         return not self == other
 
     def GetSize(self):
-        return struct.calcsize(EndGameEvent.SUBFORMAT)
+        return EndGameEvent.SUBSTRUCT.size
 
     def Serialize(self):
-        return struct.pack(EndGameEvent.FORMAT, self.event_type,
+        return EndGameEvent.STRUCT.pack(self.event_type,
                 self.score_0, self.score_1, self.score_2)
 
-    def Deserialize(self, b):
+    def SerializeInto(self, buf, offset):
+        '''Write the serialized event into buf at offset.
+        Return value:
+        The offset of the end of the event.
+        '''
+        EndGameEvent.STRUCT.pack_into(buf, offset, self.event_type,
+                self.score_0, self.score_1, self.score_2)
+        return offset + EndGameEvent.STRUCT.size
+
+    def Deserialize(self, b, offset=0):
         '''
         Arguments:
-        b -- The byte string.
+        b      -- The byte string.
+        offset -- The offset of the event in b.
         '''
         (self.score_0, self.score_1, self.score_2,) = \
-                struct.unpack(EndGameEvent.SUBFORMAT, b)
+                EndGameEvent.SUBSTRUCT.unpack_from(b, offset)
 
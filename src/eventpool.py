@@ -0,0 +1,38 @@
+class EventPool:
+    '''A pool of reusable instances of one event class.
+    Acquire() hands out the instances in order and makes new ones only when
+    all are in use, so a socket reading one event per datagram allocates
+    nothing once its pool is warm. Release() makes them all available again.
+
+    Attributes:
+    cls    -- The event class.
+    events -- The instances, those in use first.
+    used   -- The number of instances in use.
+    '''
+    def __init__(self, cls):
+        self.cls = cls
+        self.events = []
+        self.used = 0
+
+    def Acquire(self):
+        '''Return an instance that is not in use. Its attributes are those
+        of the last event it held.'''
+        if self.used == len(self.events):
+            self.events.append(self.cls())
+        evt = self.events[self.used]
+        self.used += 1
+        return evt
+
+    def Release(self, keep=None):
+        '''Make every instance available again.
+        Argument:
+        keep -- An instance to keep in use, if it is in the pool.
+        '''
+        self.used = 0
+        for i in range(0, len(self.events)):
+            if self.events[i] is keep:
+                # Move it to the front, so it is not handed out again.
+                self.events[i] = self.events[0]
+                self.events[0] = keep
+                self.used = 1
+                return
@@ -0,0 +1,66 @@
+import logging
+import os
+import selectors
+import sys
+sys.path.append(os.path.abspath('src'))
+import tplogger
+
+logger = tplogger.getTPLogger('eventselector.log', logging.DEBUG)
+
+class EventSelector:
+    '''Wait on many UDPEventSockets at once and read all their pending
+    events in one batch.
+    Attributes:
+    selector -- The selectors.BaseSelector of the registered sockets.
+    failed   -- The sockets that raised on read since the last Read().
+                They are unregistered but not closed.
+    '''
+    def __init__(self, socks=None):
+        '''
+        Argument:
+        socks -- The UDPEventSockets to register.
+        '''
+        self.selector = selectors.DefaultSelector()
+        self.failed = []
+        if socks == None:
+            socks = []
+        for s in socks:
+            self.Register(s)
+
+    def Register(self, sock):
+        self.selector.register(sock, selectors.EVENT_READ)
+
+    def Unregister(self, sock):
+        self.selector.unregister(sock)
+
+    def GetSockets(self):
+        '''Return the registered sockets.'''
+        return [key.fileobj for key in self.selector.get_map().values()]
+
+    def Read(self, timeout=0):
+        '''Wait up to timeout seconds for any socket to be readable, and read
+        every pending event of each readable socket.
+        Argument:
+        timeout -- The time to wait in seconds. None waits indefinitely.
+        Return value:
+        The list of (sock, evt) pairs. The events of a socket are in the
+        order received. An unread event is only returned with the next 
+        datagram of its socket.
+        '''
+        self.failed = []
+        batch = []
+        for (key, _) in self.selector.select(timeout):
+            sock = key.fileobj
+            try:
+                events = sock.ReadEvents()
+            except Exception as ex:
+                logger.exception(ex)
+                self.Unregister(sock)
+                self.failed.append(sock)
+                continue
+            for evt in events:
+                batch.append((sock, evt))
+        return batch
+
+    def Close(self):
+        self.selector.close()
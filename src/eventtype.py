@@ -6,13 +6,17 @@ class EventType:
     END_GAME = 3
     CONFIGURE = 4
     HANDSHAKE = 5
+    STATE_DELTA = 6
+    STATE_PACKED = 7
     FORMAT = '!i'
+    STRUCT = struct.Struct(FORMAT)
+    SIZE = STRUCT.size
     def __init__(self):
         self.event_type = EventType.NONE
 
     def GetSize(self):
-        return struct.calcsize(EventType.FORMAT)
+        return EventType.SIZE
 
-    def Deserialize(self, b):
-        (self.event_type,) = struct.unpack(EventType.FORMAT, b)
+    def Deserialize(self, b, offset=0):
+        (self.event_type,) = EventType.STRUCT.unpack_from(b, offset)
 
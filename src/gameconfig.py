@@ -8,11 +8,25 @@ class GameConfig:
     '''This class is used to configure the game. 
     This can be sent as an event using UDPEventSocket.
     Attributes:
-    post_game_time -- The number of seconds to run after end of game.
+    post_game_time  -- The number of seconds to run after end of game.
+    buffer_size     -- The number of frames of input history and game 
+                       records. This is at most MAX_BUFFER_SIZE.
+    step_cache_size -- The capacity of the engine's step cache. The cache is
+                       disabled if this is 0.
+    fast_mode       -- Whether the engine runs the unchecked variants of the 
+                       methods called per frame.
+    do_delta        -- Whether the server sends states as deltas against
+                       the latest state each client acknowledged.
+    do_pack         -- Whether the server sends states bit-packed. See
+                       StateCodec.
     '''
 
-    FORMAT=   '!ihdhhhhhhhhhhhhhhhhh'
-    SUBFORMAT='!hdhhhhhhhhhhhhhhhhh'
+    FORMAT=   '!ihdhhhhhhhhhhhhhhhhhh'
+    SUBFORMAT='!hdhhhhhhhhhhhhhhhhhh'
+    STRUCT = struct.Struct(FORMAT)
+    SUBSTRUCT = struct.Struct(SUBFORMAT)
+    # The largest number of frames of input history.
+    MAX_BUFFER_SIZE = 1024
 
     def __init__(self):
         self.event_type = EventType.CONFIGURE
@@ -35,13 +49,17 @@ class GameConfig:
         self.do_interpolate = False
         self.player_id = 0
         self.post_game_time = 30
+        self.buffer_size = 64
         # These are not serialized.
         self.do_sync = False
         self.sync_timeout = 2.0
         self.sync_rate = 15
-        self.buffer_size = 64
         self.start_time = 0.0
         self.resend = 5
+        self.step_cache_size = 0
+        self.fast_mode = False
+        self.do_delta = True
+        self.do_pack = True
 
     def __repr__(self):
         return str(self.__dict__)
@@ -55,27 +73,37 @@ class GameConfig:
         return not self == other
 
     def GetSize(self):
-        return struct.calcsize(self.SUBFORMAT)
+        return GameConfig.SUBSTRUCT.size
 
     def Serialize(self):
-        return struct.pack(self.FORMAT, self.event_type,
+        buf = bytearray(GameConfig.STRUCT.size)
+        self.SerializeInto(buf, 0)
+        return bytes(buf)
+
+    def SerializeInto(self, buf, offset):
+        '''Write the serialized configuration into buf at offset.
+        Return value:
+        The offset of the end of the configuration.
+        '''
+        GameConfig.STRUCT.pack_into(buf, offset, self.event_type,
                 self.player_size, self.game_length, self.frames_per_sec,
                 self.screen_width, self.screen_height, self.buffer_region,
                 self.ball_wall_offset_x, self.ball_wall_offset_y,
                 self.paddle_offset, self.paddle_width, self.paddle_height,
                 self.ball_vel, self.ball_size, self.rounds, 
                 self.buffer_delay, self.cool_down,  self.do_interpolate,
-                self.player_id, self.post_game_time)
+                self.player_id, self.post_game_time, self.buffer_size)
+        return offset + GameConfig.STRUCT.size
 
-    def Deserialize(self, b):
+    def Deserialize(self, b, offset=0):
         (self.player_size, self.game_length, self.frames_per_sec,
                 self.screen_width, self.screen_height, self.buffer_region,
                 self.ball_wall_offset_x, self.ball_wall_offset_y,
                 self.paddle_offset, self.paddle_width, self.paddle_height,
                 self.ball_vel, self.ball_size, self.rounds, 
                 self.buffer_delay, self.cool_down, self.do_interpolate,
-                self.player_id, self.post_game_time) = \
-                        struct.unpack(self.SUBFORMAT, b)
+                self.player_id, self.post_game_time, self.buffer_size) = \
+                        GameConfig.SUBSTRUCT.unpack_from(b, offset)
 
     def ApplyState(self, s):
         '''Apply the configuration to a game state.
@@ -172,5 +200,13 @@ class GameConfig:
         e.key_bindings[e.player_id] = 32
         e.start_time = self.start_time
         e.post_game_time = self.post_game_time
+        assert 0 < self.buffer_size
+        assert self.buffer_size <= GameConfig.MAX_BUFFER_SIZE
+        e.buffer_size = self.buffer_size
         e.rec.SetSize(self.buffer_size)
         self.ApplyState(e.state)
+        e.play_frame = e.SpecializePlayFrame(e.state)
+        if self.step_cache_size > 0:
+            e.EnableStepCache(self.step_cache_size)
+        if self.fast_mode:
+            e.EnableFastMode()
@@ -14,14 +14,26 @@ class GameEvent:
     keys       -- The list of game event codes. When serializing, they are OR'd 
                   together.
     frame      -- The frame of the event.
-    keybits    -- History of keys up to 64 frames.
+    keybits    -- History of keys up to buffer_size frames.
     '''
     EVENT_NO_OP = 0
     EVENT_FLAP_LEFT_PADDLE = 1
     EVENT_FLAP_RIGHT_PADDLE = 2
     EVENT_FLAP_BALL = 4
-    SUBFORMAT = '!iQQ'
-    FORMAT = '!iiQQ'
+    # The serialized event is followed by the history width w in bytes and 
+    # keybits in w bytes.
+    SUBFORMAT = '!iQH'
+    FORMAT = '!iiQH'
+    STRUCT = struct.Struct(FORMAT)
+    SUBSTRUCT = struct.Struct(SUBFORMAT)
+    # The widths of up to 8 bytes are rounded up to one with a struct code,
+    # so the event and its keybits are packed by one Struct.
+    ROUNDED_WIDTHS = [1, 1, 2, 4, 4, 8, 8, 8, 8]
+    EVENT_STRUCTS = {1: struct.Struct(FORMAT + 'B'),
+            2: struct.Struct(FORMAT + 'H'), 4: struct.Struct(FORMAT + 'I'),
+            8: struct.Struct(FORMAT + 'Q')}
+    HISTORY_STRUCTS = {1: struct.Struct('!B'), 2: struct.Struct('!H'),
+            4: struct.Struct('!I'), 8: struct.Struct('!Q')}
     def __init__(self):
         self.event_type = EventType.KEYBOARD
         self.keys = 0
@@ -35,19 +47,56 @@ class GameEvent:
         return self.__dict__ == other.__dict__
 
     def GetSize(self):
-        return struct.calcsize(GameEvent.SUBFORMAT)
+        return GameEvent.SUBSTRUCT.size + self.GetHistoryWidth()
+
+    def GetHistoryWidth(self):
+        '''Return the number of bytes of the serialized keybits. See
+        ROUNDED_WIDTHS.'''
+        width = (self.keybits.bit_length() + 7) // 8
+        if width <= 8:
+            return GameEvent.ROUNDED_WIDTHS[width]
+        return width
 
     def Serialize(self):
         '''
         Return value:
         The byte string representation of the event.'''
-        return struct.pack(self.FORMAT, self.event_type, self.keys,
-                self.frame, self.keybits)
+        buf = bytearray(GameEvent.STRUCT.size + self.GetHistoryWidth())
+        self.SerializeInto(buf, 0)
+        return bytes(buf)
 
-    def Deserialize(self, b):
+    def SerializeInto(self, buf, offset):
+        '''Write the serialized event into buf at offset.
+        Return value:
+        The offset of the end of the event.
+        '''
+        width = self.GetHistoryWidth()
+        st = GameEvent.EVENT_STRUCTS.get(width)
+        if st != None:
+            st.pack_into(buf, offset, self.event_type, self.keys, self.frame,
+                    width, self.keybits)
+            return offset + st.size
+        GameEvent.STRUCT.pack_into(buf, offset, self.event_type, self.keys,
+                self.frame, width)
+        offset += GameEvent.STRUCT.size
+        buf[offset:offset + width] = self.keybits.to_bytes(width, 'big')
+        return offset + width
+
+    def Deserialize(self, b, offset=0):
         '''Deserialize the byte string representation of the game event.
         
-        The event_type should not be included in b.'''
-        (self.keys, self.frame, self.keybits) = \
-                struct.unpack(self.SUBFORMAT, b)
+        The event_type should not be included in b. Bytes after the end of 
+        the event are ignored.
+        Arguments:
+        b      -- A bytes-like object, e.g. a memoryview of a datagram.
+        offset -- The offset of the event in b.
+        '''
+        (self.keys, self.frame, width) = \
+                GameEvent.SUBSTRUCT.unpack_from(b, offset)
+        offset += GameEvent.SUBSTRUCT.size
+        st = GameEvent.HISTORY_STRUCTS.get(width)
+        if st != None:
+            (self.keybits,) = st.unpack_from(b, offset)
+            return
+        self.keybits = int.from_bytes(b[offset:offset + width], 'big')
     pass
@@ -1,6 +1,10 @@
 
 class GameObject:
-    '''A class for representing the objects in the game.'''
+    '''A class for representing the objects in the game.
+    The attributes are kept in __slots__ to make instances small and
+    attribute access fast.'''
+    __slots__ = ('pos_x', 'pos_y', 'vel_x', 'vel_y', 'half_width',
+            'half_height')
     def __init__(self):
         self.pos_x = 0
         self.pos_y = 0
@@ -10,13 +14,18 @@ class GameObject:
         self.half_height = 0
         pass
     def __repr__(self):
-        return str(self.__dict__)
+        return str(dict(zip(GameObject.__slots__, self._Fields())))
     def __eq__(self, other):
         if other == None:
             return False
-        return self.__dict__ == other.__dict__
+        return self._Fields() == other._Fields()
     def __ne__(self, other):
         return not self == other
+    def __hash__(self):
+        return hash(self._Fields())
+    def _Fields(self):
+        return (self.pos_x, self.pos_y, self.vel_x, self.vel_y,
+                self.half_width, self.half_height)
     def IsCollidingWith(self, other):
         '''Checks for a collision.
 
@@ -9,16 +9,21 @@ class GameRecord:
     The states are stored in a cyclical buffer. The index of the state in
     frame f is f mod size provided f is within size frames of the most 
     recent frame in the record.
+
+    Only the partial state copied by GameState.Copy() is recorded. Each state 
+    is packed into a row of GameState.ROW, and the rows are kept in one 
+    contiguous buffer, so saving and restoring a frame does not create 
+    GameState objects.
     
     Attributes:
     size      -- The maximum number of records to keep.
     available -- The number of frames recorded and available for rewind.
-    states    -- The list of recorded game states.'''
+    rows      -- The packed rows of the recorded game states.'''
 
     def __init__(self):
         self.size = 0
         self.available = 0
-        self.states = []
+        self.rows = bytearray()
         pass
 
     def SetSize(self, size):
@@ -28,6 +33,72 @@ class GameRecord:
         Argument:
         size -- The new size of the record.'''
         self.size = size
+        self.rows = bytearray(size * GameState.ROW.size)
+        s = GameState()
         for i in range(0, size):
-            s = GameState()
-            self.states.append(s)
+            s.PackInto(self.rows, i * GameState.ROW.size)
+
+    def Save(self, n, s):
+        '''Record s as the nth state.
+        Arguments:
+        n -- The index of the state.
+        s -- The GameState to record.
+        '''
+        s.PackInto(self.rows, n * GameState.ROW.size)
+
+    def Restore(self, n, s):
+        '''Copy the nth state into s.
+        Arguments:
+        n -- The index of the state.
+        s -- The GameState to set.
+        '''
+        s.UnpackFrom(self.rows, n * GameState.ROW.size)
+
+    def GetFrame(self, n):
+        '''Return value:
+        The frame of the nth state.
+        '''
+        return GameState.ROW.unpack_from(self.rows,
+                n * GameState.ROW.size)[-1]
+
+    def SaveExceptPlayer(self, n, s, roles, player_id):
+        '''Record s as the nth state, except for the object controlled by 
+        player_id, which keeps its recorded value.
+        '''
+        offset = n * GameState.ROW.size
+        (start, end) = GameState.ROW_FIELDS[roles[player_id]]
+        kept = GameState.ROW.unpack_from(self.rows, offset)[start:end]
+        s.PackInto(self.rows, offset)
+        if start < end:
+            row = list(GameState.ROW.unpack_from(self.rows, offset))
+            row[start:end] = kept
+            GameState.ROW.pack_into(self.rows, offset, *row)
+
+    def RestoreExceptPlayer(self, n, s, roles, player_id):
+        '''Copy the nth state into s, except for the object controlled by 
+        player_id.
+        '''
+        o = s.PlayerToObject(roles, player_id)
+        pos_x = o.pos_x
+        pos_y = o.pos_y
+        vel_x = o.vel_x
+        vel_y = o.vel_y
+        self.Restore(n, s)
+        o.pos_x = pos_x
+        o.pos_y = pos_y
+        o.vel_x = vel_x
+        o.vel_y = vel_y
+
+    def RestoreExceptPlayerFast(self, n, s, roles, player_id):
+        '''Same as RestoreExceptPlayer, using unchecked GameState methods.
+        '''
+        o = s.PlayerToObjectFast(roles, player_id)
+        pos_x = o.pos_x
+        pos_y = o.pos_y
+        vel_x = o.vel_x
+        vel_y = o.vel_y
+        self.Restore(n, s)
+        o.pos_x = pos_x
+        o.pos_y = pos_y
+        o.vel_x = vel_x
+        o.vel_y = vel_y
@@ -19,14 +19,59 @@ class GameState:
                        rotations.
     round_length    -- The duration of a round in frames.
     rotation_length -- The duration of a rotation in frames.
-    bits            -- The key input of 64 previous frames for each player.
+    bits            -- The key input of buffer_size previous frames for each 
+                       player.
+
+    The attributes are kept in __slots__. Equality and hashing compare the
+    attributes in the order of __slots__.
     '''
+    __slots__ = ('event_type', 'screen', 'goal_left', 'goal_right',
+            'ball_wall_top', 'ball_wall_bottom', 'paddle_wall_top',
+            'paddle_wall_bottom', 'ball', 'paddle_left', 'paddle_right',
+            'player_size', 'game_length', 'frames_per_sec', 'sec_per_frame',
+            'rounds', 'rotation_length', 'round_length', 'scores', 'roles',
+            'players', 'frame', 'key_flags', 'should_render_score',
+            'should_render_crown', 'is_ended', 'player_id', 'bits')
     ROLE_NONE = 0
     ROLE_LEFT_PADDLE = 1
     ROLE_RIGHT_PADDLE = 2
     ROLE_BALL = 3
-    SUBFORMAT = '!hhhhhhhhhQQQQ'
-    FORMAT    = '!ihhhhhhhhhQQQQ'
+    # The serialized state is followed by a history width w in bytes and the
+    # histories of the three players, w bytes each.
+    SUBFORMAT = '!hhhhhhhhhQH'
+    FORMAT    = '!ihhhhhhhhhQH'
+    STRUCT = struct.Struct(FORMAT)
+    SUBSTRUCT = struct.Struct(SUBFORMAT)
+    # The widths of up to 8 bytes are rounded up to one with a struct code,
+    # so the state and its histories are packed by one Struct.
+    ROUNDED_WIDTHS = [1, 1, 2, 4, 4, 8, 8, 8, 8]
+    STATE_STRUCTS = {1: struct.Struct(FORMAT + 'BBB'),
+            2: struct.Struct(FORMAT + 'HHH'), 4: struct.Struct(FORMAT + 'III'),
+            8: struct.Struct(FORMAT + 'QQQ')}
+    HISTORY_STRUCTS = {1: struct.Struct('!BBB'), 2: struct.Struct('!HHH'),
+            4: struct.Struct('!III'), 8: struct.Struct('!QQQ')}
+    # A delta against a baseline state is the sequence number of the
+    # datagram that carried the baseline, a mask and the change of the
+    # frame, followed by the changed fields. Bits 0 to 8 of the mask stand
+    # for the fields of GetDeltaFields(), bits 9 to 11 for the histories,
+    # and bits 12 and 13 for the history width, as an index of
+    # DELTA_WIDTHS.
+    DELTA_FORMAT = '!iHHh'
+    DELTA_SUBFORMAT = '!HHh'
+    DELTA_STRUCT = struct.Struct(DELTA_FORMAT)
+    DELTA_SUBSTRUCT = struct.Struct(DELTA_SUBFORMAT)
+    DELTA_FIELD_COUNT = 9
+    DELTA_WIDTH_SHIFT = 12
+    DELTA_WIDTHS = [1, 2, 4, 8]
+    HISTORY_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+    MAX_FRAME_CHANGE = (1 << 15) - 1
+    # The Struct of the changed fields of a delta, by the number of changed
+    # fields and histories and the history width. See GetDeltaStruct().
+    DELTA_BODY_STRUCTS = {}
+    # The packed representation of the partial state used by GameRecord.
+    ROW = struct.Struct('=qqqqqqqqqq')
+    # ROW_FIELDS[r] is the slice of ROW holding the object with role r.
+    ROW_FIELDS = [(0, 0), (4, 6), (6, 8), (0, 4)]
     def __init__(self):
         '''Create the initial game state.
         '''
@@ -117,18 +162,19 @@ class GameState:
         self.frame = 0
         self.key_flags = 0
         self.should_render_score = False
+        self.should_render_crown = False
         self.is_ended = False
         self.player_id = 0
-        # 64 frames of input history for each player (and flags)
+        # buffer_size frames of input history for each player (and flags)
         self.bits = [0, 0, 0, 0, 0]
 
     def __str__(self):
-        return str(self.__dict__)
+        return str(dict(zip(GameState.__slots__, self._Fields())))
 
     def __eq__(self, other):
         if other == None:
             return False
-        return self.__dict__ == other.__dict__
+        return self._Fields() == other._Fields()
 
     def __ne__(self, other):
         return not self == other
@@ -136,20 +182,35 @@ class GameState:
     def __hash__(self):
         '''Override default hash behaviour (which is to return the object ID).
         We do this to define equality.'''
-        return hash(tuple(sorted(self.__dict__.items())))
+        return hash(tuple(tuple(x) if isinstance(x, list) else x
+            for x in self._Fields()))
+
+    def _Fields(self):
+        '''Return the attributes in the order of __slots__.'''
+        return tuple(getattr(self, key) for key in GameState.__slots__)
 
     def Diff(self, other):
         '''Print the difference between GameObjects.
         Used for debugging.
         '''
-        a = self.__dict__
-        b = other.__dict__
-        for key in a:
-            if a[key] != b[key]:
-                logger.debug('{0}: {1} != {2}'.format(key, a[key], b[key]))
+        for key in GameState.__slots__:
+            a = getattr(self, key)
+            b = getattr(other, key)
+            if a != b:
+                logger.debug('{0}: {1} != {2}'.format(key, a, b))
 
     def GetSize(self):
-        return struct.calcsize(GameState.SUBFORMAT)
+        return GameState.SUBSTRUCT.size + 3 * self.GetHistoryWidth()
+
+    def GetHistoryWidth(self):
+        '''Return the number of bytes of each serialized history. See
+        ROUNDED_WIDTHS.
+        '''
+        width = (max(self.bits[0], self.bits[1], self.bits[2]).bit_length() \
+                + 7) // 8
+        if width <= 8:
+            return GameState.ROUNDED_WIDTHS[width]
+        return width
 
     def Serialize(self):
         '''Serialize a partial representation of the state.
@@ -158,26 +219,179 @@ class GameState:
         consists of the the frame number and position and velocities of the 
         ball and the paddles. (Only the y component of the paddles is sent). 
 
+        The histories of the players are sent with the fewest bytes that 
+        hold all three, so their size follows the configured buffer size.
+        See GetHistoryWidth().
+
         Return value:
         A byte string representation of the partial state.'''
-        return struct.pack(GameState.FORMAT,
+        buf = bytearray(GameState.STRUCT.size + 3 * self.GetHistoryWidth())
+        self.SerializeInto(buf, 0)
+        return bytes(buf)
+
+    def SerializeInto(self, buf, offset):
+        '''Write the partial representation of Serialize() into buf at
+        offset.
+        Return value:
+        The offset of the end of the state.
+        '''
+        width = self.GetHistoryWidth()
+        bits = self.bits
+        st = GameState.STATE_STRUCTS.get(width)
+        if st != None:
+            st.pack_into(buf, offset,
+                    EventType.STATE_UPDATE,
+                    self.ball.pos_x, self.ball.pos_y,
+                    self.ball.vel_x, self.ball.vel_y,
+                    self.paddle_left.pos_y, self.paddle_left.vel_y,
+                    self.paddle_right.pos_y, self.paddle_right.vel_y,
+                    self.key_flags, self.frame, width,
+                    bits[0], bits[1], bits[2])
+            return offset + st.size
+        GameState.STRUCT.pack_into(buf, offset,
                 EventType.STATE_UPDATE,
                 self.ball.pos_x, self.ball.pos_y,
                 self.ball.vel_x, self.ball.vel_y,
                 self.paddle_left.pos_y, self.paddle_left.vel_y,
                 self.paddle_right.pos_y, self.paddle_right.vel_y,
-                self.key_flags, self.frame, 
-                self.bits[0], self.bits[1], self.bits[2])
+                self.key_flags, self.frame, width)
+        offset += GameState.STRUCT.size
+        end = offset + 3 * width
+        buf[offset:end] = bits[0].to_bytes(width, 'big') + \
+                bits[1].to_bytes(width, 'big') + bits[2].to_bytes(width, 'big')
+        return end
+
+    def Deserialize(self, b, offset=0):
+        '''Deserialize a partial representation of the state.
+        Bytes after the end of the state in b are ignored.
+        Arguments:
+        b      -- A bytes-like object, e.g. a memoryview of a datagram.
+        offset -- The offset of the state in b.
+        '''
+        (self.ball.pos_x, self.ball.pos_y,
+                self.ball.vel_x, self.ball.vel_y,
+                self.paddle_left.pos_y, self.paddle_left.vel_y,
+                self.paddle_right.pos_y, self.paddle_right.vel_y,
+                self.key_flags, self.frame, width) = \
+                        GameState.SUBSTRUCT.unpack_from(b, offset)
+        offset += GameState.SUBSTRUCT.size
+        st = GameState.HISTORY_STRUCTS.get(width)
+        if st != None:
+            (self.bits[0], self.bits[1], self.bits[2]) = \
+                    st.unpack_from(b, offset)
+            return
+        for i in range(0, 3):
+            self.bits[i] = int.from_bytes(b[offset:offset + width], 'big')
+            offset += width
+
+    @staticmethod
+    def GetDeltaStruct(fields, histories, width):
+        '''Return the Struct of the changed fields of a delta.
+        Arguments:
+        fields    -- The number of changed fields.
+        histories -- The number of changed histories.
+        width     -- The history width, one of DELTA_WIDTHS.
+        '''
+        key = (fields, histories, width)
+        st = GameState.DELTA_BODY_STRUCTS.get(key)
+        if st == None:
+            st = struct.Struct('!' + 'h' * fields +
+                    GameState.HISTORY_CODES[width] * histories)
+            GameState.DELTA_BODY_STRUCTS[key] = st
+        return st
+
+    @staticmethod
+    def GetDeltaBase(b, offset):
+        '''Return the sequence number of the baseline of the delta in b at
+        offset, which is just after the event type.'''
+        return GameState.DELTA_SUBSTRUCT.unpack_from(b, offset)[0]
+
+    def GetDeltaFields(self):
+        '''Return the fields a delta compares, in the order of its mask.'''
+        return (self.ball.pos_x, self.ball.pos_y,
+                self.ball.vel_x, self.ball.vel_y,
+                self.paddle_left.pos_y, self.paddle_left.vel_y,
+                self.paddle_right.pos_y, self.paddle_right.vel_y,
+                self.key_flags)
 
-    def Deserialize(self, b):
-        '''Deserialize a partial representation of the state.'''
+    def SetDeltaFields(self, fields):
+        '''Set the fields returned by GetDeltaFields().'''
         (self.ball.pos_x, self.ball.pos_y,
                 self.ball.vel_x, self.ball.vel_y,
                 self.paddle_left.pos_y, self.paddle_left.vel_y,
                 self.paddle_right.pos_y, self.paddle_right.vel_y,
-                self.key_flags, self.frame,
-                self.bits[0], self.bits[1], self.bits[2],) = \
-                        struct.unpack(GameState.SUBFORMAT, b)
+                self.key_flags) = fields
+
+    def SerializeDeltaInto(self, buf, offset, base, base_seq):
+        '''Write the partial state as a delta against base into buf at
+        offset. Only the fields and histories that differ from base are
+        written. The full state is written instead if a history is wider
+        than 8 bytes or the frames are too far apart.
+        Arguments:
+        base     -- The baseline state, which the peer has.
+        base_seq -- The sequence number of the datagram that carried base.
+        Return value:
+        The offset of the end of the delta.
+        '''
+        width = self.GetHistoryWidth()
+        frame_change = self.frame - base.frame
+        if width > 8 or abs(frame_change) > GameState.MAX_FRAME_CHANGE:
+            return self.SerializeInto(buf, offset)
+        fields = self.GetDeltaFields()
+        base_fields = base.GetDeltaFields()
+        mask = 0
+        values = []
+        for i in range(0, GameState.DELTA_FIELD_COUNT):
+            if fields[i] != base_fields[i]:
+                mask |= 1 << i
+                values.append(fields[i])
+        n = len(values)
+        for i in range(0, 3):
+            if self.bits[i] != base.bits[i]:
+                mask |= 1 << (GameState.DELTA_FIELD_COUNT + i)
+                values.append(self.bits[i])
+        mask |= GameState.DELTA_WIDTHS.index(width) << \
+                GameState.DELTA_WIDTH_SHIFT
+        GameState.DELTA_STRUCT.pack_into(buf, offset, EventType.STATE_DELTA,
+                base_seq, mask, frame_change)
+        offset += GameState.DELTA_STRUCT.size
+        st = GameState.GetDeltaStruct(n, len(values) - n, width)
+        st.pack_into(buf, offset, *values)
+        return offset + st.size
+
+    def DeserializeDelta(self, b, offset, base):
+        '''Set the partial state from a delta against base.
+        Arguments:
+        b      -- A bytes-like object, e.g. a memoryview of a datagram.
+        offset -- The offset of the delta in b, just after the event type.
+        base   -- The baseline state of the delta.
+        '''
+        (_, mask, frame_change) = \
+                GameState.DELTA_SUBSTRUCT.unpack_from(b, offset)
+        offset += GameState.DELTA_SUBSTRUCT.size
+        field_mask = mask & ((1 << GameState.DELTA_FIELD_COUNT) - 1)
+        n = bin(field_mask).count('1')
+        width = GameState.DELTA_WIDTHS[(mask >> GameState.DELTA_WIDTH_SHIFT)
+                & 3]
+        histories = bin((mask >> GameState.DELTA_FIELD_COUNT) & 7).count('1')
+        values = GameState.GetDeltaStruct(n, histories, width).unpack_from(b,
+                offset)
+        base.Copy(self)
+        self.frame = base.frame + frame_change
+        if n > 0:
+            fields = list(base.GetDeltaFields())
+            k = 0
+            for i in range(0, GameState.DELTA_FIELD_COUNT):
+                if field_mask & (1 << i):
+                    fields[i] = values[k]
+                    k += 1
+            self.SetDeltaFields(fields)
+        for i in range(0, 3):
+            if mask & (1 << (GameState.DELTA_FIELD_COUNT + i)):
+                self.bits[i] = values[n]
+                n += 1
+            else:
+                self.bits[i] = base.bits[i]
 
     def Copy(self, other):
         '''Copy this partial state without creating a new instance.
@@ -194,6 +408,38 @@ class GameState:
         other.frame = self.frame
         pass
 
+    def PackInto(self, buf, offset):
+        '''Pack the partial state copied by Copy() into buf at offset.
+        See GameState.ROW.
+        '''
+        GameState.ROW.pack_into(buf, offset,
+                self.ball.pos_x, self.ball.pos_y,
+                self.ball.vel_x, self.ball.vel_y,
+                self.paddle_left.pos_y, self.paddle_left.vel_y,
+                self.paddle_right.pos_y, self.paddle_right.vel_y,
+                self.key_flags, self.frame)
+
+    def Pack(self):
+        '''Return the partial state copied by Copy() as a packed row.
+        See GameState.ROW.
+        '''
+        return GameState.ROW.pack(
+                self.ball.pos_x, self.ball.pos_y,
+                self.ball.vel_x, self.ball.vel_y,
+                self.paddle_left.pos_y, self.paddle_left.vel_y,
+                self.paddle_right.pos_y, self.paddle_right.vel_y,
+                self.key_flags, self.frame)
+
+    def UnpackFrom(self, buf, offset):
+        '''Set the partial state from the row packed in buf at offset.
+        '''
+        (self.ball.pos_x, self.ball.pos_y,
+                self.ball.vel_x, self.ball.vel_y,
+                self.paddle_left.pos_y, self.paddle_left.vel_y,
+                self.paddle_right.pos_y, self.paddle_right.vel_y,
+                self.key_flags, self.frame) = \
+                        GameState.ROW.unpack_from(buf, offset)
+
     def PlayerToObject(self, roles, player_id):
         '''
         Get the object corresponding to a player's role.
@@ -201,6 +447,11 @@ class GameState:
         assert isinstance(roles, list)
         assert isinstance(player_id, int)
         assert 0 <= player_id and player_id < 3
+        return self.PlayerToObjectFast(roles, player_id)
+
+    def PlayerToObjectFast(self, roles, player_id):
+        '''Same as PlayerToObject, without checking the arguments.
+        '''
         if roles[player_id] == GameState.ROLE_LEFT_PADDLE:
             return self.paddle_left
         if roles[player_id] == GameState.ROLE_RIGHT_PADDLE:
@@ -217,7 +468,12 @@ class GameState:
         assert isinstance(roles, list)
         assert isinstance(player_id, int)
         assert 0 <= player_id and player_id <= 2
-        o = other.PlayerToObject(roles, player_id)
+        self.CopyExceptPlayerFast(other, roles, player_id)
+
+    def CopyExceptPlayerFast(self, other, roles, player_id):
+        '''Same as CopyExceptPlayer, without checking the arguments.
+        '''
+        o = other.PlayerToObjectFast(roles, player_id)
         pos_x = o.pos_x
         pos_y = o.pos_y
         vel_x = o.vel_x
@@ -0,0 +1,119 @@
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from tickscheduler import TickScheduler
+import tplogger
+from udpgameengine import UDPGameEngine
+from udpserver import UDPServer
+logger = tplogger.getTPLogger('match.log', logging.DEBUG)
+
+class Match:
+    '''One game hosted by a MatchServer.
+    A match is advanced by calls to Tick() instead of a loop of its own, so
+    many matches can share one loop. Each match has its own engine, state
+    and UDPServer, so the statistics of the server are per match.
+
+    Attributes:
+    match_id     -- The id of the match in its MatchServer.
+    server       -- The UDPServer that plays the ticks and keeps the stats.
+    engine       -- The UDPGameEngine of the match.
+    scheduler    -- The TickScheduler of the match.
+    rotations    -- The iterator of the rotations left. See Rotations().
+    end_frame    -- The last frame of the current rotation.
+    is_post_game -- True after the end of game, while the score is shown.
+    is_done      -- True when the match is over.
+    next_send    -- The monotonic time of the next state update.
+    ticks        -- The number of ticks played.
+    busy_time    -- The time spent in Tick() in seconds.
+    '''
+    def __init__(self, match_id, clients, conf, start_time, server=None):
+        '''
+        Arguments:
+        match_id   -- The id of the match.
+        clients    -- The event sockets of the players, in player order.
+        conf       -- The GameConfig of the match.
+        start_time -- The time of the start in seconds since the epoch.
+        server     -- The UDPServer to use, e.g. the one that did the
+                      handshake. A new one is made if this is None.
+        '''
+        if server == None:
+            server = UDPServer()
+        self.match_id = match_id
+        self.server = server
+        e = UDPGameEngine()
+        e.is_server = True
+        e.is_client = False
+        e.clients = clients
+        conf.Apply(e)
+        self.engine = e
+        self.scheduler = TickScheduler()
+        self.scheduler.SetStart(start_time, e.state.frames_per_sec)
+        self.rotations = e.Rotations(e.state)
+        self.end_frame = e.state.frame
+        self.is_post_game = False
+        self.is_done = False
+        self.next_send = 0.0
+        self.ticks = 0
+        self.busy_time = 0.0
+        self.NextRotation()
+
+    def NextRotation(self):
+        '''Move on to the next rotation, the post game, or the end.'''
+        e = self.engine
+        s = e.state
+        while not self.is_done and s.frame >= self.end_frame:
+            if self.is_post_game:
+                self.is_done = True
+                break
+            try:
+                self.end_frame = s.frame + next(self.rotations)
+            except StopIteration:
+                e.FinishGame(s, self.server)
+                self.is_post_game = True
+                self.end_frame = s.frame + \
+                        s.frames_per_sec * e.post_game_time
+
+    def Tick(self, now):
+        '''Read the pending client events and play up to the frame of now.
+        Argument:
+        now -- The monotonic time.
+        '''
+        if self.is_done or now < self.scheduler.start:
+            return
+        start = time.perf_counter()
+        e = self.engine
+        s = e.state
+        batch = self.server.ReadClients(e)
+        target_frame = min(max(0, self.scheduler.GetFrame(now)),
+                self.end_frame)
+        should_send = self.server.PlayTick(e, s, batch, target_frame)
+        if self.next_send < now or should_send:
+            self.next_send = now + (1.0 / self.server.send_rate)
+            self.server.SendState(e, s)
+        self.NextRotation()
+        self.ticks += 1
+        self.busy_time += time.perf_counter() - start
+
+    def GetDeadline(self):
+        '''Return the monotonic time of the next tick.'''
+        if self.scheduler.Now() < self.scheduler.start:
+            return self.scheduler.start
+        return min(self.scheduler.GetFrameTime(self.engine.state.frame + 1),
+                self.next_send)
+
+    def GetStats(self):
+        '''Return a summary of the match.'''
+        svr = self.server
+        return ('match {0}: frames {1} ticks {2} busy {3:.3f} s '
+                'replayed {4} unchanged {5} coalesced {6} behind {7} '
+                'clients {8}').format(self.match_id, self.engine.state.frame,
+                        self.ticks, self.busy_time, svr.replay_count,
+                        svr.unchanged_count, svr.coalesced_count,
+                        svr.server_behind_count, len(self.engine.clients))
+
+    def Close(self):
+        for c in self.engine.clients:
+            c.Close()
+        self.engine.clients = []
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.reduction
+import os
+import select
+import socket
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from asynceventsocket import AsyncEventSocket
+from asyncudpsocket import AsyncUDPSocket
+from gameconfig import GameConfig
+from matchserver import MatchServer
+import tplogger
+from udpsocket import UDPSocket
+logger = tplogger.getTPLogger('matchpool.log', logging.DEBUG)
+
+def RunMatchWorker(conn, conf, report_interval):
+    '''The main function of a worker process.'''
+    try:
+        asyncio.run(MatchWorker(conn, conf, report_interval).Run())
+    except Exception as e:
+        logger.exception(e)
+    tplogger.stopTPLoggers()
+
+class MatchWorker:
+    '''The part of a MatchPool that runs in a worker process. It receives
+    the accepted sockets of each match from the front process, plays the
+    matches on a MatchServer, and reports its load.
+
+    Messages from the front process:
+    ('match', match_id, n) -- Followed by the file descriptors of the n
+                              sockets of the players.
+    ('stop',)              -- Stop after sending the final report.
+    Messages to the front process:
+    ('load', utilization, running, started, finished, failed) -- See
+                              Report().
+    ('done', stats, frames, busy_time) -- The stats of the finished matches.
+
+    Attributes:
+    conn            -- The multiprocessing connection to the front process.
+    server          -- The MatchServer playing the matches.
+    report_interval -- The time between load reports in seconds.
+    started         -- The number of matches received.
+    is_running      -- False after a stop message.
+    '''
+    def __init__(self, conn, conf, report_interval):
+        self.conn = conn
+        self.server = MatchServer(conf)
+        self.report_interval = report_interval
+        self.started = 0
+        self.is_running = True
+        self.last_report = (time.perf_counter(), 0.0)
+
+    async def Adopt(self, fd):
+        '''Return an AsyncEventSocket for the connected socket fd.'''
+        sock = socket.socket(fileno=fd)
+        s = AsyncUDPSocket()
+        await s.Open(sock=sock)
+        s.peer = sock.getpeername()
+        s.ttl = UDPSocket.MAX_TIME_TO_LIVE
+        return AsyncEventSocket(s)
+
+    async def StartMatch(self, match_id, fds):
+        clients = []
+        for fd in fds:
+            clients.append(await self.Adopt(fd))
+        await self.server.StartMatch(clients, match_id)
+
+    def OnMessage(self):
+        '''Handle a message from the front process.'''
+        try:
+            msg = self.conn.recv()
+        except EOFError:
+            logger.info('The front process is gone.')
+            self.is_running = False
+            return
+        if msg[0] == 'match':
+            (_, match_id, n) = msg
+            fds = [multiprocessing.reduction.recv_handle(self.conn)
+                    for i in range(0, n)]
+            self.started += 1
+            asyncio.ensure_future(self.StartMatch(match_id, fds))
+        elif msg[0] == 'stop':
+            self.is_running = False
+
+    def Report(self):
+        '''Send the share of the time spent in ticks since the last report,
+        and the number of matches running, received, finished and failed.'''
+        now = time.perf_counter()
+        (last_time, last_busy) = self.last_report
+        busy = self.server.busy_time
+        utilization = (busy - last_busy) / max(now - last_time, 1e-9)
+        self.last_report = (now, busy)
+        self.conn.send(('load', utilization, len(self.server.matches),
+            self.started, len(self.server.finished), self.server.failed))
+
+    async def Run(self):
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.conn.fileno(), self.OnMessage)
+        ticks = asyncio.ensure_future(self.server.TickLoop())
+        while self.is_running:
+            await asyncio.sleep(self.report_interval)
+            self.Report()
+        loop.remove_reader(self.conn.fileno())
+        ticks.cancel()
+        svr = self.server
+        for m in list(svr.matches.values()):
+            svr.EndMatch(m)
+        self.Report()
+        self.conn.send(('done', svr.finished, svr.frames, svr.busy_time))
+        self.conn.close()
+
+class PoolWorker:
+    '''The front process's view of a worker process.
+    Attributes:
+    process     -- The multiprocessing.Process.
+    conn        -- The multiprocessing connection to the worker.
+    utilization -- The share of the last report interval spent in ticks.
+    running     -- The number of matches running at the last report.
+    started     -- The number of matches received at the last report.
+    assigned    -- The number of matches assigned.
+    finished    -- The number of matches finished at the last report.
+    failed      -- The number of matches whose handshake failed at the last
+                   report.
+    '''
+    # The assumed load of a match before the worker reported one.
+    MIN_MATCH_LOAD = 0.01
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.utilization = 0.0
+        self.running = 0
+        self.started = 0
+        self.assigned = 0
+        self.finished = 0
+        self.failed = 0
+
+    def GetLoad(self):
+        '''Return the expected utilization, counting the matches assigned
+        since the last report at the average load of a running match.'''
+        per_match = PoolWorker.MIN_MATCH_LOAD
+        if self.running > 0:
+            per_match = max(per_match, self.utilization / self.running)
+        return self.utilization + (self.assigned - self.started) * per_match
+
+class MatchPool:
+    '''A MatchServer sharded across worker processes, so matches can use
+    every core. The front process accepts the clients and groups them into
+    matches. Each match is handed to the least loaded worker, which owns
+    the sockets and engine of the match from then on.
+
+    Attributes:
+    conf            -- The GameConfig of every match.
+    size            -- The number of worker processes.
+    report_interval -- The time between load reports in seconds.
+    accept_timeout  -- The time to wait for the reply of a client in its
+                       handshake, during which no report is read.
+    workers         -- The PoolWorker of each worker process.
+    lobby           -- The accepted UDPSockets waiting for a match.
+    next_id         -- The id of the next match.
+    frames          -- The frames played by all workers, after Stop().
+    busy_time       -- The time spent in ticks by all workers, after Stop().
+    '''
+    def __init__(self, conf, size=None):
+        self.conf = conf
+        if size == None:
+            size = os.cpu_count() or 1
+        self.size = size
+        self.report_interval = 0.25
+        self.accept_timeout = 0.25
+        self.workers = []
+        self.lobby = []
+        self.next_id = 0
+        self.frames = 0
+        self.busy_time = 0.0
+
+    def Start(self):
+        '''Start the worker processes.'''
+        for i in range(0, self.size):
+            (conn, child) = multiprocessing.Pipe()
+            p = multiprocessing.Process(target=RunMatchWorker,
+                    args=(child, self.conf, self.report_interval))
+            p.start()
+            child.close()
+            self.workers.append(PoolWorker(p, conn))
+
+    def Assign(self, clients):
+        '''Hand the sockets of a match to the least loaded worker. The
+        sockets are closed in this process.
+        Return value:
+        The PoolWorker.
+        '''
+        w = min(self.workers, key=lambda w: w.GetLoad())
+        match_id = self.next_id
+        self.next_id += 1
+        logger.info('Assigning match {0} to worker {1} at load {2:.3f}'.format(
+            match_id, w.process.pid, w.GetLoad()))
+        w.conn.send(('match', match_id, len(clients)))
+        for c in clients:
+            multiprocessing.reduction.send_handle(w.conn, c.fileno(),
+                    w.process.pid)
+            c.Close()
+        w.assigned += 1
+        return w
+
+    def OnMessage(self, w):
+        '''Handle a message from worker w.
+        Return value:
+        The message.
+        '''
+        msg = w.conn.recv()
+        if msg[0] == 'load':
+            (_, w.utilization, w.running, w.started, w.finished,
+                    w.failed) = msg
+        return msg
+
+    def GetFinishedCount(self):
+        return sum([w.finished for w in self.workers])
+
+    def GetFailedCount(self):
+        return sum([w.failed for w in self.workers])
+
+    def Poll(self, sock, timeout):
+        '''Wait up to timeout seconds for a client or a report, and handle
+        it.
+        Argument:
+        sock -- The bound UDPSocket accepting clients, or None.
+        '''
+        ready = self.ReadReports(sock, timeout)
+        if sock == None or not sock.sock in ready:
+            return
+        c = sock.Accept(self.accept_timeout)
+        if c == None:
+            return
+        self.lobby.append(c)
+        n = self.conf.player_size
+        if len(self.lobby) >= n:
+            clients = self.lobby[:n]
+            self.lobby = self.lobby[n:]
+            # Reports may have arrived during the handshake.
+            self.ReadReports(None, 0)
+            self.Assign(clients)
+
+    def ReadReports(self, sock, timeout):
+        '''Wait up to timeout seconds for a report or, if sock is not None,
+        a client, and handle every report received.
+        Return value:
+        The ready sockets and connections, as returned by select.
+        '''
+        socks = [w.conn for w in self.workers]
+        if sock != None:
+            socks.append(sock.sock)
+        (ready, _, _) = select.select(socks, [], [], timeout)
+        for w in self.workers:
+            if w.conn in ready:
+                self.OnMessage(w)
+                # Only the latest report of each worker matters.
+                while w.conn.poll():
+                    self.OnMessage(w)
+        return ready
+
+    def Stop(self):
+        '''Stop the workers after their running matches.
+        Return value:
+        The stats of the finished matches.
+        '''
+        stats = []
+        for w in self.workers:
+            w.conn.send(('stop',))
+        for w in self.workers:
+            while True:
+                try:
+                    msg = self.OnMessage(w)
+                except EOFError:
+                    break
+                if msg[0] == 'done':
+                    (_, finished, frames, busy_time) = msg
+                    stats += finished
+                    self.frames += frames
+                    self.busy_time += busy_time
+                    break
+            w.process.join()
+            w.conn.close()
+        for c in self.lobby:
+            c.Close()
+        self.lobby = []
+        self.workers = []
+        return stats
+
+    def GetCapacity(self, frame_rate=MatchServer.FRAME_RATE):
+        '''Estimate how many matches the pool can play at frame_rate, from
+        the time spent per frame by the workers. Valid after Stop().'''
+        if self.frames == 0 or self.busy_time == 0:
+            return 0
+        return self.size * self.frames / (self.busy_time * frame_rate)
+
+    def Run(self, sock, timeout=1.0, max_matches=None):
+        '''Host matches on sock until max_matches have finished or failed.
+        Arguments:
+        sock        -- The bound UDPSocket to accept clients on.
+        timeout     -- The time to wait for a client or a report in each
+                       poll.
+        max_matches -- The number of matches to start, or None for no limit.
+        Return value:
+        The stats of the finished matches.
+        '''
+        self.Start()
+        try:
+            while max_matches == None or self.GetFinishedCount() + \
+                    self.GetFailedCount() < max_matches:
+                self.Poll(sock, timeout)
+        finally:
+            stats = self.Stop()
+        logger.info('Frames {0} busy {1:.3f} s capacity {2:.0f} matches at '
+                '{3} fps on {4} workers'.format(self.frames, self.busy_time,
+                    self.GetCapacity(), MatchServer.FRAME_RATE, self.size))
+        return stats
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=\
+            'The triplepong game server hosting matches on every core.')
+    parser.add_argument('--port', type=int, default=8090,
+            help='The port number.')
+    parser.add_argument('--players', type=int, default=3,
+            help='The number of players per match.')
+    parser.add_argument('--time', type=int, default=120,
+            help='The duration of each match in seconds.')
+    parser.add_argument('--fps', type=int, default=60,
+            help='The frame rate in seconds')
+    parser.add_argument('--nosync', default=False, action='store_true',
+            help='Measure latency and clock of clients.')
+    parser.add_argument('--workers', type=int, default=0,
+            help='The number of worker processes (0 for one per core).')
+    parser.add_argument('--matches', type=int, default=0,
+            help='The number of matches to start (0 for no limit).')
+    args = parser.parse_args()
+    conf = GameConfig()
+    conf.player_size = args.players
+    conf.game_length = args.time
+    conf.frames_per_sec = args.fps
+    conf.do_sync = not args.nosync
+    sock = UDPSocket()
+    sock.Open()
+    sock.Bind(('0.0.0.0', args.port))
+    pool = MatchPool(conf, args.workers or None)
+    pool.Run(sock, max_matches=args.matches or None)
+    sock.Close()
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath('src'))
+from asynceventsocket import AsyncEventSocket
+from asynctickscheduler import AsyncTickScheduler
+from asyncudpmux import AsyncUDPMux
+from asyncudpserver import AsyncUDPServer
+from asyncudpsocket import AsyncUDPSocket
+from gameconfig import GameConfig
+from match import Match
+import tplogger
+logger = tplogger.getTPLogger('matchserver.log', logging.DEBUG)
+
+class MatchServer:
+    '''A server that keeps accepting clients, groups them into matches of
+    conf.player_size players, and plays all the matches on one shared tick
+    loop.
+
+    Attributes:
+    conf          -- The GameConfig of every match.
+    buffer_time   -- The time in msec between invitations and game start.
+    matches       -- The running matches by id.
+    lobby         -- The accepted clients waiting for a match.
+    next_id       -- The id of the next match.
+    finished      -- The stats of the finished matches.
+    failed        -- The number of matches whose sync or handshake failed.
+    ready         -- An asyncio.Event set when a datagram is received by any
+                     player of a running match.
+    scheduler     -- The AsyncTickScheduler of the tick loop.
+    busy_time     -- The time spent in ticks in seconds.
+    frames        -- The number of frames played by all matches.
+    is_running    -- False when the server should stop.
+    '''
+    FRAME_RATE = 60
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.buffer_time = 500
+        self.matches = {}
+        self.lobby = []
+        self.next_id = 0
+        self.finished = []
+        self.failed = 0
+        self.ready = asyncio.Event()
+        self.scheduler = AsyncTickScheduler()
+        self.busy_time = 0.0
+        self.frames = 0
+        self.is_running = True
+
+    async def AcceptLoop(self, sock, timeout):
+        '''Accept clients on sock and start a match for each group of
+        conf.player_size clients.
+        '''
+        while self.is_running:
+            c = await sock.Accept(timeout)
+            if c == None:
+                continue
+            logger.info('Accepted connection from {0}.'.format(c.peer))
+            self.lobby.append(AsyncEventSocket(c))
+            n = self.conf.player_size
+            if len(self.lobby) >= n:
+                clients = self.lobby[:n]
+                self.lobby = self.lobby[n:]
+                asyncio.ensure_future(self.StartMatch(clients))
+
+    async def StartMatch(self, clients, match_id=None):
+        '''Sync and handshake with clients, and add their match to the tick
+        loop.
+        Arguments:
+        clients  -- The AsyncEventSocket of each player.
+        match_id -- The id of the match, or None for the next id.
+        Return value:
+        The Match, or None if the handshake failed.
+        '''
+        handshaker = AsyncUDPServer()
+        handshaker.buffer_time = self.buffer_time
+        if self.conf.do_sync and \
+                await handshaker.SyncClients(clients, self.conf) != 0:
+            logger.info('Sync failed.')
+            for c in clients:
+                c.Close()
+            self.failed += 1
+            return None
+        status = await handshaker.Handshake(clients, self.conf, 2.0)
+        if status != 0:
+            logger.info('Handshake failed.')
+            for c in clients:
+                c.Close()
+            self.failed += 1
+            return None
+        if match_id == None:
+            match_id = self.next_id
+            self.next_id += 1
+        m = Match(match_id, clients, self.conf,
+                handshaker.game_start_time / 1000.0, handshaker)
+        for c in clients:
+            c.sock.ready = self.ready
+        self.matches[match_id] = m
+        logger.info('Starting match {0}.'.format(match_id))
+        # Wake the tick loop to schedule the match.
+        self.ready.set()
+        return m
+
+    def Tick(self, now):
+        '''Tick every match once and retire the finished ones. A match that
+        fails is ended without affecting the others.
+        '''
+        start = time.perf_counter()
+        for m in list(self.matches.values()):
+            frame = m.engine.state.frame
+            try:
+                m.Tick(now)
+            except Exception as ex:
+                logger.exception(ex)
+                logger.info('Ending match {0} after an error.'.format(
+                    m.match_id))
+                m.is_done = True
+            self.frames += m.engine.state.frame - frame
+            if m.is_done:
+                self.EndMatch(m)
+        self.busy_time += time.perf_counter() - start
+
+    def EndMatch(self, m):
+        stats = m.GetStats()
+        m.Close()
+        del self.matches[m.match_id]
+        logger.info(stats)
+        self.finished.append(stats)
+
+    def GetDeadline(self, now):
+        '''Return the monotonic time of the next tick of any match.'''
+        deadline = now + 1.0
+        for m in self.matches.values():
+            deadline = min(deadline, m.GetDeadline())
+        return deadline
+
+    def GetCapacity(self, frame_rate=FRAME_RATE):
+        '''Estimate how many matches one core can play at frame_rate, from
+        the time spent per frame so far. Return 0 if nothing was played.
+        '''
+        if self.frames == 0 or self.busy_time == 0:
+            return 0
+        return self.frames / (self.busy_time * frame_rate)
+
+    async def TickLoop(self):
+        '''Tick the matches until the server stops.'''
+        sched = self.scheduler
+        while self.is_running:
+            now = sched.Now()
+            self.Tick(now)
+            await sched.WaitUntilAsync(self.GetDeadline(now), self.ready)
+            # Events that arrived during the ticks are read on the next tick.
+            self.ready.clear()
+
+    async def Run(self, sock, timeout=1.0, max_matches=None):
+        '''Host matches on sock until max_matches have finished or failed.
+        Arguments:
+        sock        -- The open AsyncUDPSocket or AsyncUDPMux to accept clients
+                       on.
+        timeout     -- The timeout of each accept.
+        max_matches -- The number of matches to start, or None for no limit.
+        Return value:
+        The stats of the finished matches.
+        '''
+        accept = asyncio.ensure_future(self.AcceptLoop(sock, timeout))
+        ticks = asyncio.ensure_future(self.TickLoop())
+        try:
+            while max_matches == None or \
+                    len(self.finished) + self.failed < max_matches:
+                await asyncio.sleep(0.05)
+        finally:
+            self.is_running = False
+            accept.cancel()
+            ticks.cancel()
+            for m in list(self.matches.values()):
+                self.EndMatch(m)
+            for c in self.lobby:
+                c.Close()
+            self.lobby = []
+        logger.info('Frames {0} busy {1:.3f} s capacity {2:.0f} matches at '
+                '{3} fps'.format(self.frames, self.busy_time,
+                    self.GetCapacity(), MatchServer.FRAME_RATE))
+        return self.finished
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=\
+            'The triplepong game server hosting many matches at once.')
+    parser.add_argument('--port', type=int, default=8090,
+            help='The port number.')
+    parser.add_argument('--players', type=int, default=3,
+            help='The number of players per match.')
+    parser.add_argument('--time', type=int, default=120,
+            help='The duration of each match in seconds.')
+    parser.add_argument('--fps', type=int, default=60,
+            help='The frame rate in seconds')
+    parser.add_argument('--nosync', default=False, action='store_true',
+            help='Measure latency and clock of clients.')
+    parser.add_argument('--nodelta', default=False, action='store_true',
+            help='Send every state in full instead of as a delta.')
+    parser.add_argument('--nopack', default=False, action='store_true',
+            help='Send states without bit-packing them.')
+    parser.add_argument('--matches', type=int, default=0,
+            help='The number of matches to start (0 for no limit).')
+    parser.add_argument('--mux', default=False, action='store_true',
+            help='Serve all clients from the one port.')
+    args = parser.parse_args()
+    conf = GameConfig()
+    conf.player_size = args.players
+    conf.game_length = args.time
+    conf.frames_per_sec = args.fps
+    conf.do_sync = not args.nosync
+    conf.do_delta = not args.nodelta
+    conf.do_pack = not args.nopack
+    async def Main():
+        sock = AsyncUDPSocket()
+        if args.mux:
+            sock = AsyncUDPMux()
+        await sock.Open(('0.0.0.0', args.port))
+        s = MatchServer(conf)
+        await s.Run(sock, max_matches=args.matches or None)
+        sock.Close()
+    asyncio.run(Main())
@@ -0,0 +1,268 @@
+import os
+import sys
+sys.path.append(os.path.abspath('src'))
+from eventtype import EventType
+from gameevent import GameEvent
+from gamestate import GameState
+from udpdatagram import UDPDatagram
+from udpgameengine import UDPGameEngine
+
+class StateCodec:
+    '''A bit-packed encoding of state updates, with the range of each field
+    derived from a GameConfig. Both peers build a StateCodec from the
+    configuration of the handshake, so they agree on the ranges.
+
+    An update is the event type followed by a bit string, padded to a byte:
+    a bit that is set if the update is a delta, and then the age of its
+    baseline, as the difference of the sequence numbers of the datagrams
+    that carried them; the frame; then each field of
+    GameState.GetDeltaFields() with the bits of its range, preceded by a
+    changed bit if the update is a delta; then each history, preceded by a
+    changed bit and XORed with the history of the baseline if the update is
+    a delta. A history is a bit for its form, followed by its bit length and
+    the history itself in that many bits, or by the number of keys pressed
+    and the frame index of each.
+    A state with a field out of its range is written with GameState's own
+    encoding instead. See SerializeInto().
+
+    A StateCodec can be written to a UDPSocket like an event.
+    Attributes:
+    ranges        -- The (minimum, bits) of each field.
+    frame_bits    -- The bits of the frame.
+    buffer_size   -- The largest bit length of a history.
+    count_bits    -- The bits of the bit length of a history, or of the
+                     number of keys pressed in it.
+    index_bits    -- The bits of the frame index of a key press.
+    state         -- The state to write.
+    base          -- The baseline to write state against, or None.
+    base_seq      -- The sequence number of base.
+    seq           -- The sequence number of the datagram carrying state.
+    '''
+    # A StateDelta keeps fewer states than this.
+    AGE_BITS = 6
+    HISTORY_SPARSE = 0
+    HISTORY_RAW = 1
+
+    def __init__(self, conf):
+        '''
+        Argument:
+        conf -- The GameConfig of the match.
+        '''
+        self.event_type = EventType.STATE_PACKED
+        width = conf.screen_width
+        height = conf.screen_height
+        region = conf.buffer_region
+        ball_vel_y = UDPGameEngine.BALL_TERM_VELOCITY
+        paddle_vel_y = UDPGameEngine.PADDLE_TERM_VELOCITY
+        keys = GameEvent.EVENT_FLAP_LEFT_PADDLE | \
+                GameEvent.EVENT_FLAP_RIGHT_PADDLE | GameEvent.EVENT_FLAP_BALL
+        # The ball scores as soon as it reaches a goal, but nothing stops it
+        # above or below the screen where there is no ball wall.
+        bounds = [(-region, width + region), (-height, 2 * height),
+                (-conf.ball_vel, conf.ball_vel), (-ball_vel_y, ball_vel_y),
+                (-region, height + region), (-paddle_vel_y, paddle_vel_y),
+                (-region, height + region), (-paddle_vel_y, paddle_vel_y),
+                (0, keys)]
+        self.ranges = [(lo, (hi - lo).bit_length()) for (lo, hi) in bounds]
+        self.frame_bits = int((conf.game_length + conf.post_game_time + 1) *
+                conf.frames_per_sec).bit_length()
+        self.buffer_size = conf.buffer_size
+        self.count_bits = conf.buffer_size.bit_length()
+        self.index_bits = (conf.buffer_size - 1).bit_length()
+        self.state = None
+        self.base = None
+        self.base_seq = 0
+        self.seq = 0
+
+    def SerializeInto(self, buf, offset):
+        '''Write state, as a delta against base if base is not None and the
+        delta is the shorter, into buf at offset. If a field of state is out
+        of its range, the state is written by GameState.SerializeDeltaInto()
+        or SerializeInto().
+        Return value:
+        The offset of the end of the update.
+        '''
+        s = self.state
+        base = self.base
+        age = (self.seq - self.base_seq) % UDPDatagram.MAX_SEQ
+        if age >> StateCodec.AGE_BITS:
+            base = None
+        bits = self.PackState(s, base, age)
+        if base != None and bits != None:
+            # A delta against an old baseline can be the longer.
+            # The full form fails where an unchanged field is out of range.
+            full = self.PackState(s, None, 0)
+            if full != None and full[1] <= bits[1]:
+                bits = full
+        if bits == None:
+            if base != None:
+                return s.SerializeDeltaInto(buf, offset, base, self.base_seq)
+            return s.SerializeInto(buf, offset)
+        (acc, n) = bits
+        pad = -n % 8
+        acc <<= pad
+        size = (n + pad) // 8
+        EventType.STRUCT.pack_into(buf, offset, EventType.STATE_PACKED)
+        offset += EventType.SIZE
+        buf[offset:offset + size] = acc.to_bytes(size, 'big')
+        return offset + size
+
+    def PackState(self, s, base, age):
+        '''Return the bit string of s as an (int, number of bits) pair, or
+        None if a field of s is out of its range.
+        Arguments:
+        s    -- The state.
+        base -- The baseline, or None.
+        age  -- The age of base, less than 1 << AGE_BITS.
+        '''
+        if base == None:
+            acc = 0
+            n = 1
+        else:
+            acc = (1 << StateCodec.AGE_BITS) | age
+            n = 1 + StateCodec.AGE_BITS
+        frame_bits = self.frame_bits
+        if s.frame < 0 or s.frame >> frame_bits:
+            return None
+        acc = (acc << frame_bits) | s.frame
+        n += frame_bits
+        fields = s.GetDeltaFields()
+        if base == None:
+            for i in range(0, GameState.DELTA_FIELD_COUNT):
+                (lo, width) = self.ranges[i]
+                v = fields[i] - lo
+                if v < 0 or v >> width:
+                    return None
+                acc = (acc << width) | v
+                n += width
+        else:
+            base_fields = base.GetDeltaFields()
+            for i in range(0, GameState.DELTA_FIELD_COUNT):
+                if fields[i] == base_fields[i]:
+                    acc <<= 1
+                    n += 1
+                    continue
+                (lo, width) = self.ranges[i]
+                v = fields[i] - lo
+                if v < 0 or v >> width:
+                    return None
+                acc = (((acc << 1) | 1) << width) | v
+                n += 1 + width
+        for i in range(0, 3):
+            h = s.bits[i]
+            if h < 0 or h >> self.buffer_size:
+                return None
+            if base != None:
+                if h == base.bits[i]:
+                    acc <<= 1
+                    n += 1
+                    continue
+                acc = (acc << 1) | 1
+                n += 1
+                # Only the frames played since base differ, mostly.
+                h ^= base.bits[i]
+            (acc, n) = self.PackHistory(acc, n, h)
+        return (acc, n)
+
+    def PackHistory(self, acc, n, h):
+        '''Append the history h to the bit string (acc, n) in the shorter of
+        its forms.'''
+        count = bin(h).count('1')
+        index_bits = self.index_bits
+        length = h.bit_length()
+        if count * index_bits >= length:
+            acc = (((((acc << 1) | StateCodec.HISTORY_RAW) << self.count_bits)
+                    | length) << length) | h
+            return (acc, n + 1 + self.count_bits + length)
+        acc = (((acc << 1) | StateCodec.HISTORY_SPARSE) << self.count_bits) \
+                | count
+        n += 1 + self.count_bits
+        while h:
+            low = h & -h
+            acc = (acc << index_bits) | (low.bit_length() - 1)
+            n += index_bits
+            h ^= low
+        return (acc, n)
+
+    @staticmethod
+    def GetBase(b, offset, seq):
+        '''Return the sequence number of the baseline of the update in b at
+        offset, just after the event type, or None if it is not a delta.
+        Argument:
+        seq -- The sequence number of the datagram of the update.
+        '''
+        v = b[offset]
+        if v >> 7 == 0:
+            return None
+        age = (v >> (7 - StateCodec.AGE_BITS)) & \
+                ((1 << StateCodec.AGE_BITS) - 1)
+        return (seq - age) % UDPDatagram.MAX_SEQ
+
+    def Deserialize(self, b, offset, s, base=None):
+        '''Set the partial state s from the update in b at offset, just
+        after the event type. Bytes after the update are ignored. Raise
+        ValueError if it is a delta and base is None, or if it is truncated.
+        Arguments:
+        b      -- A bytes-like object, e.g. a memoryview of a datagram.
+        offset -- The offset of the update in b.
+        s      -- The GameState to set.
+        base   -- The baseline, if the update is a delta.
+        '''
+        acc = int.from_bytes(b[offset:], 'big')
+        # The number of bits not read yet.
+        left = 8 * (len(b) - offset) - 1
+        is_delta = (acc >> left) & 1
+        if is_delta:
+            if base == None:
+                raise ValueError('A delta needs a baseline.')
+            left -= StateCodec.AGE_BITS
+            base.Copy(s)
+        left -= self.frame_bits
+        s.frame = (acc >> left) & ((1 << self.frame_bits) - 1)
+        fields = []
+        for i in range(0, GameState.DELTA_FIELD_COUNT):
+            if is_delta:
+                left -= 1
+                if not (acc >> left) & 1:
+                    fields.append(None)
+                    continue
+            (lo, width) = self.ranges[i]
+            left -= width
+            fields.append(lo + ((acc >> left) & ((1 << width) - 1)))
+        if is_delta:
+            base_fields = base.GetDeltaFields()
+            for i in range(0, GameState.DELTA_FIELD_COUNT):
+                if fields[i] == None:
+                    fields[i] = base_fields[i]
+        s.SetDeltaFields(fields)
+        for i in range(0, 3):
+            if is_delta:
+                left -= 1
+                if not (acc >> left) & 1:
+                    s.bits[i] = base.bits[i]
+                    continue
+            (h, left) = self.UnpackHistory(acc, left)
+            if is_delta:
+                h ^= base.bits[i]
+            s.bits[i] = h
+        if left < 0:
+            raise ValueError('The update is truncated.')
+
+    def UnpackHistory(self, acc, left):
+        '''Read a history from the bit string acc with left bits not read.
+        Return value:
+        The (history, left) pair.
+        '''
+        left -= 1
+        form = (acc >> left) & 1
+        left -= self.count_bits
+        count = (acc >> left) & ((1 << self.count_bits) - 1)
+        if form == StateCodec.HISTORY_RAW:
+            left -= count
+            return ((acc >> left) & ((1 << count) - 1), left)
+        index_mask = (1 << self.index_bits) - 1
+        h = 0
+        for i in range(0, count):
+            left -= self.index_bits
+            h |= 1 << ((acc >> left) & index_mask)
+        return (h, left)
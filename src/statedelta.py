@@ -0,0 +1,81 @@
+import os
+import sys
+sys.path.append(os.path.abspath('src'))
+from eventtype import EventType
+from gamestate import GameState
+
+class StateDelta:
+    '''The last states sent or received on a connection, by the sequence
+    number of the datagram that carried them. They are the baselines of
+    delta-compressed state updates.
+    A StateDelta can be written to a UDPSocket like an event: it writes
+    state as a delta against base. See GameState.SerializeDeltaInto().
+
+    Attributes:
+    seqs     -- The sequence number of each saved state, or None.
+    states   -- The saved states. They are allocated on first use.
+    next     -- The index of the next state to overwrite.
+    state    -- The state to write.
+    base     -- The baseline to write state against.
+    base_seq -- The sequence number of base.
+    '''
+    # The ackbits cover the 32 datagrams before the ack, so an older
+    # baseline could not be known to be acknowledged.
+    SIZE = 33
+
+    def __init__(self, size=SIZE):
+        self.event_type = EventType.STATE_DELTA
+        self.seqs = [None] * size
+        self.states = [None] * size
+        self.next = 0
+        self.state = None
+        self.base = None
+        self.base_seq = 0
+
+    def Save(self, seq, s):
+        '''Save a copy of the state s carried by the datagram seq,
+        overwriting the oldest state.'''
+        i = self.next
+        saved = self.states[i]
+        if saved == None:
+            saved = GameState()
+            self.states[i] = saved
+        s.Copy(saved)
+        saved.bits[0:3] = s.bits[0:3]
+        self.seqs[i] = seq
+        self.next = (i + 1) % len(self.seqs)
+
+    def Find(self, seq):
+        '''Return the state carried by the datagram seq, or None if it is
+        not saved.'''
+        try:
+            return self.states[self.seqs.index(seq)]
+        except ValueError:
+            return None
+
+    def FindAcked(self, sock):
+        '''Set base to the latest saved state the peer of sock acknowledged.
+        Argument:
+        sock -- The UDPSocket the states were sent with.
+        Return value:
+        True if there is one.
+        '''
+        n = len(self.seqs)
+        for k in range(1, n + 1):
+            i = (self.next - k) % n
+            seq = self.seqs[i]
+            if seq == None:
+                return False
+            if sock.IsAckedByPeer(seq):
+                self.base = self.states[i]
+                self.base_seq = seq
+                return True
+        return False
+
+    def SerializeInto(self, buf, offset):
+        '''Write state as a delta against base into buf at offset.
+        Return value:
+        The offset of the end of the delta.
+        '''
+        return self.state.SerializeDeltaInto(buf, offset, self.base,
+                self.base_seq)
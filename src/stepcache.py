@@ -0,0 +1,51 @@
+import collections
+
+class StepCache:
+    '''A bounded least recently used cache of step results.
+    The engine uses it to skip PlayFrame when a frame is replayed from the
+    same state with the same keys.
+
+    Attributes:
+    capacity -- The maximum number of entries.
+    hits     -- The number of successful lookups.
+    misses   -- The number of failed lookups.
+    entries  -- The entries, from least to most recently used.
+    '''
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.entries = collections.OrderedDict()
+
+    def Get(self, key):
+        '''Look up a step result and mark it as recently used.
+        Argument:
+        key -- The key of the step.
+        Return value:
+        The value stored for key, or None if there is none.
+        '''
+        value = self.entries.get(key)
+        if value == None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def Put(self, key, value):
+        '''Store a step result, evicting the least recently used entry if
+        the cache is full.
+        Arguments:
+        key   -- The key of the step.
+        value -- The result of the step. This must not be None.
+        '''
+        assert value != None
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def Clear(self):
+        '''Remove all entries. The counters are kept.'''
+        self.entries.clear()
@@ -0,0 +1,81 @@
+import time
+
+class TickScheduler:
+    '''Schedule frames on the monotonic clock and sleep between deadlines.
+    The game start time is agreed on in seconds since the epoch, so it is
+    converted to the monotonic clock once in SetStart().
+
+    Attributes:
+    start         -- The monotonic time of frame 0.
+    frame_rate    -- Frames per second.
+    wakeups       -- The number of waits that ended at their deadline.
+    jitter_total  -- The sum of the delays of those wake-ups in seconds.
+    jitter_max    -- The largest delay of those wake-ups in seconds.
+    '''
+    def __init__(self):
+        self.start = time.monotonic()
+        self.frame_rate = 1
+        self.wakeups = 0
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+
+    def SetStart(self, start_time, frame_rate):
+        '''
+        Arguments:
+        start_time -- The time of frame 0 in seconds since the epoch.
+        frame_rate -- Frames per second.
+        '''
+        assert frame_rate > 0
+        self.start = time.monotonic() + (start_time - time.time())
+        self.frame_rate = frame_rate
+
+    def Now(self):
+        return time.monotonic()
+
+    def GetFrame(self, now):
+        '''Return the frame at the monotonic time now.'''
+        # Round up by a nanosecond, so that GetFrameTime(n) is in frame n
+        # despite the rounding of the floats.
+        return int((now - self.start + 1e-9) * self.frame_rate)
+
+    def GetFrameTime(self, frame):
+        '''Return the monotonic time at which frame starts.'''
+        return self.start + float(frame) / self.frame_rate
+
+    def WaitUntil(self, deadline, sel=None):
+        '''Sleep until the monotonic time deadline, or until a socket
+        registered with sel is readable.
+        Arguments:
+        deadline -- The monotonic time to wake up at.
+        sel      -- A selectors.BaseSelector, or None.
+        Return value:
+        True if a socket became readable before the deadline.
+        '''
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return False
+        if sel != None:
+            if sel.select(timeout) != []:
+                return True
+        else:
+            time.sleep(timeout)
+        self.RecordWakeup(deadline)
+        return False
+
+    def RecordWakeup(self, deadline):
+        '''Record the delay of a wake-up scheduled at deadline.'''
+        late = time.monotonic() - deadline
+        if late < 0:
+            # Woken early, e.g. by a signal or a coarse timer.
+            return
+        self.wakeups += 1
+        self.jitter_total += late
+        self.jitter_max = max(self.jitter_max, late)
+
+    def GetJitterReport(self):
+        '''Return a summary of the wake-up delays.'''
+        mean = 0.0
+        if self.wakeups > 0:
+            mean = self.jitter_total / self.wakeups
+        return 'Wake-ups {0} jitter mean {1:.3f} ms max {2:.3f} ms'.format(
+                self.wakeups, mean * 1000, self.jitter_max * 1000)
@@ -1,8 +1,69 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+
+# The loggers made by getTPLogger.
+loggers = []
+# The largest number of records waiting to be written.
+QUEUE_SIZE = 10000
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    '''A QueueHandler that drops records when the queue is full instead of
+    blocking the caller.
+    Attribute:
+    dropped -- The number of records dropped.
+    '''
+    def __init__(self, q):
+        logging.handlers.QueueHandler.__init__(self, q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class FileDispatcher(logging.Handler):
+    '''Write each record to the file handler of the logger that made it.
+    This runs on the listener thread.
+    '''
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.handlers = {}
+
+    def handle(self, record):
+        handler = self.handlers.get(record.name)
+        if handler != None:
+            handler.handle(record)
+
+class FileListener(logging.handlers.QueueListener):
+    '''A QueueListener whose stop waits for room in a full queue.'''
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+dispatcher = FileDispatcher()
+queue_handler = None
+listener = None
+
+def startListener():
+    global queue_handler, listener
+    q = queue.Queue(QUEUE_SIZE)
+    if queue_handler == None:
+        queue_handler = DroppingQueueHandler(q)
+    queue_handler.queue = q
+    listener = FileListener(q, dispatcher)
+    listener.start()
 
 def getTPLogger(filename, level):
+    '''Return the logger writing to filename.
+    Records are written by a background thread, so logging never waits for
+    the disk. If more than QUEUE_SIZE records are waiting, new records are
+    dropped and counted. See getTPDroppedCount().
+    '''
     logger = logging.getLogger(filename)
     logger.setLevel(level)
     form = logging.Formatter(
@@ -10,7 +71,65 @@ def getTPLogger(filename, level):
             "%(levelname)s %(message)s")
     handler = logging.FileHandler(filename, "w", encoding=None, delay=False)
     handler.setFormatter(form)
-    logger.addHandler(handler)
+    old = dispatcher.handlers.get(filename)
+    if old != None:
+        old.close()
+    dispatcher.handlers[filename] = handler
+    if listener == None:
+        startListener()
+    if not queue_handler in logger.handlers:
+        logger.addHandler(queue_handler)
     logger.propagate = False
+    if not logger in loggers:
+        loggers.append(logger)
     return logger
 
+def setTPLevel(level):
+    '''Set the level of all loggers made by getTPLogger.
+    Argument:
+    level -- A logging level or its name, e.g. 'INFO'.
+    '''
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    assert isinstance(level, int)
+    for logger in loggers:
+        logger.setLevel(level)
+
+def getTPDroppedCount():
+    '''Return the number of records dropped because the queue was full.'''
+    if queue_handler == None:
+        return 0
+    return queue_handler.dropped
+
+def flushTPLoggers():
+    '''Wait until all queued records are written.'''
+    if listener == None:
+        return
+    listener.stop()
+    for handler in dispatcher.handlers.values():
+        handler.flush()
+    listener.start()
+
+def stopTPLoggers():
+    '''Write the queued records and stop the background thread.'''
+    global listener
+    if listener == None:
+        return
+    listener.stop()
+    listener = None
+    for handler in dispatcher.handlers.values():
+        handler.flush()
+
+def restartAfterFork():
+    # The listener thread does not survive a fork, and the queue may have
+    # been locked by it.
+    global listener
+    if listener != None:
+        listener = None
+        startListener()
+
+atexit.register(stopTPLoggers)
+# os.register_at_fork() is new in Python 3.7. Before it, a forked child
+# has no listener until it calls restartAfterFork() itself.
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=restartAfterFork)
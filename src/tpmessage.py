@@ -19,6 +19,8 @@ class TPMessage(object):
     METHOD_SYNC = 4
     FORMAT = '!iiiiiQ'
     SUBFORMAT = '!iiiiQ'
+    STRUCT = struct.Struct(FORMAT)
+    SUBSTRUCT = struct.Struct(SUBFORMAT)
     def __init__(self):
         self.method = self.METHOD_NONE
         self.player_id = GameState.ROLE_NONE
@@ -33,12 +35,21 @@ class TPMessage(object):
         return self.__dict__ == other.__dict__
 
     def GetSize(self):
-        return struct.calcsize(self.SUBFORMAT)
+        return TPMessage.SUBSTRUCT.size
 
     def Serialize(self): 
-        return struct.pack(self.FORMAT, self.event_type, self.method,
+        return TPMessage.STRUCT.pack(self.event_type, self.method,
                 self.player_id, self.seq, self.ack,  self.timestamp)
 
-    def Deserialize(self, b):
+    def SerializeInto(self, buf, offset):
+        '''Write the serialized message into buf at offset.
+        Return value:
+        The offset of the end of the message.
+        '''
+        TPMessage.STRUCT.pack_into(buf, offset, self.event_type, self.method,
+                self.player_id, self.seq, self.ack,  self.timestamp)
+        return offset + TPMessage.STRUCT.size
+
+    def Deserialize(self, b, offset=0):
         (self.method, self.player_id, self.seq, self.ack, self.timestamp) = \
-                struct.unpack(self.SUBFORMAT, b)
+                TPMessage.SUBSTRUCT.unpack_from(b, offset)
@@ -0,0 +1,77 @@
+import array
+import logging
+
+class TraceRing:
+    '''A preallocated ring of fixed-size trace records.
+    Recording stores a few ints and never formats or allocates, so it can be
+    called from the game loops. The newest capacity records are kept and
+    formatted only on demand, e.g. by Dump() at the end of a game.
+    A ring must only be written by one thread.
+
+    Each record is (code, frame, a, b, c). The meaning of a, b and c depends
+    on the code. Values must fit in a signed 64-bit int.
+
+    Attributes:
+    capacity -- The maximum number of records kept.
+    count    -- The total number of records written.
+    records  -- The flat array of records.
+    names    -- Maps a code to the format string of its records. The string
+                is formatted with frame, a, b and c as arguments 0 to 3.
+    '''
+    WIDTH = 5
+
+    def __init__(self, capacity, names=None):
+        assert capacity > 0
+        self.capacity = capacity
+        self.count = 0
+        self.records = array.array('q', bytes(8 * TraceRing.WIDTH * capacity))
+        if names == None:
+            names = {}
+        self.names = names
+
+    def Record(self, code, frame, a=0, b=0, c=0):
+        '''Write a record, overwriting the oldest one if the ring is full.'''
+        i = (self.count % self.capacity) * TraceRing.WIDTH
+        r = self.records
+        r[i] = code
+        r[i + 1] = frame
+        r[i + 2] = a
+        r[i + 3] = b
+        r[i + 4] = c
+        self.count += 1
+
+    def GetRecords(self):
+        '''Return the kept records as tuples, from oldest to newest.'''
+        w = TraceRing.WIDTH
+        n = min(self.count, self.capacity)
+        first = self.count - n
+        result = []
+        for k in range(first, self.count):
+            i = (k % self.capacity) * w
+            result.append(tuple(self.records[i:i + w]))
+        return result
+
+    def Format(self):
+        '''Return the kept records as strings, from oldest to newest.'''
+        result = []
+        for (code, frame, a, b, c) in self.GetRecords():
+            form = self.names.get(code)
+            if form == None:
+                form = 'trace ' + str(code) + ': {0} {1} {2} {3}'
+            result.append(form.format(frame, a, b, c))
+        return result
+
+    def Dump(self, logger, level=logging.DEBUG):
+        '''Write the kept records to logger if it is enabled for level.'''
+        if not logger.isEnabledFor(level):
+            return
+        dropped = self.count - min(self.count, self.capacity)
+        if dropped > 0:
+            logger.log(level, '{0} older trace records were overwritten.'
+                    .format(dropped))
+        for line in self.Format():
+            logger.log(level, line)
+
+    def Clear(self):
+        '''Forget all records.'''
+        self.count = 0
@@ -3,6 +3,7 @@
 import logging
 import os
 import select
+import selectors
 import sys
 import time
 sys.path.append(os.path.abspath('src'))
@@ -12,9 +13,11 @@ from eventtype import EventType
 from gameevent import GameEvent
 from gamestate import GameState
 import tplogger
+from tracering import TraceRing
 from gameconfig import GameConfig
 from nullkeyboard import NullKeyboard
 from nullrenderer import NullRenderer
+from tickscheduler import TickScheduler
 from tpmessage import TPMessage
 from udpeventsocket import UDPEventSocket
 from udpsocket import UDPSocket
@@ -34,7 +37,34 @@ class UDPClient:
     rewind_count        -- The number of normal state updates.
     behind_count        -- The number of times the client was behind schedule.
     past_count          -- The number of times an update was in the past.
+    trace               -- The TraceRing of the game loop. It is dumped to 
+                           the log at debug level when a game ends.
+    scheduler           -- The TickScheduler of PlayFrames.
+    next_send           -- The monotonic time of the next input update.
     '''
+    # Trace codes. See TRACE_NAMES for the meaning of the arguments.
+    TRACE_PLAY = 1
+    TRACE_SEND_KEY = 2
+    TRACE_STATE_UPDATE = 3
+    TRACE_UPDATE_OLD = 4
+    TRACE_EVENT_LOST = 5
+    TRACE_LOSS = 6
+    TRACE_APPLY = 7
+    TRACE_REWIND = 8
+    TRACE_BEHIND = 9
+    TRACE_NAMES = {
+        TRACE_PLAY: 'Playing from frame {0}, target {1}.',
+        TRACE_SEND_KEY: 'Sending key {0}.',
+        TRACE_STATE_UPDATE: 'Received state update {0} at frame {1}.',
+        TRACE_UPDATE_OLD: 'Update too old. {0} < {1} - {2}',
+        TRACE_EVENT_LOST: 'Event {0} was lost.',
+        TRACE_LOSS: 'Handling lost event. Clearing bitrec at {0}.',
+        TRACE_APPLY: 'Applying state update {0}.',
+        TRACE_REWIND: 'Rewind from {1} to record {2} for update {0}.',
+        TRACE_BEHIND: 'Client is behind. {0} < {1} - {2}'}
+    TRACE_SIZE = 4096
+    # The number of input updates to send per second.
+    SEND_RATE = 10
     def __init__(self):
         self.keyboard = NullKeyboard()
         self.renderer = NullRenderer()
@@ -48,6 +78,9 @@ class UDPClient:
         self.rewind_count = 0
         self.behind_count = 0
         self.past_count = 0
+        self.trace = TraceRing(UDPClient.TRACE_SIZE, UDPClient.TRACE_NAMES)
+        self.scheduler = TickScheduler()
+        self.next_send = 0.0
 
     def Handshake(self, svr, resend, timeout):
         '''Perform a handshake with the server. This must be done prior to 
@@ -154,6 +187,9 @@ class UDPClient:
             if not self.Handshake(svr, resend, timeout):
                 logger.info('Handshake failed.')
                 continue
+            # The step cache and fast mode are local settings.
+            self.conf.step_cache_size = user_conf.step_cache_size
+            self.conf.fast_mode = user_conf.fast_mode
             self.conf.Apply(e)
             logger.info('Starting game as player {0}.'.format(e.player_id))
             logger.debug('delay={0}, cool_down={1}'.format(e.buffer_delay,
@@ -166,6 +202,8 @@ class UDPClient:
             # To do: Apply user_conf without overriding server config.
             e.PlayAs(e.state, self, self.conf.start_time / 1000.0)
             logger.info('Game ended.')
+            self.trace.Dump(logger)
+            self.trace.Clear()
             sock.Close()
             return True
         logger.info('Failed to start game.')
@@ -203,7 +241,7 @@ class UDPClient:
             # The event was lost, so revert to the server state.
             # This will probably cause a hitch, but it's necessary to 
             # keep the states consistent.
-            logger.debug('Event {0} was lost.'.format(self.unacked_1))
+            self.trace.Record(UDPClient.TRACE_EVENT_LOST, self.unacked_1)
             self.unacked_1 = self.unacked_2
             self.unacked_2 = -1
             return 2
@@ -226,27 +264,26 @@ class UDPClient:
         '''
         if e.server == None:
             return
-        while True:
-            try:
-                evt = e.server.ReadEvent()
-            except Exception as ex:
-                logger.exception(e)
-                logger.info('Disconnecting from server and ending.')
-                e.server.Close()
-                e.server = None
-                e.EndGame(s)
-                break
-            if evt == None:
-                break
+        trace = self.trace
+        try:
+            events = e.server.ReadEvents()
+        except Exception as ex:
+            logger.exception(ex)
+            logger.info('Disconnecting from server and ending.')
+            e.server.Close()
+            e.server = None
+            e.EndGame(s)
+            return
+        for evt in events:
             if evt.event_type == EventType.STATE_UPDATE:
-                logger.info('Received state update {0}.'.format(evt.frame))
-                logger.debug(('\nplayer 1: {0}\nplayer 2: {1}\n' + 
-                'player 3: {2}').format(bin(evt.bits[0]),
-                    bin(evt.bits[1]), bin(evt.bits[2])))
+                trace.Record(UDPClient.TRACE_STATE_UPDATE, evt.frame, s.frame)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(('\nplayer 1: {0}\nplayer 2: {1}\n' + 
+                    'player 3: {2}').format(bin(evt.bits[0]),
+                        bin(evt.bits[1]), bin(evt.bits[2])))
                 if evt.frame < e.bitrec.frame - e.buffer_size:
-                    logger.info('Update too old.' + \
-                            '{0} < {1} - {2}'.format(evt.frame,
-                                e.bitrec.frame, e.buffer_size))
+                    trace.Record(UDPClient.TRACE_UPDATE_OLD, evt.frame,
+                            e.bitrec.frame, e.buffer_size)
                     self.old_count += 1
                     continue
                 if evt.frame < s.frame:
@@ -260,20 +297,21 @@ class UDPClient:
                 should_apply_state = self.ShouldApplyStateUpdate(e, s.frame,
                         evt.frame, evt.bits[e.player_id], size)
                 if should_apply_state == 2:
-                    logger.info('Handling lost event. Clearing bitrec.')
+                    trace.Record(UDPClient.TRACE_LOSS, s.frame)
                     e.bitrec.Clear()
                     self.loss_count += 1
                 if should_apply_state:
-                    logger.info('Applying state update.')
+                    trace.Record(UDPClient.TRACE_APPLY, evt.frame)
                     evt.Copy(s)
                     rec.available = 0
                     self.state_update_count += 1
                 else:
-                    logger.info('Rewind to oldest available frame.')
                     n = evt.frame % e.buffer_size
                     rewind_from = (start_frame - rec.available) % e.buffer_size
-                    evt.CopyExceptPlayer(rec.states[n], s.roles, e.player_id)
-                    rec.states[rewind_from].Copy(s)
+                    trace.Record(UDPClient.TRACE_REWIND, evt.frame,
+                            start_frame, rewind_from)
+                    rec.SaveExceptPlayer(n, evt, s.roles, e.player_id)
+                    rec.Restore(rewind_from, s)
                     e.bitrec.bits[3] = e.SetBit(e.bitrec.bits[3], n, 1,
                             e.buffer_size)
                     self.rewind_count += 1
@@ -355,58 +393,86 @@ class UDPClient:
         assert isinstance(frame_rate, int)
         assert frame_rate > 0
         assert frame_rate <= 32767
-        start_frame = s.frame
-        end_frame = start_frame + max_frame
-        timeout = 0.0
-        key_event = e.RoleToEvent(s.roles[e.player_id])
-        send_rate = 10
-        time_between_send = 1.0 / send_rate
-        next_send = 0.0
+        end_frame = s.frame + max_frame
+        self.next_send = 0.0
         msg = GameEvent()
+        sched = self.scheduler
+        sched.SetStart(start_time, frame_rate)
+        sel = selectors.DefaultSelector()
+        if e.server != None:
+            sel.register(e.server, selectors.EVENT_READ)
         while True:
             if s.frame >= end_frame:
                 break
-            now = time.time()
-            target_frame = e.GetCurrentFrame(start_time, frame_rate, now)
-            logger.debug('Playing from frome {0}, target {1}.'.format(s.frame,
-                target_frame))
-            should_send = self.HandleKeyboardEvents(e, e.bitrec, s.frame,
-                    e.buffer_delay, e.key_cool_down_time, e.buffer_size)
-            # Send bitrec to server.
-            if e.server != None and (now >= next_send or should_send):
-                msg.keybits = e.bitrec.bits[e.player_id]
-                msg.frame = e.bitrec.frame
-                next_send = now + time_between_send
-                logger.debug('Sending key {0}, {1}'.format(msg.frame,
-                    bin(msg.keybits)))
-                try:
-                    e.server.WriteEvent(msg)
-                except Exception as ex:
-                    logger.exception(ex)
-                    logger.info('Disconnecting from server and ending.')
-                    e.server.Close()
-                    e.server = None
-                    e.EndGame(s)
-            self.HandleServerEvents(e, s, e.rec, e.buffer_size)
-            e.UpdateBitRecordFrame(e.bitrec, max(e.bitrec.frame, target_frame),
+            now = sched.Now()
+            target_frame = max(0, sched.GetFrame(now))
+            self.PlayTick(e, s, now, target_frame, end_frame, msg)
+            if e.server == None and sel.get_map():
+                # The connection to the server was closed.
+                sel.close()
+                sel = selectors.DefaultSelector()
+            # Sleep until the next frame or send, or until a server event.
+            # Nothing is sent once the connection is closed, so next_send
+            # stays in the past.
+            deadline = sched.GetFrameTime(s.frame + 1)
+            if e.server != None:
+                deadline = min(deadline, self.next_send)
+            sched.WaitUntil(deadline, sel)
+        sel.close()
+
+    def PlayTick(self, e, s, now, target_frame, end_frame, msg):
+        '''Handle input and server events, and play up to target_frame.
+        Arguments:
+        e             -- The game engine.
+        s             -- The game state.
+        now           -- The monotonic time of the tick.
+        target_frame  -- The frame to play to.
+        end_frame     -- The frame to stop at.
+        msg           -- The GameEvent to send the input history in.
+        '''
+        trace = self.trace
+        trace.Record(UDPClient.TRACE_PLAY, s.frame, target_frame)
+        should_send = self.HandleKeyboardEvents(e, e.bitrec, s.frame,
+                e.buffer_delay, e.key_cool_down_time, e.buffer_size)
+        # Send bitrec to server.
+        if e.server != None and (now >= self.next_send or should_send):
+            msg.keybits = e.bitrec.bits[e.player_id]
+            msg.frame = e.bitrec.frame
+            self.next_send = now + 1.0 / UDPClient.SEND_RATE
+            trace.Record(UDPClient.TRACE_SEND_KEY, msg.frame)
+            try:
+                e.server.SendEvent(msg)
+            except Exception as ex:
+                logger.exception(ex)
+                logger.info('Disconnecting from server and ending.')
+                e.server.Close()
+                e.server = None
+                e.EndGame(s)
+        self.HandleServerEvents(e, s, e.rec, e.buffer_size)
+        e.UpdateBitRecordFrame(e.bitrec, max(e.bitrec.frame, target_frame),
+                e.buffer_size)
+        play_to = min(target_frame, end_frame, e.bitrec.frame)
+        if s.frame < e.bitrec.frame - e.buffer_size:
+            trace.Record(UDPClient.TRACE_BEHIND, s.frame, e.bitrec.frame,
                     e.buffer_size)
-            play_to = min(target_frame, end_frame, e.bitrec.frame)
-            if s.frame < e.bitrec.frame - e.buffer_size:
-                logger.debug('Client is behind.')
-                # bail out until server update.
-                # to do: reset unacked
-                s.frame = e.bitrec.frame - e.buffer_size
-                self.behind_count += 1
-            if s.frame < play_to:
-                e.PlayFromStateWithPlayer(s, e.bitrec, e.rec, play_to,
-                        e.player_id, e.buffer_size)
-            e.renderer.Render(s, s, 0, 0)
+            # bail out until server update.
+            # to do: reset unacked
+            e.PlayInputFree(s, e.bitrec.frame - e.buffer_size - s.frame,
+                    BitRecord())
+            self.behind_count += 1
+        if s.frame < play_to:
+            e.PlayFromStateWithPlayer(s, e.bitrec, e.rec, play_to,
+                    e.player_id, e.buffer_size)
+        e.renderer.Render(s, s, 0, 0)
 
     def PrintStats(self):
         logger.info(('old: {0} loss: {1} overwrite: {2} normal: {3} '
             'behind: {4} past: {5}').format(self.old_count,
                 self.loss_count, self.state_update_count, self.rewind_count,
                 self.behind_count, self.past_count))
+        logger.info('Dropped log records {0}'.format(
+            tplogger.getTPDroppedCount()))
+        logger.info(self.scheduler.GetJitterReport())
 
 if __name__ == '__main__':
     import argparse
@@ -418,7 +484,8 @@ if __name__ == '__main__':
     parser.add_argument('-i', '--interpolate', action='store_true',
             default=False, help='Enable interpolation')
     parser.add_argument('-b', '--buffersize', type=int, default=64,
-            help='Number of records to keep.')
+            help='Number of records to keep. The server\'s setting is used ' +
+            'in games.')
     parser.add_argument('--tries', type=int, default=60,
             help='The number of attempts to connect to the server.')
     parser.add_argument('--resend', type=int, default=9,
@@ -429,13 +496,25 @@ if __name__ == '__main__':
             help='Allow server to measure latency and clock.')
     parser.add_argument('--synctimeout', type=int, default=3,
             help='The timeout for RecvSync.')
+    parser.add_argument('--stepcache', type=int, default=0,
+            help='The capacity of the step cache (0 disables it).')
+    parser.add_argument('--loglevel', type=str, default='INFO',
+            help='The level of the log files, e.g. DEBUG or WARNING.')
+    parser.add_argument('--trace', type=int, default=UDPClient.TRACE_SIZE,
+            help='The number of trace records to keep for the log.')
+    parser.add_argument('--fast', default=False, action='store_true',
+            help='Skip the argument checks in the per-frame methods.')
     args = parser.parse_args()
     conf = GameConfig()
     conf.do_interpolate = args.interpolate
     conf.buffer_size = args.buffersize
     conf.do_sync = not args.nosync
     conf.sync_timeout = args.synctimeout
+    conf.step_cache_size = args.stepcache
+    conf.fast_mode = args.fast
+    tplogger.setTPLevel(args.loglevel)
     c = UDPClient()
+    c.trace = TraceRing(args.trace, UDPClient.TRACE_NAMES)
     from renderer import Renderer
     r = Renderer()
     # For now, nothing in server's conf affects renderer.
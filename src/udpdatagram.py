@@ -1,19 +1,32 @@
 import struct
 class UDPDatagram:
     '''The UDP datagram.
+    A datagram is the header followed by the payload, without padding. The
+    header starts with the version of the format. Datagrams of version 0 have
+    no version byte and are padded to V0_DATAGRAM bytes. They are still read,
+    and told apart by their size, since a datagram of the current version
+    that would be V0_DATAGRAM bytes is sent with an extra zero byte. See
+    GetSendSize().
 
     Attributes:
+    version -- The version of the format the datagram was read in.
     seq     -- The sequence number.
     ack     -- The last received datagram, or the remote sequence number.
     ackbits -- The ith bit acknowledges the (ack - i)th datagram.
     '''
-    HEADER = '!HHI'
-    MAX_DATAGRAM = 128
-    MAX_PAYLOAD = MAX_DATAGRAM - struct.calcsize(HEADER)
+    VERSION = 1
+    HEADER = '!BHHI'
+    HEADER_STRUCT = struct.Struct(HEADER)
+    HEADER_SIZE = HEADER_STRUCT.size
+    HEADER_V0 = '!HHI'
+    HEADER_V0_STRUCT = struct.Struct(HEADER_V0)
+    V0_DATAGRAM = 128
+    MAX_DATAGRAM = 512
+    MAX_PAYLOAD = MAX_DATAGRAM - HEADER_SIZE
     MAX_SEQ = (1 << 16)
-    FORMAT = HEADER + '{0}s'.format(MAX_PAYLOAD)
 
     def __init__(self):
+        self.version = UDPDatagram.VERSION
         self.seq = 0
         self.ack = 0
         self.ackbits = 0
@@ -28,9 +41,43 @@ class UDPDatagram:
         return not self == other
 
     def Serialize(self):
-        return struct.pack(self.FORMAT, self.seq, self.ack, self.ackbits, 
-                self.payload)
+        b = UDPDatagram.HEADER_STRUCT.pack(UDPDatagram.VERSION, self.seq,
+                self.ack, self.ackbits) + self.payload
+        return b + b'\0' * (UDPDatagram.GetSendSize(len(b)) - len(b))
+
+    @staticmethod
+    def GetSendSize(size):
+        '''Return the size to send a datagram of size bytes in, so that it
+        is not taken for a datagram of version 0. Events ignore the bytes
+        after them, so the padding is harmless.'''
+        if size == UDPDatagram.V0_DATAGRAM:
+            return size + 1
+        return size
+
+    @staticmethod
+    def PackHeaderInto(buf, offset, seq, ack, ackbits):
+        '''Write the header of a datagram into buf at offset.
+        Return value:
+        The offset of the payload.
+        '''
+        UDPDatagram.HEADER_STRUCT.pack_into(buf, offset, UDPDatagram.VERSION,
+                seq, ack, ackbits)
+        return offset + UDPDatagram.HEADER_SIZE
 
     def Deserialize(self, buf):
-        (self.seq, self.ack, self.ackbits,
-                self.payload) = struct.unpack(self.FORMAT, buf)
+        '''Read a datagram of the current version or of version 0.
+        The payload is a memoryview of buf, so it is not copied.
+        Raise ValueError for any other version, and struct.error if buf is
+        shorter than the header.'''
+        if len(buf) == UDPDatagram.V0_DATAGRAM:
+            (self.seq, self.ack, self.ackbits) = \
+                    UDPDatagram.HEADER_V0_STRUCT.unpack_from(buf)
+            self.version = 0
+            self.payload = memoryview(buf)[UDPDatagram.HEADER_V0_STRUCT.size:]
+            return
+        (self.version, self.seq, self.ack, self.ackbits) = \
+                UDPDatagram.HEADER_STRUCT.unpack_from(buf)
+        if self.version != UDPDatagram.VERSION:
+            raise ValueError('Unknown datagram version {0}'.format(
+                self.version))
+        self.payload = memoryview(buf)[UDPDatagram.HEADER_SIZE:]
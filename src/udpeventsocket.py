@@ -6,9 +6,12 @@ import time
 sys.path.append(os.path.abspath('src'))
 from eventtype import EventType
 from endgameevent import EndGameEvent
+from eventpool import EventPool
 from gameconfig import GameConfig
 from gameevent import GameEvent
 from gamestate import GameState
+from statecodec import StateCodec
+from statedelta import StateDelta
 import tplogger
 from tpmessage import TPMessage
 from udpsocket import UDPSocket
@@ -25,7 +28,27 @@ class UDPEventSocket:
     player_id          -- The player id of the peer if any.
     errlim             -- Number of consecutive send errors to suppress.
     errc               -- Number of consecutive send errors.
+    pools              -- The EventPool of each pooled event type.
+    send_deltas        -- If True, states are sent as deltas against the
+                          latest state the peer acknowledged.
+    sent_states        -- The StateDelta of the states sent.
+    received_states    -- The StateDelta of the states received, which the
+                          deltas of the peer are decoded against.
+    codec              -- The StateCodec states are sent and decoded with,
+                          or None to send them with GameState's encoding.
+                          It is set when a configuration is received.
     '''
+    # The class of each event type, and whether received events of the type
+    # are decoded into pooled instances. Configurations and handshakes are
+    # kept by their readers, so each of them gets a new instance.
+    DECODERS = {
+        EventType.STATE_UPDATE: (GameState, True),
+        EventType.KEYBOARD: (GameEvent, True),
+        EventType.END_GAME: (EndGameEvent, False),
+        EventType.CONFIGURE: (GameConfig, False),
+        EventType.HANDSHAKE: (TPMessage, False),
+    }
+
     def __init__(self, sock):
         '''
         Argument:
@@ -39,6 +62,14 @@ class UDPEventSocket:
         self.player_id = 0
         self.errlim = 5
         self.errc = 0
+        self.send_deltas = False
+        self.sent_states = StateDelta()
+        self.received_states = StateDelta()
+        self.codec = None
+        self.pools = {}
+        for (event_type, (cls, pooled)) in UDPEventSocket.DECODERS.items():
+            if pooled:
+                self.pools[event_type] = EventPool(cls)
 
     def fileno(self):
         '''Return the file descriptor of the socket.
@@ -49,7 +80,10 @@ class UDPEventSocket:
     def ReadEvent(self, timeout=0):
         '''Attempt to read an event for timeout seconds.
         An event is any object that implements GetSize(), Serialize(),
-        and Deserialize() and has the attribute event_type.
+        SerializeInto() and Deserialize() and has the attribute event_type.
+        Deserialize() must ignore bytes after the end of the event.
+        Events of a pooled type are only valid until the next call that
+        reads a datagram. See DECODERS.
         '''
         if self.should_read_buffer:
             self.should_read_buffer = False
@@ -58,30 +92,135 @@ class UDPEventSocket:
         if ready == []:
             return None
         datagram = self.sock.Recv()
-        evt_type = EventType()
-        evt_type.Deserialize(datagram.payload[:4])
-        if evt_type.event_type == EventType.STATE_UPDATE:
-            evt = GameState()
-        elif evt_type.event_type == EventType.KEYBOARD:
-            evt = GameEvent()
-        elif evt_type.event_type == EventType.END_GAME:
-            evt = EndGameEvent()
-        elif evt_type.event_type == EventType.CONFIGURE:
-            evt = GameConfig()
-        elif evt_type.event_type == EventType.HANDSHAKE:
-            evt = TPMessage()
-        else:
+        if datagram == None:
+            return None
+        self.ReleaseEvents()
+        evt = self.Decode(datagram)
+        if evt == None:
             return None
-        evt.Deserialize(datagram.payload[4:evt.GetSize()+4])
         self.buffered_event = evt
         return evt
 
+    def ReadEvents(self):
+        '''Read every pending event without waiting.
+        An event undone by UnreadEvent is returned first. Events of a pooled
+        type are only valid until the next read, as with ReadEvent.
+        Return value:
+        The list of events, oldest first.
+        '''
+        result = []
+        self.ReleaseEvents()
+        if self.should_read_buffer:
+            self.should_read_buffer = False
+            result.append(self.buffered_event)
+        for datagram in self.sock.RecvAll():
+            evt = self.Decode(datagram)
+            if evt != None:
+                result.append(evt)
+        if result != []:
+            self.buffered_event = result[-1]
+        return result
+
+    def ReleaseEvents(self):
+        '''Make the pooled events read so far available for reuse, except
+        an event undone by UnreadEvent.'''
+        keep = None
+        if self.should_read_buffer:
+            keep = self.buffered_event
+        for pool in self.pools.values():
+            pool.Release(keep)
+
+    def Decode(self, datagram):
+        '''Return the event in datagram, or None if its type is unknown or
+        it is a delta against a state that is not saved.'''
+        payload = datagram.payload
+        (event_type,) = EventType.STRUCT.unpack_from(payload)
+        if event_type == EventType.STATE_DELTA:
+            base = self.received_states.Find(
+                    GameState.GetDeltaBase(payload, EventType.SIZE))
+            if base == None:
+                logger.info('Dropping a delta of an unknown state.')
+                return None
+            evt = self.pools[EventType.STATE_UPDATE].Acquire()
+            evt.DeserializeDelta(payload, EventType.SIZE, base)
+            self.received_states.Save(datagram.seq, evt)
+            return evt
+        if event_type == EventType.STATE_PACKED:
+            return self.DecodePacked(datagram)
+        pool = self.pools.get(event_type)
+        if pool != None:
+            evt = pool.Acquire()
+        else:
+            entry = UDPEventSocket.DECODERS.get(event_type)
+            if entry == None:
+                return None
+            evt = entry[0]()
+        # Each event reads only its own size, since payloads of version 0
+        # are padded.
+        evt.Deserialize(payload, EventType.SIZE)
+        if event_type == EventType.STATE_UPDATE:
+            self.received_states.Save(datagram.seq, evt)
+        elif event_type == EventType.CONFIGURE:
+            self.codec = StateCodec(evt)
+        return evt
+
+    def DecodePacked(self, datagram):
+        '''Return the state in a datagram of a StateCodec, or None if there
+        is no codec or the state is a delta against a state that is not
+        saved.'''
+        if self.codec == None:
+            logger.info('Dropping a packed state before the configuration.')
+            return None
+        payload = datagram.payload
+        base = None
+        base_seq = StateCodec.GetBase(payload, EventType.SIZE, datagram.seq)
+        if base_seq != None:
+            base = self.received_states.Find(base_seq)
+            if base == None:
+                logger.info('Dropping a delta of an unknown state.')
+                return None
+        evt = self.pools[EventType.STATE_UPDATE].Acquire()
+        self.codec.Deserialize(payload, EventType.SIZE, evt, base)
+        self.received_states.Save(datagram.seq, evt)
+        return evt
+
     def UnreadEvent(self):
         '''Undo a ReadEvent.
         The next ReadEvent will return the unread event.
         '''
         self.should_read_buffer = True
 
+    def Write(self, evt):
+        '''Send evt in one datagram without waiting. If send_deltas is set,
+        a state is sent as a delta against the latest state the peer
+        acknowledged, and in full if there is none. If there is a codec,
+        states are encoded by it.
+        Return value:
+        The return value of UDPSocket.Write().
+        '''
+        if evt.event_type != EventType.STATE_UPDATE or \
+                not self.send_deltas and self.codec == None:
+            return self.sock.Write(evt)
+        seq = self.sock.seq
+        delta = self.sent_states
+        has_base = self.send_deltas and delta.FindAcked(self.sock)
+        if self.codec != None:
+            self.codec.state = evt
+            self.codec.seq = seq
+            self.codec.base = None
+            if has_base:
+                self.codec.base = delta.base
+                self.codec.base_seq = delta.base_seq
+            result = self.sock.Write(self.codec)
+        elif has_base:
+            delta.state = evt
+            result = self.sock.Write(delta)
+        else:
+            result = self.sock.Write(evt)
+        if self.send_deltas:
+            delta.Save(seq, evt)
+        return result
+
     def WriteEvent(self, evt, timeout=0.0, resend=1):
         '''Send the evt, suppressing self.errlim consecutive errors.
         This method will attempt to send at least once.
@@ -95,23 +234,24 @@ class UDPEventSocket:
         assert resend > 0
         if evt == None:
             return -1
-        b = evt.Serialize()
-        end_time = time.time() + timeout
+        end_time = time.monotonic() + timeout
         time_between_send = float(timeout) / resend
         next_send = 0.0
         did_send = False
-        logger.debug('timeout: {0} resend: {1} tbs: {2}'.format(timeout, 
-            resend, time_between_send))
+        logger.debug('timeout: %s resend: %s tbs: %s', timeout, resend,
+                time_between_send)
         while True:
-            now = time.time()
+            now = time.monotonic()
             if now < next_send:
-                continue
+                # end_time may have passed since the check below.
+                time.sleep(max(0.0, min(next_send, end_time) - now))
+                now = time.monotonic()
             next_send = now + time_between_send
             try:
                 (_, ready, _) = \
                     select.select([], [self.sock.sock], [], time_between_send)
                 if len(ready) > 0:
-                    self.sock.Send(b)
+                    self.Write(evt)
                     self.errc = 0
                     did_send = True
             except Exception as ex:
@@ -120,12 +260,16 @@ class UDPEventSocket:
                     raise ex
                 logger.info('Suppressing error')
                 logger.exception(ex)
-            if time.time() >= end_time:
+            if time.monotonic() >= end_time:
                 break
         if not did_send:
             return -1
         return 0
 
+    def SendEvent(self, evt):
+        '''Send evt once without waiting. See WriteEvent.'''
+        return self.WriteEvent(evt)
+
     def Close(self):
         self.sock.Close()
 
@@ -155,7 +299,9 @@ class UDPEventSocket:
         average_rtt = 0
         min_rtt = 1000000
         while time.time() < end_time:
-            if time.time() - last_send < time_between_send:
+            wait = min(last_send + time_between_send, end_time) - time.time()
+            if wait > 0:
+                time.sleep(wait)
                 continue
             # Expect up to time_between_send * sync_rate + 1 messages
             assert self.sock.seq - initial_seq <= timeout * sync_rate
@@ -168,7 +314,7 @@ class UDPEventSocket:
                         max(0, end_time - time.time()))
                 if ready == []:
                     continue
-                logger.debug('Sending seq {0}.'.format(msg.seq))
+                logger.debug('Sending seq %d.', msg.seq)
                 start_trip = time.time() 
                 last_send = start_trip
                 self.WriteEvent(msg)
@@ -240,7 +386,7 @@ class UDPEventSocket:
                 if ready == []:
                     continue
                 self.WriteEvent(reply)
-                logger.debug('Sent timestamp {0}.'.format(reply.timestamp))
+                logger.debug('Sent timestamp %d.', reply.timestamp)
             except Exception as e:
                 logger.exception(e)
                 return -1
@@ -18,6 +18,8 @@ from gameevent import GameEvent
 from gamerecord import GameRecord
 from nullrenderer import NullRenderer
 from nullkeyboard import NullKeyboard
+from stepcache import StepCache
+from tickscheduler import TickScheduler
 import tplogger
 logger = tplogger.getTPLogger('udpgameengine.log', logging.DEBUG)
 
@@ -48,9 +50,19 @@ class UDPGameEngine(object):
     paddle_flap_vel    -- The amount of paddle 'flap'.
     ball_flap_vel      -- The amount of ball 'flap'.
     post_game_time     -- Time in seconds to run engine after end of game.
+    play_frame         -- The step function used to replay frames. This is 
+                          PlayFrame or the result of SpecializePlayFrame.
+    step_cache         -- The StepCache used by PlayFrameCached, or None.
+    uncached_play_frame -- The step function wrapped by PlayFrameCached.
+    event_table        -- The key flags for each combination of player bits. 
+                          See GetEventTable.
+    event_table_roles  -- The roles event_table was made for.
+    fast_mode          -- Whether EnableFastMode has been called.
     '''
 
     K_SPACE = 32
+    PADDLE_TERM_VELOCITY = 16
+    BALL_TERM_VELOCITY = 32
     def __init__(self):
         self.state = GameState()
         self.renderer = NullRenderer()
@@ -72,6 +84,12 @@ class UDPGameEngine(object):
         self.paddle_flap_vel = -12
         self.ball_flap_vel = -8
         self.post_game_time = 30
+        self.play_frame = self.PlayFrame
+        self.step_cache = None
+        self.uncached_play_frame = None
+        self.event_table = None
+        self.event_table_roles = None
+        self.fast_mode = False
 
     def RoleToEvent(self, role):
         '''Convert role into its corresponding game event.
@@ -107,7 +125,7 @@ class UDPGameEngine(object):
         evt.score_2 = s.scores[2]
         for c in list(clients):
             try:
-                c.WriteEvent(evt)
+                c.SendEvent(evt)
             except Exception as e:
                 logger.exception(e)
                 c.Close()
@@ -118,8 +136,8 @@ class UDPGameEngine(object):
 
         Arguments:
         s -- the game state'''
-        PADDLE_TERM_VELOCITY = 16
-        BALL_TERM_VELOCITY   = 32
+        PADDLE_TERM_VELOCITY = UDPGameEngine.PADDLE_TERM_VELOCITY
+        BALL_TERM_VELOCITY   = UDPGameEngine.BALL_TERM_VELOCITY
 
         if s.paddle_left.vel_y < PADDLE_TERM_VELOCITY:
             s.paddle_left.vel_y += 1
@@ -249,6 +267,380 @@ class UDPGameEngine(object):
             self.ApplyCollision(s)
         s.frame += 1
         
+    def SpecializePlayFrame(self, s):
+        '''Build a step function with the same effect as PlayFrame, with the 
+        settings of the engine and the static objects of s folded in as 
+        constants. The walls, goals, paddle columns and object sizes are 
+        static, so collisions with them reduce to range comparisons.
+        The function must be rebuilt if any of these change.
+        Argument:
+        s -- A game state with the static objects configured.
+        Return value:
+        A function f(s, keys, bitrec) to use in place of PlayFrame.
+        '''
+        should_apply_gravity = self.should_apply_gravity
+        should_apply_collision = self.should_apply_collision
+        paddle_flap_vel = self.paddle_flap_vel
+        ball_flap_vel = self.ball_flap_vel
+        size = self.buffer_size
+        PADDLE_TERM_VELOCITY = UDPGameEngine.PADDLE_TERM_VELOCITY
+        BALL_TERM_VELOCITY = UDPGameEngine.BALL_TERM_VELOCITY
+        EVENT_FLAP_LEFT_PADDLE = GameEvent.EVENT_FLAP_LEFT_PADDLE
+        EVENT_FLAP_RIGHT_PADDLE = GameEvent.EVENT_FLAP_RIGHT_PADDLE
+        EVENT_FLAP_BALL = GameEvent.EVENT_FLAP_BALL
+        ROLE_BALL = GameState.ROLE_BALL
+
+        def Bounds(o, other):
+            '''The range of positions of o overlapping with other.'''
+            return (other.pos_x - other.half_width - o.half_width,
+                    other.pos_x + other.half_width + o.half_width,
+                    other.pos_y - other.half_height - o.half_height,
+                    other.pos_y + other.half_height + o.half_height)
+
+        ball = s.ball
+        (goal_left_x0, goal_left_x1, goal_left_y0, goal_left_y1) = \
+                Bounds(ball, s.goal_left)
+        (goal_right_x0, goal_right_x1, goal_right_y0, goal_right_y1) = \
+                Bounds(ball, s.goal_right)
+        (wall_top_x0, wall_top_x1, wall_top_y0, wall_top_y1) = \
+                Bounds(ball, s.ball_wall_top)
+        (wall_bottom_x0, wall_bottom_x1, wall_bottom_y0, wall_bottom_y1) = \
+                Bounds(ball, s.ball_wall_bottom)
+        # The paddles only move along y.
+        (left_x0, left_x1, _, _) = Bounds(ball, s.paddle_left)
+        left_reach = s.paddle_left.half_height + ball.half_height
+        (right_x0, right_x1, _, _) = Bounds(ball, s.paddle_right)
+        right_reach = s.paddle_right.half_height + ball.half_height
+        (x0, x1, left_top_y0, left_top_y1) = \
+                Bounds(s.paddle_left, s.paddle_wall_top)
+        left_top = x0 <= s.paddle_left.pos_x <= x1
+        (x0, x1, left_bottom_y0, left_bottom_y1) = \
+                Bounds(s.paddle_left, s.paddle_wall_bottom)
+        left_bottom = x0 <= s.paddle_left.pos_x <= x1
+        (x0, x1, right_top_y0, right_top_y1) = \
+                Bounds(s.paddle_right, s.paddle_wall_top)
+        right_top = x0 <= s.paddle_right.pos_x <= x1
+        (x0, x1, right_bottom_y0, right_bottom_y1) = \
+                Bounds(s.paddle_right, s.paddle_wall_bottom)
+        right_bottom = x0 <= s.paddle_right.pos_x <= x1
+        center_x = (s.goal_right.pos_x + s.goal_left.pos_x) // 2
+        center_y = (s.ball_wall_top.pos_y + s.ball_wall_bottom.pos_y) // 2
+
+        def PlayFrame(s, keys, bitrec):
+            ball = s.ball
+            left = s.paddle_left
+            right = s.paddle_right
+            if should_apply_gravity:
+                if left.vel_y < PADDLE_TERM_VELOCITY:
+                    left.vel_y += 1
+                if right.vel_y < PADDLE_TERM_VELOCITY:
+                    right.vel_y += 1
+                if ball.vel_y < BALL_TERM_VELOCITY:
+                    ball.vel_y += 1
+            if keys:
+                if keys & EVENT_FLAP_LEFT_PADDLE:
+                    left.vel_y = paddle_flap_vel
+                if keys & EVENT_FLAP_RIGHT_PADDLE:
+                    right.vel_y = paddle_flap_vel
+                if keys & EVENT_FLAP_BALL:
+                    ball.vel_y = ball_flap_vel
+            ball.pos_x += ball.vel_x
+            ball.pos_y += ball.vel_y
+            left.pos_y += left.vel_y
+            right.pos_y += right.vel_y
+            if not s.is_ended:
+                n = s.frame % size
+                if not (bitrec.bits[4] >> n) & 1:
+                    x = ball.pos_x
+                    y = ball.pos_y
+                    if (goal_left_x0 <= x <= goal_left_x1 and
+                            goal_left_y0 <= y <= goal_left_y1):
+                        s.scores[s.players[ROLE_BALL]] += 1
+                        bitrec.bits[4] |= 1 << n
+                    if (goal_right_x0 <= x <= goal_right_x1 and
+                            goal_right_y0 <= y <= goal_right_y1):
+                        s.scores[s.players[ROLE_BALL]] += 1
+                        bitrec.bits[4] |= 1 << n
+            if should_apply_collision:
+                if (left_x0 <= ball.pos_x <= left_x1 and
+                        -left_reach <= ball.pos_y - left.pos_y <= left_reach):
+                    ball.pos_x = left_x1
+                    ball.vel_x = - ball.vel_x
+                if (right_x0 <= ball.pos_x <= right_x1 and
+                        -right_reach <= ball.pos_y - right.pos_y <=
+                        right_reach):
+                    ball.pos_x = right_x0
+                    ball.vel_x = - ball.vel_x
+                if (wall_top_x0 <= ball.pos_x <= wall_top_x1 and
+                        wall_top_y0 <= ball.pos_y <= wall_top_y1):
+                    ball.pos_y = wall_top_y1
+                    ball.vel_y = - ball.vel_y
+                if (wall_bottom_x0 <= ball.pos_x <= wall_bottom_x1 and
+                        wall_bottom_y0 <= ball.pos_y <= wall_bottom_y1):
+                    ball.pos_y = wall_bottom_y0
+                    ball.vel_y = - ball.vel_y
+                if left_top and left_top_y0 <= left.pos_y <= left_top_y1:
+                    left.pos_y = left_top_y1
+                    left.vel_y = - left.vel_y
+                if right_top and right_top_y0 <= right.pos_y <= right_top_y1:
+                    right.pos_y = right_top_y1
+                    right.vel_y = - right.vel_y
+                if (left_bottom and
+                        left_bottom_y0 <= left.pos_y <= left_bottom_y1):
+                    left.pos_y = left_bottom_y0
+                    left.vel_y = - left.vel_y
+                if (right_bottom and
+                        right_bottom_y0 <= right.pos_y <= right_bottom_y1):
+                    right.pos_y = right_bottom_y0
+                    right.vel_y = - right.vel_y
+                if (goal_left_x0 <= ball.pos_x <= goal_left_x1 and
+                        goal_left_y0 <= ball.pos_y <= goal_left_y1):
+                    ball.pos_x = center_x
+                    ball.pos_y = center_y
+                    ball.vel_x = - ball.vel_x
+                    ball.vel_y = 0
+                if (goal_right_x0 <= ball.pos_x <= goal_right_x1 and
+                        goal_right_y0 <= ball.pos_y <= goal_right_y1):
+                    ball.pos_x = center_x
+                    ball.pos_y = center_y
+                    ball.vel_x = - ball.vel_x
+                    ball.vel_y = 0
+            s.frame += 1
+
+        return PlayFrame
+
+    def EnableStepCache(self, capacity):
+        '''Memoize the step function in a StepCache of the given capacity.
+        This must be called after play_frame is set.
+        Argument:
+        capacity -- The maximum number of steps to remember.
+        '''
+        self.step_cache = StepCache(capacity)
+        self.uncached_play_frame = self.play_frame
+        self.play_frame = self.PlayFrameCached
+
+    def EnableFastMode(self):
+        '''Replace the methods called per frame with variants that do not 
+        check their arguments. The arguments that stay fixed for a game are 
+        checked here once instead. The checked methods are kept for tests.
+        This must be called after the engine is configured.
+        Replays cost about the same either way, since the step function
+        dominates them. See profiling/fastmode_profile.py.
+        '''
+        assert isinstance(self.buffer_size, int)
+        assert 0 < self.buffer_size
+        assert self.rec.size == self.buffer_size
+        assert isinstance(self.player_id, int)
+        assert 0 <= self.player_id and self.player_id <= 2
+        self.SetBit = self.SetBitFast
+        self.GetBit = self.GetBitFast
+        self.RotateBits = self.RotateBitsFast
+        self.UpdateHistory = self.UpdateHistoryFast
+        self.IsAcked = self.IsAckedFast
+        self.PlayFromState = self.PlayFromStateFast
+        self.PlayFromStateWithPlayer = self.PlayFromStateWithPlayerFast
+        self.UpdateBitRecordBit = self.UpdateBitRecordBitFast
+        self.UpdateBitRecordFrame = self.UpdateBitRecordFrameFast
+        self.rec.RestoreExceptPlayer = self.rec.RestoreExceptPlayerFast
+        self.fast_mode = True
+
+    def PlayFrameCached(self, s, keys, bitrec):
+        '''Same as PlayFrame, except that the result is looked up in 
+        step_cache first. The key holds everything the step depends on: the 
+        packed dynamic state, the keys, the roles, whether the game has 
+        ended and whether a score was already counted for the frame.
+        '''
+        n = s.frame % self.buffer_size
+        scored = (bitrec.bits[4] >> n) & 1
+        key = (s.Pack(), keys, tuple(s.roles), s.is_ended, scored)
+        value = self.step_cache.Get(key)
+        if value == None:
+            score = s.scores[s.players[GameState.ROLE_BALL]]
+            self.uncached_play_frame(s, keys, bitrec)
+            self.step_cache.Put(key, (s.Pack(),
+                s.scores[s.players[GameState.ROLE_BALL]] - score))
+            return
+        (row, points) = value
+        s.UnpackFrom(row, 0)
+        if points > 0:
+            s.scores[s.players[GameState.ROLE_BALL]] += points
+            bitrec.bits[4] |= 1 << n
+
+    def Trajectory(self, pos, vel, frames, term):
+        '''Compute the motion along y of an object without input or 
+        collision.
+        Arguments:
+        pos    -- The position.
+        vel    -- The velocity.
+        frames -- The number of frames to move forward by.
+        term   -- The terminal velocity of the object.
+        Return value:
+        A tuple of the position and velocity after frames.
+        '''
+        if not self.should_apply_gravity or vel >= term:
+            return (pos + frames * vel, vel)
+        # The velocity grows by 1 per frame for m frames.
+        m = term - vel
+        if frames <= m:
+            return (pos + frames * vel + (frames * (frames + 1)) // 2,
+                    vel + frames)
+        return (pos + m * vel + (m * (m + 1)) // 2 + (frames - m) * term, term)
+
+    def FirstFrame(self, first, last, pred):
+        '''Binary search for the first frame in [first, last] satisfying a 
+        monotone predicate.
+        Return value:
+        The first frame satisfying pred, or last + 1 if there is none.
+        '''
+        last += 1
+        while first < last:
+            mid = (first + last) // 2
+            if pred(mid):
+                last = mid
+            else:
+                first = mid + 1
+        return first
+
+    def FirstContactY(self, pos, vel, frames, term, lo, hi):
+        '''Find the first frame in which an object moving along y without 
+        input or collision reaches lo or hi.
+        Arguments:
+        pos, vel -- The position and velocity of the object.
+        frames   -- The number of frames to search.
+        term     -- The terminal velocity of the object.
+        lo, hi   -- The object is in contact if its position is at most lo or 
+                    at least hi.
+        Return value:
+        A frame in [1, frames], or frames + 1 if there is no contact.
+        '''
+        # The velocity never decreases, so the position does not increase up
+        # to the frame turn and does not decrease after it.
+        if vel >= 0:
+            turn = 1
+        elif self.should_apply_gravity:
+            turn = min(-vel, frames)
+        else:
+            turn = frames
+        Y = self.Trajectory
+        if Y(pos, vel, 1, term)[0] >= hi:
+            return 1
+        down = self.FirstFrame(1, turn,
+                lambda i: Y(pos, vel, i, term)[0] <= lo)
+        if down <= turn:
+            return down
+        return self.FirstFrame(turn, frames,
+                lambda i: Y(pos, vel, i, term)[0] >= hi)
+
+    def FirstContactX(self, pos, vel, lo, hi):
+        '''Find the first frame in which an object moving along x with 
+        constant velocity is in [lo, hi].
+        Return value:
+        A frame of at least 1, or None if there is no contact.
+        '''
+        if vel == 0:
+            if lo <= pos and pos <= hi:
+                return 1
+            return None
+        if vel > 0:
+            i = max(1, -((pos - lo) // vel))
+        else:
+            i = max(1, -((hi - pos) // -vel))
+        if lo <= pos + i * vel and pos + i * vel <= hi:
+            return i
+        return None
+
+    def IsResting(self, o, ceiling, floor):
+        '''Check if o rests against a wall. With gravity, a resting object 
+        stays on the floor while its velocity alternates between 0 and -1 
+        every frame. Without gravity, it stays against either wall with zero 
+        velocity.
+        Arguments:
+        o       -- The game object.
+        ceiling -- The wall above o.
+        floor   -- The wall below o.
+        '''
+        if not self.should_apply_collision:
+            return False
+        on_floor = o.pos_y == floor.pos_y - floor.half_height - o.half_height
+        if self.should_apply_gravity:
+            return on_floor and (o.vel_y == 0 or o.vel_y == -1)
+        return o.vel_y == 0 and (on_floor or
+                o.pos_y == ceiling.pos_y + ceiling.half_height + o.half_height)
+
+    def MoveY(self, o, frames, term, ceiling, floor):
+        '''Move o along y by frames frames without input or contact, except 
+        for resting against a wall.
+        '''
+        if self.IsResting(o, ceiling, floor):
+            if self.should_apply_gravity and frames % 2 == 1:
+                o.vel_y = -1 - o.vel_y
+            return
+        (o.pos_y, o.vel_y) = self.Trajectory(o.pos_y, o.vel_y, frames, term)
+
+    def ContactFreeSpan(self, s, frames):
+        '''Count the frames that s can be played without input before any 
+        object could touch another. The count is conservative: the ball is 
+        treated as touching a paddle as soon as they overlap along x.
+        Arguments:
+        s      -- The game state.
+        frames -- The maximum number of frames.
+        Return value:
+        A number of frames in [0, frames].
+        '''
+        first = frames + 1
+        ball = s.ball
+        # The ball reaching a goal, or the x range of a paddle.
+        for o in (s.goal_left, s.goal_right, s.paddle_left, s.paddle_right):
+            reach = o.half_width + ball.half_width
+            i = self.FirstContactX(ball.pos_x, ball.vel_x, o.pos_x - reach,
+                    o.pos_x + reach)
+            if i != None:
+                first = min(first, i)
+        if self.should_apply_collision:
+            top = s.ball_wall_top
+            bottom = s.ball_wall_bottom
+            if not self.IsResting(ball, top, bottom):
+                first = min(first, self.FirstContactY(ball.pos_y, ball.vel_y,
+                    first - 1, UDPGameEngine.BALL_TERM_VELOCITY,
+                    top.pos_y + top.half_height + ball.half_height,
+                    bottom.pos_y - bottom.half_height - ball.half_height))
+            top = s.paddle_wall_top
+            bottom = s.paddle_wall_bottom
+            for o in (s.paddle_left, s.paddle_right):
+                if self.IsResting(o, top, bottom):
+                    continue
+                first = min(first, self.FirstContactY(o.pos_y, o.vel_y,
+                    first - 1, UDPGameEngine.PADDLE_TERM_VELOCITY,
+                    top.pos_y + top.half_height + o.half_height,
+                    bottom.pos_y - bottom.half_height - o.half_height))
+        return max(0, first - 1)
+
+    def PlayInputFree(self, s, frames, bitrec):
+        '''Move the game forward by frames frames without key input.
+        The result is the same as calling PlayFrame with no keys frames times.
+        Spans without contact are computed in one step, and only the frames 
+        around a contact are played one at a time.
+        Arguments:
+        s      -- The game state.
+        frames -- The number of frames to play.
+        bitrec -- Used for score double-count avoidance.
+        '''
+        assert 0 <= frames
+        end_frame = s.frame + frames
+        while s.frame < end_frame:
+            k = self.ContactFreeSpan(s, end_frame - s.frame)
+            if k == 0:
+                self.play_frame(s, GameEvent.EVENT_NO_OP, bitrec)
+                continue
+            s.ball.pos_x += k * s.ball.vel_x
+            self.MoveY(s.ball, k, UDPGameEngine.BALL_TERM_VELOCITY,
+                    s.ball_wall_top, s.ball_wall_bottom)
+            self.MoveY(s.paddle_left, k, UDPGameEngine.PADDLE_TERM_VELOCITY,
+                    s.paddle_wall_top, s.paddle_wall_bottom)
+            self.MoveY(s.paddle_right, k, UDPGameEngine.PADDLE_TERM_VELOCITY,
+                    s.paddle_wall_top, s.paddle_wall_bottom)
+            s.frame += k
+
     def GetCurrentFrame(self, start_time, frame_rate, now):
         '''Get the frame the server is on.
         Arguments:
@@ -277,6 +669,28 @@ class UDPGameEngine(object):
         result = (bits >> shift) | ((bits << (size-shift)) % valmax)
         return result
 
+    def RotateBitsFast(self, bits, shift, size):
+        '''Same as RotateBits, without checking the arguments.'''
+        return (bits >> shift) | ((bits << (size-shift)) & ((1 << size) - 1))
+
+    def WindowMask(self, start, count, size):
+        '''Make a mask of count consecutive bits starting at bit start and 
+        wrapping around at size. Since frame f is kept at bit f % size, this 
+        is the mask of count consecutive frames.
+        Arguments:
+        start -- The first bit of the mask.
+        count -- The number of bits. A count of at least size gives all bits, 
+                 and a count of at most 0 gives none.
+        size  -- The number of bits in a history.
+        '''
+        if count <= 0:
+            return 0
+        full = (1 << size) - 1
+        if count >= size:
+            return full
+        mask = ((1 << count) - 1) << start
+        return (mask | (mask >> size)) & full
+
     def UpdateHistory(self, frame, keybits, update_frame, update, size):
         ''' This method is intended to be used by a peer receiving key input 
         history to update its local state. The history is represented by a
@@ -300,11 +714,15 @@ class UDPGameEngine(object):
         '''
         assert isinstance(size, int)
         assert update_frame <= frame
-        # Rotate the oldest frame to the 0th bit.
-        rot_keybits = self.RotateBits(keybits, frame % size, size)
-        rot_update = self.RotateBits(update, update_frame % size, size)
-        result = rot_keybits | (rot_update >> (frame - update_frame))
-        return self.RotateBits(result, size - (frame % size), size)
+        return self.UpdateHistoryFast(frame, keybits, update_frame, update,
+                size)
+
+    def UpdateHistoryFast(self, frame, keybits, update_frame, update, size):
+        '''Same as UpdateHistory, without checking the arguments.'''
+        # Only the frames [frame - size, update_frame) of update are in both
+        # histories. Their bits are at the same positions in both.
+        return keybits | (update & self.WindowMask(frame % size,
+            size - (frame - update_frame), size))
 
     def BitsToEvent(self, state, bits):
         '''Convert bits to a game event.
@@ -321,6 +739,24 @@ class UDPGameEngine(object):
             evt |= self.RoleToEvent(state.roles[i]) * bits[i]
         return evt
 
+    def GetEventTable(self, roles):
+        '''Get the table converting the bits of the players to a game event.
+        Entry i is the event for the bits (i & 1, (i >> 1) & 1, (i >> 2) & 1)
+        of players 0, 1 and 2, as BitsToEvent would return. The table is 
+        rebuilt only when the roles change.
+        Argument:
+        roles -- The roles of the players.
+        '''
+        key = tuple(roles)
+        if key != self.event_table_roles:
+            self.event_table = [0] * 8
+            for i in range(0, 8):
+                for player_id in range(0, min(3, len(roles))):
+                    if (i >> player_id) & 1:
+                        self.event_table[i] |= self.RoleToEvent(roles[player_id])
+            self.event_table_roles = key
+        return self.event_table
+
     def SetBit(self, bits, n, b, size):
         '''
         Return value:
@@ -331,6 +767,10 @@ class UDPGameEngine(object):
         x = (bits & (1 << n)) >> n
         return bits ^ ((b ^ x) << n)
 
+    def SetBitFast(self, bits, n, b, size):
+        '''Same as SetBit, without checking the arguments.'''
+        return bits ^ ((b ^ ((bits >> n) & 1)) << n)
+
     def GetBit(self, bits, n):
         '''
         Returm value:
@@ -339,6 +779,31 @@ class UDPGameEngine(object):
         assert(n >= 0)
         return ((bits & (1 << n)) >> n)
 
+    def GetBitFast(self, bits, n):
+        '''Same as GetBit, without checking the arguments.'''
+        return (bits >> n) & 1
+
+    def EarliestBitFrame(self, bits, frame, size):
+        '''Find the earliest frame set in a history.
+        Arguments:
+        bits  -- A size-bit history of the frames [frame - size, frame).
+        frame -- The frame after the last in bits.
+        size  -- The size of bits.
+
+        Return value:
+        The earliest frame whose bit is 1, or -1 if no bit is set.
+        '''
+        assert isinstance(size, int)
+        assert 0 <= frame
+        if bits == 0:
+            return -1
+        # The bits from frame % size up hold the older frames.
+        r = frame % size
+        old = bits >> r
+        if old:
+            return max(0, frame - size + (old & -old).bit_length() - 1)
+        return max(0, frame - r + (bits & -bits).bit_length() - 1)
+
     def IsAcked(self, frame, history, history_frame, size):
         '''
         Arguments:
@@ -354,13 +819,17 @@ class UDPGameEngine(object):
         assert isinstance(size, int)
         assert frame >= 0
         assert history_frame >= 0
+        return self.IsAckedFast(frame, history, history_frame, size)
+
+    def IsAckedFast(self, frame, history, history_frame, size):
+        '''Same as IsAcked, without checking the arguments.'''
         if frame >= history_frame:
             # Too recent.
             return False
         if history_frame - frame > size:
             # Too old to tell.
             return False
-        return self.GetBit(history, frame % size) == 1
+        return (history >> (frame % size)) & 1 == 1
 
     def PlayFromState(self, state, bitrec, rec, play_to, size):
         '''
@@ -383,33 +852,54 @@ class UDPGameEngine(object):
         assert play_to <= bitrec.frame
         assert state.frame >= bitrec.frame - size
         assert rec.size == size
+        self.PlayFromStateFast(state, bitrec, rec, play_to, size)
+        assert state.frame == play_to
+
+    def PlayFromStateFast(self, state, bitrec, rec, play_to, size):
+        '''Same as PlayFromState, without checking the arguments.'''
         start_frame = state.frame
+        table = self.GetEventTable(state.roles)
+        (bits_0, bits_1, bits_2) = bitrec.bits[0:3]
         for i in range(state.frame, play_to):
             n = i % size
-            state.Copy(rec.states[n])
-            evt = self.BitsToEvent(state, [self.GetBit(bitrec.bits[0], n),
-                self.GetBit(bitrec.bits[1], n),
-                self.GetBit(bitrec.bits[2], n)])
-            self.PlayFrame(state, evt, bitrec)
+            rec.Save(n, state)
+            self.play_frame(state, table[((bits_0 >> n) & 1) |
+                (((bits_1 >> n) & 1) << 1) | (((bits_2 >> n) & 1) << 2)],
+                bitrec)
         rec.available = play_to - start_frame
-        assert state.frame == play_to
     
     def PlayFromStateWithPlayer(self, state, bitrec, rec, play_to, player_id,
             size):
         '''Same as PlayFromState, except if a frame is flagged in bits[4],
         the state of player_id is not overwritten by the record.
         '''
+        assert state != None
+        assert bitrec != None
+        assert rec != None
+        assert isinstance(size, int)
+        assert isinstance(player_id, int)
+        assert 0 <= player_id and player_id <= 2
+        assert state.frame <= play_to
+        assert rec.size == size
+        self.PlayFromStateWithPlayerFast(state, bitrec, rec, play_to,
+                player_id, size)
+        assert state.frame == play_to
+
+    def PlayFromStateWithPlayerFast(self, state, bitrec, rec, play_to,
+            player_id, size):
+        '''Same as PlayFromStateWithPlayer, without checking the arguments.
+        '''
         rec.available = play_to - state.frame
+        table = self.GetEventTable(state.roles)
+        (bits_0, bits_1, bits_2, bits_3) = bitrec.bits[0:4]
         for i in range(state.frame, play_to):
             n = i % size
-            if self.GetBit(bitrec.bits[3], n):
-                rec.states[n].CopyExceptPlayer(state, state.roles, player_id)
-            state.Copy(rec.states[n])
-            evt = self.BitsToEvent(state, [self.GetBit(bitrec.bits[0], n),
-                self.GetBit(bitrec.bits[1], n),
-                self.GetBit(bitrec.bits[2], n)])
-            self.PlayFrame(state, evt, bitrec)
-        assert state.frame == play_to
+            if (bits_3 >> n) & 1:
+                rec.RestoreExceptPlayerFast(n, state, state.roles, player_id)
+            rec.Save(n, state)
+            self.play_frame(state, table[((bits_0 >> n) & 1) |
+                (((bits_1 >> n) & 1) << 1) | (((bits_2 >> n) & 1) << 2)],
+                bitrec)
 
     def UpdateBitRecordBit(self, bitrec, frame, history, player_id, size):
         '''
@@ -423,6 +913,10 @@ class UDPGameEngine(object):
         assert player_id >= 0
         assert player_id < len(bitrec.bits)
         assert size >= 0
+        self.UpdateBitRecordBitFast(bitrec, frame, history, player_id, size)
+
+    def UpdateBitRecordBitFast(self, bitrec, frame, history, player_id, size):
+        '''Same as UpdateBitRecordBit, without checking the arguments.'''
         if frame <= bitrec.frame:
             bitrec.bits[player_id] = self.UpdateHistory(bitrec.frame,
                     bitrec.bits[player_id], frame, history, size)
@@ -451,14 +945,19 @@ class UDPGameEngine(object):
         assert 0 <= frame
         assert bitrec.frame <= frame
         assert 0 < size
-        MAX = 1 << size
+        self.UpdateBitRecordFrameFast(bitrec, frame, size)
+
+    def UpdateBitRecordFrameFast(self, bitrec, frame, size):
+        '''Same as UpdateBitRecordFrame, without checking the arguments.'''
+        shift = frame - bitrec.frame
+        if shift == 0:
+            return
+        # The bits of the frames [bitrec.frame, frame) now stand for new 
+        # frames, so clear them.
+        keep = ~self.WindowMask(bitrec.frame % size, shift, size)
+        bits = bitrec.bits
         for i in range(0,5):
-            r = frame % size
-            rot = self.RotateBits(bitrec.bits[i], r, size)
-            shift = frame - bitrec.frame
-            rot = (rot << shift) % MAX
-            bitrec.bits[i] = self.RotateBits(rot, (size - (r - shift)) % size,
-                    size)
+            bits[i] &= keep
         bitrec.frame = frame
 
     def RotateRoles(self, s):
@@ -471,6 +970,7 @@ class UDPGameEngine(object):
         s.roles = tmp
         for player_id in range(0, len(s.roles)):
             s.players[s.roles[player_id]] = player_id
+        self.GetEventTable(s.roles)
 
     def PlayAs(self, s, player, start_time):
         '''
@@ -481,29 +981,44 @@ class UDPGameEngine(object):
         start_time -- Time to start the game, in seconds since the epoch.
         '''
         assert s != None
-        rotation_length = s.rotation_length
         frame_rate = s.frames_per_sec 
-        rounds = s.rounds
-        # Busy wait until start time
+        # Sleep until start time
         logger.info('Starting game at {0}: Now {1}'.format(start_time, 
             time.time()))
-        while time.time() < start_time:
-            pass
-        for i in range(0, rounds):
+        sched = TickScheduler()
+        sched.SetStart(start_time, frame_rate)
+        while sched.Now() < sched.start:
+            sched.WaitUntil(sched.start)
+        for rotation_length in self.Rotations(s):
+            player.PlayFrames(self, s, float(start_time), rotation_length,
+                    frame_rate) 
+        self.FinishGame(s, player)
+        # Keep the game running for a bit, to show the final score.   
+        player.PlayFrames(self, s, start_time, 
+                frame_rate * self.post_game_time, frame_rate)
+
+    def Rotations(self, s):
+        '''Yield the number of frames of each rotation of the game, and
+        rotate the roles after each.
+        Argument:
+        s -- The GameState.
+        '''
+        for i in range(0, s.rounds):
             logger.debug('starting round')
             for i in range(0, 3):
-                logger.debug('starting rotation, {0} frames.'.format(
-                    rotation_length))
-                player.PlayFrames(self, s, float(start_time), rotation_length,
-                        frame_rate) 
+                logger.debug('starting rotation, %d frames.', s.rotation_length)
+                yield s.rotation_length
                 self.RotateRoles(s)
+
+    def FinishGame(self, s, player):
+        '''End the game played by player and report the statistics.'''
         if self.is_server:
             self.SendEndGameEvent(self.clients, s)
         self.EndGame(s)
         player.PrintStats()
-        # Keep the game running for a bit, to show the final score.   
-        player.PlayFrames(self, s, start_time, 
-                frame_rate * self.post_game_time, frame_rate)
+        if self.step_cache != None:
+            logger.info('Step cache hits {0} misses {1}'.format(
+                self.step_cache.hits, self.step_cache.misses))
 
     def PlayFrames(self, e, s, start_time, max_frame, frame_rate):
         ''' 
@@ -6,12 +6,17 @@ import select
 import sys
 import time
 sys.path.append(os.path.abspath('src'))
+from bitrecord import BitRecord
 from endgameevent import EndGameEvent
+from eventselector import EventSelector
 from eventtype import EventType
 from gameconfig import GameConfig
 from udpgameengine import UDPGameEngine
 import tplogger
+from statecodec import StateCodec
 from tpmessage import TPMessage
+from tickscheduler import TickScheduler
+from tracering import TraceRing
 from udpeventsocket import UDPEventSocket
 from udpsocket import UDPSocket
 logger = tplogger.getTPLogger('udpserver.log', logging.DEBUG)
@@ -23,12 +28,40 @@ class UDPServer:
     buffer_time    -- The time in msec between invitations and game start.
     server_behind_count -- The number of times the server was significantly
                             behind schedule.
+    replay_count   -- The number of frames resimulated after a rewind.
+    unchanged_count -- The number of key events that did not change the
+                       input history and so caused no rewind.
+    coalesced_count -- The number of replayed frames saved by rewinding once 
+                       for all key events received in an iteration.
+    trace          -- The TraceRing of the game loop. It is dumped to the log
+                      at debug level when a game ends.
+    scheduler      -- The TickScheduler of PlayFrames.
     '''
+    # Trace codes. See TRACE_NAMES for the meaning of the arguments.
+    TRACE_KEY_EVENT = 1
+    TRACE_KEY_OLD = 2
+    TRACE_KEY_EARLY = 3
+    TRACE_BUG = 4
+    TRACE_BEHIND = 5
+    TRACE_SEND = 6
+    TRACE_NAMES = {
+        TRACE_KEY_EVENT: 'Received key event {0} from player {1}.',
+        TRACE_KEY_OLD: 'Event {0} too old to be effective at {1}.',
+        TRACE_KEY_EARLY: 'Event {0} too early at {1}. Ignoring.',
+        TRACE_BUG: 'bug {0} < {1} - {2}.',
+        TRACE_BEHIND: 'Server too far behind. {0}, {1}. Forcing catch-up.',
+        TRACE_SEND: 'Sending frame {0}.'}
+    TRACE_SIZE = 4096
     def __init__(self):
         self.game_start_time = 0.0
         self.send_rate = 15
         self.buffer_time = 5000
         self.server_behind_count = 0
+        self.replay_count = 0
+        self.unchanged_count = 0
+        self.coalesced_count = 0
+        self.trace = TraceRing(UDPServer.TRACE_SIZE, UDPServer.TRACE_NAMES)
+        self.scheduler = TickScheduler()
 
     def AcceptN(self, svr, socks, n, timeout):
         '''Accept until socks has n UDPEventSocket clients.
@@ -60,6 +93,9 @@ class UDPServer:
             for c in list(conns):
                 conf.player_id = player_id
                 c.player_id = player_id
+                c.send_deltas = conf.do_delta
+                if conf.do_pack:
+                    c.codec = StateCodec(conf)
                 status = c.WriteEvent(conf, send_time, resend)
                 if status != 0:
                     conns.remove(c)
@@ -126,6 +162,56 @@ class UDPServer:
             return 1
         return 0
 
+    def Rewind(self, e, s, frame):
+        '''Set s back to the start of frame using the game record.
+        If frame is not in the record, s is set back to the oldest frame in 
+        the bit record.
+        Arguments:
+        e     -- The GameEngine.
+        s     -- The GameState.
+        frame -- The frame to rewind to. This must be before s.frame.
+        '''
+        assert frame < s.frame
+        idx = frame % e.buffer_size
+        if frame < e.bitrec.frame - e.buffer_size or \
+                e.rec.GetFrame(idx) != frame:
+            # Set s back buffer_size frames.
+            idx = e.bitrec.frame % e.buffer_size
+            if e.bitrec.frame < e.buffer_size:
+                idx = 0
+        frame = s.frame
+        e.rec.Restore(idx, s)
+        self.replay_count += frame - s.frame
+
+    def MergeKeyboardEvent(self, e, evt, player_id, frame):
+        '''Merge the key history of evt into e.bitrec.
+        Arguments:
+        e         -- The GameEngine.
+        evt       -- The GameEvent received from player_id.
+        player_id -- The sender of evt.
+        frame     -- The current frame of the server.
+        Return value:
+        The earliest frame whose input changed, or -1 if the history did not 
+        change or evt was ignored.
+        '''
+        self.trace.Record(UDPServer.TRACE_KEY_EVENT, evt.frame, player_id)
+        if evt.frame < frame - e.buffer_size:
+            self.trace.Record(UDPServer.TRACE_KEY_OLD, evt.frame, frame)
+            return -1
+        if frame < evt.frame + 1 - e.buffer_size:
+            self.trace.Record(UDPServer.TRACE_KEY_EARLY, evt.frame, frame)
+            return -1
+        e.UpdateBitRecordFrame(e.bitrec, max(e.bitrec.frame, evt.frame+1),
+                e.buffer_size)
+        old_bits = e.bitrec.bits[player_id]
+        e.UpdateBitRecordBit(e.bitrec, evt.frame, evt.keybits, player_id,
+                e.buffer_size)
+        changed = e.EarliestBitFrame(old_bits ^ e.bitrec.bits[player_id],
+                e.bitrec.frame, e.buffer_size)
+        if changed < 0:
+            self.unchanged_count += 1
+        return changed
+
     def PlayFrames(self, e, s, start_time, max_frame, frame_rate):
         '''
         Play max_frame frames.
@@ -143,83 +229,131 @@ class UDPServer:
         assert e.rec != None
         assert isinstance(start_time, float)
         assert frame_rate > 0.0
-        start_frame = s.frame
-        end_frame = start_frame + max_frame
+        end_frame = s.frame + max_frame
+        sched = self.scheduler
+        sched.SetStart(start_time, frame_rate)
         next_send = 0.0
-        timeout = 0.0
+        sel = EventSelector(e.clients)
         while True:
-            now = time.time()
+            now = sched.Now()
             if s.frame >= end_frame:
                 break
-            initial_frame = s.frame
+            batch = sel.Read()
+            for c in sel.failed:
+                c.Close()
+                e.clients.remove(c)
             # The minimum frame of s at the end of this iteration.
-            target_frame = min(e.GetCurrentFrame(start_time, frame_rate, now),
-                    end_frame)
-            should_send = False
-            for c in list(e.clients):
-                evt = None
-                try:
-                    evt = c.ReadEvent()
-                except Exception as ex:
-                    logger.exception(ex)
-                    c.Close()
-                    e.clients.remove(c)
-                if evt == None:
-                    continue
-                if evt.event_type == EventType.KEYBOARD:
-                    logger.debug('Received key event {0}.'.format( evt.frame))
-                    if evt.frame < initial_frame - e.buffer_size:
-                        logger.debug('Event too old to be effective.')
-                        continue
-                    if initial_frame < evt.frame + 1 - e.buffer_size:
-                        logger.info('Event too early. Ignoring.')
-                        continue
-                    e.UpdateBitRecordFrame(e.bitrec, 
-                            max(e.bitrec.frame, evt.frame+1), e.buffer_size)
-                    e.UpdateBitRecordBit(e.bitrec, evt.frame, evt.keybits,
-                            c.player_id, e.buffer_size)
-                    # Rewind. Set s back buffer_size frames.
-                    idx = e.bitrec.frame % e.buffer_size
-                    if e.bitrec.frame < e.buffer_size:
-                        idx = 0
-                    e.rec.states[idx].Copy(s)
-                    should_send = True
-                    assert s.frame <= initial_frame
-            if s.frame < e.bitrec.frame - e.buffer_size:
-                # BUG: This is not meant to happen.
-                logger.debug('bug {0} < {1} - {2}.'.format(s.frame,
-                    e.bitrec.frame, e.buffer_size))
-                # Forcefully set the frame to allow PlayFromState to work. 
-                s.frame = e.bitrec.frame - e.buffer_size
-            if s.frame < e.bitrec.frame:
-                # Play everything up to the record.
-                e.PlayFromState(s, e.bitrec, e.rec, e.bitrec.frame, 
-                        e.buffer_size)
-            if s.frame < target_frame:
-                e.UpdateBitRecordFrame(e.bitrec, target_frame, e.buffer_size)
-                if s.frame < target_frame - e.buffer_size:
-                    logger.debug(('Server too far behind. {0}, {1}. '
-                    'Forcing catch-up.').format(s.frame, target_frame))
-                    s.frame = target_frame - e.buffer_size
-                    e.bitrec.Clear()
-                    self.server_behind_count += 1
-                e.PlayFromState(s, e.bitrec, e.rec, target_frame, 
-                        e.buffer_size)
-            # Send state and bitrec to clients.
-            s.bits = e.bitrec.bits
+            target_frame = min(max(0, sched.GetFrame(now)), end_frame)
+            should_send = self.PlayTick(e, s, batch, target_frame)
             if next_send < now or should_send:
-                next_send = time.time() + (1.0/self.send_rate)
-                for c in list(e.clients):
-                    try:
-                        logger.debug('Sending frame {0}.'.format(s.frame))
-                        c.WriteEvent(s)
-                    except Exception as ex:
-                        logger.exception(ex)
-                        c.Close()
-                        e.clients.remove(c)
+                next_send = sched.Now() + (1.0/self.send_rate)
+                self.SendState(e, s, sel)
+            # Sleep until the next frame or send, or until a client event.
+            sched.WaitUntil(min(sched.GetFrameTime(s.frame + 1), next_send),
+                    sel.selector)
+        sel.Close()
+
+    def PlayTick(self, e, s, batch, target_frame):
+        '''Merge a batch of client events and play up to target_frame.
+        Arguments:
+        e            -- The GameEngine.
+        s            -- The GameState.
+        batch        -- The list of (client, evt) pairs received.
+        target_frame -- The minimum frame of s on return.
+        Return value:
+        True if an event changed the input history, so the state should be 
+        sent right away.
+        '''
+        initial_frame = s.frame
+        should_send = False
+        # The earliest changed frame, and the sum of the rewinds the 
+        # events would have needed separately.
+        rewind_to = initial_frame
+        rewind_sum = 0
+        for (c, evt) in batch:
+            if evt.event_type == EventType.KEYBOARD:
+                changed = self.MergeKeyboardEvent(e, evt, c.player_id,
+                        initial_frame)
+                if changed < 0:
+                    continue
+                should_send = True
+                if changed < initial_frame:
+                    rewind_sum += initial_frame - changed
+                    rewind_to = min(rewind_to, changed)
+        # Rewind once for all the events of this iteration.
+        if rewind_to < s.frame:
+            self.Rewind(e, s, rewind_to)
+            self.coalesced_count += rewind_sum - (initial_frame - rewind_to)
+            assert s.frame <= initial_frame
+        if s.frame < e.bitrec.frame - e.buffer_size:
+            # BUG: This is not meant to happen.
+            self.trace.Record(UDPServer.TRACE_BUG, s.frame,
+                    e.bitrec.frame, e.buffer_size)
+            # Forcefully set the frame to allow PlayFromState to work. 
+            s.frame = e.bitrec.frame - e.buffer_size
+        if s.frame < e.bitrec.frame:
+            # Play everything up to the record.
+            e.PlayFromState(s, e.bitrec, e.rec, e.bitrec.frame, 
+                    e.buffer_size)
+        if s.frame < target_frame:
+            e.UpdateBitRecordFrame(e.bitrec, target_frame, e.buffer_size)
+            if s.frame < target_frame - e.buffer_size:
+                self.trace.Record(UDPServer.TRACE_BEHIND, s.frame,
+                        target_frame)
+                # Skip ahead without input, since the inputs of the
+                # skipped frames are no longer in the record.
+                e.PlayInputFree(s, target_frame - e.buffer_size - s.frame,
+                        BitRecord())
+                e.bitrec.Clear()
+                self.server_behind_count += 1
+            e.PlayFromState(s, e.bitrec, e.rec, target_frame, 
+                    e.buffer_size)
+        s.bits = e.bitrec.bits
+        return should_send
+
+    def ReadClients(self, e):
+        '''Read every pending event of the clients without waiting. Clients
+        that fail are closed and removed.
+        Return value:
+        The list of (client, evt) pairs.
+        '''
+        batch = []
+        for c in list(e.clients):
+            try:
+                for evt in c.ReadEvents():
+                    batch.append((c, evt))
+            except Exception as ex:
+                logger.exception(ex)
+                c.Close()
+                e.clients.remove(c)
+        return batch
+
+    def SendState(self, e, s, sel=None):
+        '''Send s and its input histories to the clients. Clients that fail
+        are closed and removed.
+        Arguments:
+        e   -- The GameEngine.
+        s   -- The GameState.
+        sel -- The EventSelector of the clients, if any.
+        '''
+        self.trace.Record(UDPServer.TRACE_SEND, s.frame)
+        for c in list(e.clients):
+            try:
+                c.SendEvent(s)
+            except Exception as ex:
+                logger.exception(ex)
+                if sel != None:
+                    sel.Unregister(c)
+                c.Close()
+                e.clients.remove(c)
 
     def PrintStats(self):
         logger.info('\nServer behind {0}'.format(self.server_behind_count))
+        logger.info('Replayed {0} unchanged {1} coalesced {2}'.format(
+            self.replay_count, self.unchanged_count, self.coalesced_count))
+        logger.info('Dropped log records {0}'.format(
+            tplogger.getTPDroppedCount()))
+        logger.info(self.scheduler.GetJitterReport())
 
     def Run(self, sock, upnp, conf, tries, timeout):
         '''
@@ -278,6 +412,8 @@ class UDPServer:
             conf.Apply(e)
             e.PlayAs(e.state, self, self.game_start_time / 1000.0)
             logger.info('Game ended. Exiting.')
+            self.trace.Dump(logger)
+            self.trace.Clear()
             sock.Close()
             for c in clients:
                 c.Close()
@@ -312,6 +448,10 @@ if __name__ == '__main__':
             help='Number of duplicates to send in handshake')
     parser.add_argument('--nosync', default=False, action='store_true',
             help='Measure latency and clock of clients.')
+    parser.add_argument('--nodelta', default=False, action='store_true',
+            help='Send every state in full instead of as a delta.')
+    parser.add_argument('--nopack', default=False, action='store_true',
+            help='Send states without bit-packing them.')
     parser.add_argument('--synctimeout', type=int, default=2,
             help='Duration of sampling for Sync()')
     parser.add_argument('--syncrate', type=int, default=5,
@@ -322,8 +462,21 @@ if __name__ == '__main__':
             help='Minimum frames between events.')
     parser.add_argument('--ups', type=int, default=10,
             help='The number of updates to send per second.')
+    parser.add_argument('-b', '--buffersize', type=int, default=64,
+            help='The number of frames of input history to keep (at most ' +
+            '{0}).'.format(GameConfig.MAX_BUFFER_SIZE))
+    parser.add_argument('--stepcache', type=int, default=0,
+            help='The capacity of the step cache (0 disables it).')
+    parser.add_argument('--loglevel', type=str, default='INFO',
+            help='The level of the log files, e.g. DEBUG or WARNING.')
+    parser.add_argument('--trace', type=int, default=UDPServer.TRACE_SIZE,
+            help='The number of trace records to keep for the log.')
+    parser.add_argument('--fast', default=False, action='store_true',
+            help='Skip the argument checks in the per-frame methods.')
     args = parser.parse_args()
+    tplogger.setTPLevel(args.loglevel)
     s = UDPServer()
+    s.trace = TraceRing(args.trace, UDPServer.TRACE_NAMES)
     conf = GameConfig()
     conf.player_size = args.players
     conf.game_length = args.time
@@ -333,9 +486,14 @@ if __name__ == '__main__':
     conf.buffer_delay = args.delay
     conf.resend = args.resend
     conf.do_sync = not args.nosync
+    conf.do_delta = not args.nodelta
+    conf.do_pack = not args.nopack
     conf.sync_timeout = args.synctimeout
     conf.sync_rate = args.syncrate
     conf.cool_down = args.cooldown
+    conf.step_cache_size = args.stepcache
+    conf.fast_mode = args.fast
+    conf.buffer_size = args.buffersize
     s.buffer_time = args.buffertime
     s.send_rate = args.ups
     sock = UDPSocket()
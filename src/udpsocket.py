@@ -19,18 +19,40 @@ class UDPSocket:
     seq       -- The number of datagrams sent (16 bits).
     ack       -- The number of acknowledged datagrams (16 bits).
     ackbits   -- Acknowledgement of the previous 32 datagrams. (32 bits).
+    peer_ack     -- The latest ack received from the peer.
+    peer_ackbits -- The ackbits received with peer_ack. A peer_ack and
+                    peer_ackbits of 0 acknowledge nothing, since they are
+                    those of a peer that has not received anything.
     should_ignore_old -- If True, ignore datagrams earlier than the latest ack.
+    prefix    -- The bytes sent before each datagram. A single-port server
+                 gives each connection an ID to send here.
+    send_buf  -- The buffer datagrams are packed into before sending.
+    recv_buf  -- The buffer Recv() receives into.
     '''
     MAX_TIME_TO_LIVE = 60
+    # Read without blocking where the platform supports it.
+    MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
     GUID_1 = b'0e27b7418ee54d648b20dd82dc53905b'
     GUID_3 = b'4200150f5d5a46a283483cc501f395e4'
+    # The reply to GUID_1 is the port to connect to, followed by the
+    # connection ID if the server serves all connections from one port.
+    PORT_FORMAT = '!H'
+    MUX_FORMAT = '!HI'
+    CONN_ID_FORMAT = '!I'
+    CONN_ID_STRUCT = struct.Struct(CONN_ID_FORMAT)
     def __init__(self):
         self.sock = None
         self.ttl = 0
         self.seq = 0
         self.ack = 0
         self.ackbits = 0
+        self.peer_ack = 0
+        self.peer_ackbits = 0
         self.should_ignore_old = False
+        self.prefix = b''
+        self.send_buf = bytearray(UDPSocket.CONN_ID_STRUCT.size +
+                UDPDatagram.MAX_DATAGRAM)
+        self.recv_buf = bytearray(UDPDatagram.MAX_DATAGRAM)
 
     @staticmethod
     def Pair():
@@ -74,14 +96,64 @@ class UDPSocket:
         Return value:
         True if this method succeeded.
         '''
-        assert len(payload) <= UDPDatagram.MAX_PAYLOAD
-        datagram = UDPDatagram()
-        datagram.seq = self.seq
-        datagram.ack = self.ack
-        datagram.ackbits = self.ackbits
-        datagram.payload = payload
-        buf = datagram.Serialize()
+        buf = self.Pack(payload)
         self.sock.send(buf)
+        return self.OnSent()
+
+    def Write(self, evt):
+        '''Send the datagram carrying evt. The event is serialized straight
+        into the send buffer.
+        Return value:
+        True if this method succeeded.
+        '''
+        self.sock.send(self.PackEvent(evt))
+        return self.OnSent()
+
+    def PackHeader(self):
+        '''Write the prefix and the datagram header into self.send_buf.
+        Return value:
+        The offset of the payload.
+        '''
+        n = len(self.prefix)
+        if n > 0:
+            self.send_buf[:n] = self.prefix
+        return UDPDatagram.PackHeaderInto(self.send_buf, n, self.seq,
+                self.ack, self.ackbits)
+
+    def Pack(self, payload):
+        '''Return the datagram carrying payload as a memoryview of
+        self.send_buf, valid until the next send.'''
+        assert len(payload) <= UDPDatagram.MAX_PAYLOAD
+        offset = self.PackHeader()
+        end = offset + len(payload)
+        self.send_buf[offset:end] = payload
+        return self.GetSendView(end)
+
+    def PackEvent(self, evt):
+        '''Return the datagram carrying evt as a memoryview of
+        self.send_buf, valid until the next send.
+        Argument:
+        evt -- An event that implements SerializeInto().
+        '''
+        offset = self.PackHeader()
+        end = evt.SerializeInto(self.send_buf, offset)
+        assert end - offset <= UDPDatagram.MAX_PAYLOAD
+        return self.GetSendView(end)
+
+    def GetSendView(self, end):
+        '''Return self.send_buf up to end, padded by
+        UDPDatagram.GetSendSize().'''
+        n = len(self.prefix)
+        size = UDPDatagram.GetSendSize(end - n)
+        if size + n > end:
+            self.send_buf[end:size + n] = bytes(size + n - end)
+        return memoryview(self.send_buf)[:size + n]
+
+    def OnSent(self):
+        '''Advance the sequence number after a datagram is sent.
+        Return value:
+        False if the connection is dead.
+        '''
         self.seq = (self.seq + 1) % UDPDatagram.MAX_SEQ
         self.ttl -= 1
         if self.ttl <= 0:
@@ -114,24 +186,91 @@ class UDPSocket:
                 shift = self.ack - ack - 1
             self.ackbits |= ((1 << 31) >> shift)
 
+    def UpdatePeerAck(self, ack, ackbits):
+        '''Update peer_ack and peer_ackbits with those of a received
+        datagram. Older acks than peer_ack are ignored.'''
+        if ack == 0 and ackbits == 0:
+            return
+        if self.peer_ack == 0 and self.peer_ackbits == 0 or \
+                self.IsMoreRecent(ack, self.peer_ack, UDPDatagram.MAX_SEQ):
+            self.peer_ack = ack
+            self.peer_ackbits = ackbits
+        elif ack == self.peer_ack:
+            self.peer_ackbits |= ackbits
+
+    def IsAckedByPeer(self, seq):
+        '''Return True if the peer acknowledged the datagram seq. See
+        UpdateAck() for the meaning of the ackbits.'''
+        if self.peer_ack == 0 and self.peer_ackbits == 0:
+            return False
+        d = (self.peer_ack - seq) % UDPDatagram.MAX_SEQ
+        if d == 0:
+            return True
+        if d > 32:
+            return False
+        return (self.peer_ackbits >> (32 - d)) & 1 == 1
+
     def Recv(self):
         '''Non-blocking receive.
+        The payload of the datagram is a view of self.recv_buf, so it is only
+        valid until the next Recv().
         '''
         (ready, _, _) = select.select([self.sock], [], [], 0)
         if ready == []:
             return None
-        buf = self.sock.recv(UDPDatagram.MAX_DATAGRAM)
+        n = self.sock.recv_into(self.recv_buf)
+        return self.Receive(memoryview(self.recv_buf)[:n])
+
+    def RecvAll(self):
+        '''Receive every pending datagram without waiting.
+        Return value:
+        The list of received datagrams that are not ignored, oldest first.
+        '''
+        result = []
+        while True:
+            if UDPSocket.MSG_DONTWAIT == 0:
+                (ready, _, _) = select.select([self.sock], [], [], 0)
+                if ready == []:
+                    break
+            try:
+                buf = self.sock.recv(UDPDatagram.MAX_DATAGRAM,
+                        UDPSocket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            datagram = self.Receive(buf)
+            if datagram != None:
+                result.append(datagram)
+        return result
+
+    def Receive(self, buf):
+        '''Update the acks with a received datagram.
+        Argument:
+        buf -- The bytes of the datagram.
+        Return value:
+        The datagram, or None if it is ignored.
+        '''
         datagram = UDPDatagram()
         datagram.Deserialize(buf)
         ignore = False
         if not self.IsMoreRecent(datagram.seq, self.ack, UDPDatagram.MAX_SEQ):
             ignore = self.should_ignore_old
         self.UpdateAck(datagram.seq)
+        self.UpdatePeerAck(datagram.ack, datagram.ackbits)
         self.ttl = UDPSocket.MAX_TIME_TO_LIVE
         if ignore:
             return None
         return datagram
 
+    def OnPortReply(self, buf):
+        '''Return the port in the reply to GUID_1, and keep the connection
+        ID as the prefix if there is one.'''
+        if len(buf) == struct.calcsize(UDPSocket.MUX_FORMAT):
+            (port, conn_id) = struct.unpack(UDPSocket.MUX_FORMAT, buf)
+            self.prefix = struct.pack(UDPSocket.CONN_ID_FORMAT, conn_id)
+            return port
+        self.prefix = b''
+        return struct.unpack(UDPSocket.PORT_FORMAT, buf)[0]
+
     def Connect(self, addr, timeout):
         '''Attempt to establish a connection. The peer at addr should call
         Accept().
@@ -147,9 +286,10 @@ class UDPSocket:
             if ready == []:
                 logger.info('Connect timed out. (2)')
                 return False
-            (buf, _) = self.sock.recvfrom(struct.calcsize('!H'))
+            (buf, _) = self.sock.recvfrom(
+                    struct.calcsize(UDPSocket.MUX_FORMAT))
             # Connect to the port provided by the peer.
-            port = struct.unpack('!H', buf)[0]
+            port = self.OnPortReply(buf)
             logger.info('Connecting to ({0}, {1})'.format(addr[0], port))
             try:
                 self.sock.connect((addr[0], port))
@@ -162,7 +302,7 @@ class UDPSocket:
             if ready == []:
                 logger.info('Connect timed out (3).')
                 return False
-            self.sock.send(UDPSocket.GUID_3)
+            self.sock.send(self.prefix + UDPSocket.GUID_3)
             logger.info('Handshake succeeded.')
             self.ttl = UDPSocket.MAX_TIME_TO_LIVE
             return True
@@ -196,7 +336,7 @@ class UDPSocket:
             (_, port) = s.sock.getsockname()
             logger.info('Opening port {0}'.format(port))
             # Tell the client to use this port.
-            self.sock.sendto(struct.pack('!H', port), addr)
+            self.sock.sendto(struct.pack(UDPSocket.PORT_FORMAT, port), addr)
             (ready, _, _) = select.select([s.sock], [], [], timeout)
             if ready == []:
                 s.Close()
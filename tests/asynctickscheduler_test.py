@@ -0,0 +1,23 @@
+import asyncio
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from asynctickscheduler import AsyncTickScheduler
+
+class AsyncTickSchedulerTest(unittest.TestCase):
+    def test_WaitUntilAsync_Yield(self):
+        # A deadline in the past still lets other coroutines run.
+        sched = AsyncTickScheduler()
+        ticks = []
+        async def Tick():
+            ticks.append(len(ticks))
+        async def Wait():
+            task = asyncio.ensure_future(Tick())
+            self.assertTrue(not await sched.WaitUntilAsync(sched.Now() - 1))
+            self.assertTrue(ticks == [0])
+            await task
+        asyncio.run(Wait())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import struct
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from asynceventsocket import AsyncEventSocket
+from asyncudpclient import AsyncUDPClient
+from asyncudpmux import AsyncUDPMux
+from asyncudpsocket import AsyncUDPSocket
+from gameconfig import GameConfig
+from gameevent import GameEvent
+from matchserver import MatchServer
+import tplogger
+from udpsocket import UDPSocket
+sys.path.append(os.path.abspath('tests'))
+from mockkeyboard import MockKeyboard
+from nullrenderer import NullRenderer
+logger = tplogger.getTPLogger('asyncudpmux_test.log', logging.DEBUG)
+
+class AsyncUDPMuxTest(unittest.TestCase):
+    async def AcceptAll(self, mux, clients):
+        '''Connect clients to mux and return the accepted connections.'''
+        addr = mux.sock.getsockname()
+        accepted = []
+        for c in clients:
+            (ok, conn) = await asyncio.gather(c.Connect(addr, 1.0),
+                    mux.Accept(1.0))
+            self.assertTrue(ok)
+            self.assertTrue(conn != None)
+            accepted.append(conn)
+        return accepted
+
+    def template_Exchange(self, n):
+        '''n clients exchange datagrams with one mux socket.'''
+        async def Main():
+            mux = AsyncUDPMux()
+            await mux.Open(('127.0.0.1', 0))
+            clients = []
+            for i in range(0, n):
+                c = AsyncUDPSocket()
+                await c.Open(('127.0.0.1', 0))
+                clients.append(c)
+            conns = await self.AcceptAll(mux, clients)
+            for i in range(0, n):
+                for j in range(0, i % 4 + 1):
+                    clients[i].Send(struct.pack('!H', i))
+                conns[i].Send(b'reply')
+                # Let the mux drain the socket buffer.
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.1)
+            received = [conn.RecvAll() for conn in conns]
+            replies = [c.RecvAll() for c in clients]
+            for c in clients:
+                c.Close()
+            for conn in conns:
+                conn.Close()
+            result = (received, replies, conns, mux.connections, mux.dropped)
+            mux.Close()
+            return result
+        (received, replies, conns, connections, dropped) = asyncio.run(Main())
+        self.assertTrue(len(set([conn.conn_id for conn in conns])) == n)
+        for i in range(0, n):
+            # Each connection gets the datagrams of its peer only, and keeps
+            # its own acks.
+            self.assertTrue(len(received[i]) == i % 4 + 1)
+            for d in received[i]:
+                self.assertTrue(d.payload[:2] == struct.pack('!H', i))
+            expected = UDPSocket()
+            for d in received[i]:
+                expected.UpdateAck(d.seq)
+            self.assertTrue(conns[i].ack == i % 4)
+            self.assertTrue(conns[i].ackbits == expected.ackbits)
+            self.assertTrue(conns[i].seq == 1)
+            self.assertTrue(len(replies[i]) == 1)
+            self.assertTrue(replies[i][0].payload[:5] == b'reply')
+        self.assertTrue(len(connections) == 0)
+        self.assertTrue(dropped == 0)
+
+    def test_Exchange_1(self):
+        self.template_Exchange(1)
+
+    def test_Exchange_2(self):
+        self.template_Exchange(20)
+
+    def test_Exchange_3(self):
+        self.template_Exchange(200)
+
+    def test_Drop(self):
+        '''Datagrams with an unknown ID or address are dropped.'''
+        async def Main():
+            mux = AsyncUDPMux()
+            await mux.Open(('127.0.0.1', 0))
+            c = AsyncUDPSocket()
+            await c.Open(('127.0.0.1', 0))
+            other = AsyncUDPSocket()
+            await other.Open(('127.0.0.1', 0))
+            [conn] = await self.AcceptAll(mux, [c])
+            # The right ID from the wrong address.
+            other.peer = c.peer
+            other.prefix = c.prefix
+            other.Send(b'spoof')
+            # An unknown ID from the right address.
+            c.prefix = struct.pack(UDPSocket.CONN_ID_FORMAT,
+                    (conn.conn_id + 1) % (1 << 32))
+            c.Send(b'unknown')
+            c.transport.sendto(b'xy', c.peer)
+            await asyncio.sleep(0.1)
+            result = (conn.RecvAll(), mux.dropped)
+            c.Close()
+            other.Close()
+            mux.Close()
+            return result
+        (received, dropped) = asyncio.run(Main())
+        self.assertTrue(received == [])
+        self.assertTrue(dropped == 3)
+
+    def test_UDPSocket(self):
+        '''A blocking UDPSocket connects to the mux.'''
+        async def Main():
+            mux = AsyncUDPMux()
+            await mux.Open(('127.0.0.1', 0))
+            c = UDPSocket()
+            c.Open()
+            loop = asyncio.get_running_loop()
+            (ok, conn) = await asyncio.gather(
+                    loop.run_in_executor(None, c.Connect,
+                        mux.sock.getsockname(), 1.0),
+                    mux.Accept(1.0))
+            evt = GameEvent()
+            evt.frame = 3
+            e = AsyncEventSocket(conn)
+            c.Send(evt.Serialize())
+            received = await e.ReadEvent(1.0)
+            c.sock.settimeout(1.0)
+            e.SendEvent(evt)
+            reply = c.Receive(c.sock.recv(512))
+            c.Close()
+            conn.Close()
+            mux.Close()
+            return (ok, received, reply)
+        (ok, received, reply) = asyncio.run(Main())
+        self.assertTrue(ok)
+        self.assertTrue(received != None and received.frame == 3)
+        self.assertTrue(reply != None)
+
+    def test_MatchServer(self):
+        '''Two matches are played through one port.'''
+        n = 2
+        matches = 2
+        conf = GameConfig()
+        conf.player_size = n
+        conf.frames_per_sec = 32767
+        conf.game_length = 0.05
+        conf.post_game_time = 0
+        conf.do_sync = False
+        user_conf = GameConfig()
+        user_conf.do_sync = False
+        async def Main():
+            mux = AsyncUDPMux()
+            await mux.Open(('127.0.0.1', 0))
+            svr = MatchServer(conf)
+            svr.buffer_time = 0
+            clients = []
+            for i in range(0, n * matches):
+                k = MockKeyboard()
+                k.inputs = [1]*30+[0]*100
+                clients.append(AsyncUDPClient().Run(mux.sock.getsockname(),
+                    NullRenderer(), k, user_conf, 1, 1, 0.5))
+            results = await asyncio.gather(svr.Run(mux, 0.5, matches),
+                    *clients)
+            mux.Close()
+            return results
+        for i in range(0, 20):
+            results = asyncio.run(Main())
+            if all(results[1:]):
+                break
+        self.assertTrue(len(results[0]) == matches)
+        for result in results[1:]:
+            self.assertTrue(result)
+
+if __name__ == '__main__':
+    unittest.main()
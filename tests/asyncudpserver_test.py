@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from asynceventsocket import AsyncEventSocket
+from asyncudpclient import AsyncUDPClient
+from asyncudpserver import AsyncUDPServer
+from asyncudpsocket import AsyncUDPSocket
+from gameconfig import GameConfig
+from gameevent import GameEvent
+import tplogger
+from udpclient import UDPClient
+sys.path.append(os.path.abspath('tests'))
+from mockkeyboard import MockKeyboard
+from nullrenderer import NullRenderer
+logger = tplogger.getTPLogger('asyncudpserver_test.log', logging.DEBUG)
+
+def AsyncUDPServerTestPickleJar_Run(c, svraddr, r, k, conf, q):
+    result = False
+    try:
+        result = c.Run(svraddr, r, k, conf, 1, 1, 0.5)
+    except Exception as e:
+        logger.exception(e)
+    q.put(result)
+
+class AsyncUDPServerTest(unittest.TestCase):
+    def MakeConf(self, n, do_sync):
+        conf = GameConfig()
+        conf.player_size = n
+        conf.frames_per_sec = 32767
+        conf.game_length = 0.05
+        conf.post_game_time = 0
+        conf.do_sync = do_sync
+        conf.sync_timeout = 0.1
+        conf.sync_rate = 100
+        return conf
+
+    def MakeKeyboard(self):
+        k = MockKeyboard()
+        k.inputs = [1]*30+[0]*100
+        return k
+
+    async def RunGame(self, n, do_sync):
+        '''Run a server and n clients in one event loop.'''
+        conf = self.MakeConf(n, do_sync)
+        user_conf = GameConfig()
+        user_conf.do_sync = do_sync
+        user_conf.sync_timeout = conf.sync_timeout * n
+        s = AsyncUDPSocket()
+        await s.Open(('127.0.0.1', 0))
+        svr = AsyncUDPServer()
+        svr.buffer_time = 0
+        clients = []
+        for i in range(0, n):
+            clients.append(AsyncUDPClient().Run(s.sock.getsockname(),
+                NullRenderer(), self.MakeKeyboard(), user_conf, 1, 1, 0.5))
+        results = await asyncio.gather(svr.Run(s, conf, 1, 0.5), *clients)
+        s.Close()
+        return results
+
+    def template_Run(self, n, do_sync):
+        for i in range(0, 20):
+            results = asyncio.run(self.RunGame(n, do_sync))
+            if results[0] == 0:
+                break
+        self.assertTrue(results[0] == 0)
+        for result in results[1:]:
+            self.assertTrue(result)
+
+    def test_Run_1(self):
+        self.template_Run(1, False)
+
+    def test_Run_2(self):
+        self.template_Run(3, False)
+
+    def test_Run_3(self):
+        self.template_Run(3, True)
+
+    def test_Run_UDPClient(self):
+        '''The asyncio server plays with the blocking clients.'''
+        n = 2
+        conf = self.MakeConf(n, False)
+        user_conf = GameConfig()
+        user_conf.do_sync = False
+        async def Main():
+            s = AsyncUDPSocket()
+            await s.Open(('127.0.0.1', 0))
+            ps = []
+            qs = []
+            for i in range(0, n):
+                q = multiprocessing.Queue()
+                p = multiprocessing.Process(
+                        target=AsyncUDPServerTestPickleJar_Run,
+                        args=(UDPClient(), s.sock.getsockname(),
+                            NullRenderer(), self.MakeKeyboard(), user_conf, q))
+                p.start()
+                ps.append(p)
+                qs.append(q)
+            svr = AsyncUDPServer()
+            svr.buffer_time = 0
+            status = await svr.Run(s, conf, 1, 1.0)
+            s.Close()
+            loop = asyncio.get_running_loop()
+            results = []
+            for i in range(0, n):
+                results.append(await loop.run_in_executor(None, qs[i].get))
+                ps[i].join()
+            return [status] + results
+        for i in range(0, 20):
+            results = asyncio.run(Main())
+            if results[0] == 0:
+                break
+        self.assertTrue(results[0] == 0)
+        for result in results[1:]:
+            self.assertTrue(result)
+
+    def test_WriteEvent_and_ReadEvent(self):
+        evt = GameEvent()
+        evt.frame = 7
+        evt.keybits = (1 << 100) | 1
+        async def Main():
+            s, t = await AsyncUDPSocket.Pair()
+            e = AsyncEventSocket(s)
+            f = AsyncEventSocket(t)
+            self.assertTrue(await e.WriteEvent(evt, 0.01, 2) == 0)
+            received = [await f.ReadEvent(1.0), await f.ReadEvent(1.0)]
+            # An unread event is returned again.
+            f.UnreadEvent()
+            again = f.ReadEvents()
+            self.assertTrue(await f.ReadEvent(0.01) == None)
+            s.Close()
+            t.Close()
+            return (received, again)
+        (received, again) = asyncio.run(Main())
+        self.assertTrue(received == [evt, evt])
+        self.assertTrue(again == [evt])
+
+    def test_Sync(self):
+        async def Main():
+            s, t = await AsyncUDPSocket.Pair()
+            e = AsyncEventSocket(s)
+            f = AsyncEventSocket(t)
+            (status, _) = await asyncio.gather(e.Sync(0.2, 20),
+                    f.RecvSync(0.3))
+            s.Close()
+            t.Close()
+            return (status, e)
+        (status, e) = asyncio.run(Main())
+        self.assertTrue(status == 0)
+        self.assertTrue(abs(e.delta) < 50)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import random
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from batchengine import BatchEngine
+from bitrecord import BitRecord
+from gameevent import GameEvent
+from gamestate import GameState
+from udpgameengine import UDPGameEngine
+
+class BatchEngineTest(unittest.TestCase):
+    def template_PlayFrame(self, size, frames, seed, buffer_size=64):
+        '''Compare each game of the batch with UDPGameEngine.PlayFrame.'''
+        rand = random.Random(seed)
+        e = UDPGameEngine()
+        e.buffer_size = buffer_size
+        batch = BatchEngine(size)
+        batch.Configure(e, GameState())
+        states = []
+        bitrecs = []
+        for i in range(0, size):
+            s = GameState()
+            s.ball.pos_y += rand.randint(-100, 100)
+            s.ball.vel_x = rand.choice([-6, -4, 4, 6])
+            s.paddle_left.pos_y = rand.randint(0, 480)
+            s.paddle_right.pos_y = rand.randint(0, 480)
+            s.players[GameState.ROLE_BALL] = rand.randint(0, 2)
+            s.is_ended = rand.random() < 0.2
+            bitrec = BitRecord()
+            bitrec.bits[4] = rand.getrandbits(buffer_size) & \
+                    rand.getrandbits(buffer_size)
+            batch.LoadState(i, s, bitrec)
+            states.append(s)
+            bitrecs.append(bitrec)
+        for f in range(0, frames):
+            keys = []
+            for i in range(0, size):
+                k = GameEvent.EVENT_NO_OP
+                if rand.random() < 0.05:
+                    k |= GameEvent.EVENT_FLAP_LEFT_PADDLE
+                if rand.random() < 0.05:
+                    k |= GameEvent.EVENT_FLAP_RIGHT_PADDLE
+                if rand.random() < 0.05:
+                    k |= GameEvent.EVENT_FLAP_BALL
+                keys.append(k)
+                e.PlayFrame(states[i], k, bitrecs[i])
+            batch.PlayFrame(keys)
+        for i in range(0, size):
+            s = GameState()
+            s.players = states[i].players
+            s.is_ended = states[i].is_ended
+            bitrec = BitRecord()
+            batch.StoreState(i, s, bitrec)
+            self.assertTrue(s == states[i])
+            self.assertTrue(bitrec.bits[4] == bitrecs[i].bits[4])
+
+    def test_PlayFrame_1(self):
+        self.template_PlayFrame(1, 100, 0)
+
+    def test_PlayFrame_2(self):
+        self.template_PlayFrame(32, 600, 1)
+
+    def test_PlayFrame_3(self):
+        self.template_PlayFrame(200, 300, 2)
+
+    def test_PlayFrame_4(self):
+        # The score bits span several words.
+        self.template_PlayFrame(32, 600, 3, 1024)
+
+    def test_PlayFrame_5(self):
+        self.template_PlayFrame(32, 300, 4, 100)
@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from eventpool import EventPool
+from gameevent import GameEvent
+class EventPoolTest(unittest.TestCase):
+    def test_Acquire(self):
+        p = EventPool(GameEvent)
+        a = p.Acquire()
+        b = p.Acquire()
+        self.assertTrue(isinstance(a, GameEvent))
+        self.assertTrue(a is not b)
+        self.assertTrue(p.used == 2)
+
+    def test_Release(self):
+        p = EventPool(GameEvent)
+        a = p.Acquire()
+        b = p.Acquire()
+        p.Release()
+        self.assertTrue(p.Acquire() is a)
+        self.assertTrue(p.Acquire() is b)
+        self.assertTrue(len(p.events) == 2)
+
+    def test_Release_Keep(self):
+        p = EventPool(GameEvent)
+        a = p.Acquire()
+        b = p.Acquire()
+        p.Release(b)
+        # b stays in use until the next release.
+        self.assertTrue(p.Acquire() is a)
+        self.assertTrue(p.Acquire() is not b)
+        p.Release(GameEvent())
+        self.assertTrue(p.used == 0)
+
+if __name__ == '__main__':
+    unittest.main()
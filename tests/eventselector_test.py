@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from eventselector import EventSelector
+from gameevent import GameEvent
+from udpeventsocket import UDPEventSocket
+from udpsocket import UDPSocket
+
+class EventSelectorTest(unittest.TestCase):
+    def template_Read(self, n, counts):
+        pairs = [UDPSocket.Pair() for i in range(0, n)]
+        senders = [UDPEventSocket(s) for (s, t) in pairs]
+        receivers = [UDPEventSocket(t) for (s, t) in pairs]
+        sel = EventSelector(receivers)
+        try:
+            self.assertTrue(sel.Read() == [])
+            for i in range(0, n):
+                for k in range(0, counts[i]):
+                    evt = GameEvent()
+                    evt.frame = k
+                    evt.keys = i
+                    senders[i].WriteEvent(evt)
+            batch = sel.Read(0.1)
+            self.assertTrue(len(batch) == sum(counts))
+            for i in range(0, n):
+                frames = [evt.frame for (c, evt) in batch if c is receivers[i]]
+                self.assertTrue(frames == list(range(0, counts[i])))
+            for (c, evt) in batch:
+                self.assertTrue(c is receivers[evt.keys])
+            self.assertTrue(sel.Read() == [])
+            self.assertTrue(sel.failed == [])
+        finally:
+            sel.Close()
+            for (s, t) in pairs:
+                s.Close()
+                t.Close()
+
+    def test_Read_1(self):
+        self.template_Read(1, [1])
+
+    def test_Read_2(self):
+        self.template_Read(3, [2, 0, 5])
+
+    def test_Read_Failed(self):
+        s, t = UDPSocket.Pair()
+        f = UDPEventSocket(t)
+        sel = EventSelector([f])
+        # A datagram too short to have a header.
+        s.sock.send(b'xx')
+        batch = sel.Read(0.1)
+        self.assertTrue(batch == [])
+        self.assertTrue(sel.failed == [f])
+        self.assertTrue(sel.GetSockets() == [])
+        sel.Close()
+        s.Close()
+        t.Close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -46,6 +46,7 @@ class GameConfigTest(unittest.TestCase):
         conf.rounds = 8
         conf.buffer_delay = 1
         conf.player_id = 2
+        conf.buffer_size = 512
         # Ignore the event type bytes.
         b = conf.Serialize()[4:]
         test = GameConfig()
@@ -64,8 +65,11 @@ class GameConfigTest(unittest.TestCase):
         conf.ball_size = 100
         conf.player_id = 2
         conf.cool_down = 5
+        conf.buffer_size = 256
         e = UDPGameEngine()
         conf.Apply(e)
+        self.assertTrue(e.buffer_size == conf.buffer_size)
+        self.assertTrue(e.rec.size == conf.buffer_size)
         self.assertTrue(e.player_id == conf.player_id)
         self.assertTrue(e.key_cool_down_time == conf.cool_down)
         s = e.state
@@ -0,0 +1,63 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from gamerecord import GameRecord
+from gamestate import GameState
+class GameRecordTest(unittest.TestCase):
+    def MakeState(self, x):
+        s = GameState()
+        s.ball.pos_x = x
+        s.ball.pos_y = x + 1
+        s.ball.vel_x = x + 2
+        s.ball.vel_y = x + 3
+        s.paddle_left.pos_y = x + 4
+        s.paddle_left.vel_y = x + 5
+        s.paddle_right.pos_y = x + 6
+        s.paddle_right.vel_y = x + 7
+        s.key_flags = 1
+        s.frame = x + 9
+        return s
+
+    def test_SetSize(self):
+        rec = GameRecord()
+        rec.SetSize(8)
+        rec.SetSize(16)
+        self.assertTrue(rec.size == 16)
+        s = GameState()
+        s.ball.pos_x = 1000
+        rec.Restore(15, s)
+        self.assertTrue(s == GameState())
+
+    def test_SaveAndRestore(self):
+        rec = GameRecord()
+        rec.SetSize(4)
+        for i in range(0, 4):
+            rec.Save(i, self.MakeState(100 * i))
+        for i in range(0, 4):
+            s = GameState()
+            rec.Restore(i, s)
+            self.assertTrue(s == self.MakeState(100 * i))
+            self.assertTrue(rec.GetFrame(i) == 100 * i + 9)
+
+    def test_SaveExceptPlayer(self):
+        rec = GameRecord()
+        rec.SetSize(2)
+        rec.Save(1, self.MakeState(0))
+        rec.SaveExceptPlayer(1, self.MakeState(100), [1, 2, 3], 1)
+        s = GameState()
+        rec.Restore(1, s)
+        expected = self.MakeState(100)
+        expected.paddle_right.pos_y = 6
+        expected.paddle_right.vel_y = 7
+        self.assertTrue(s == expected)
+
+    def test_RestoreExceptPlayer(self):
+        rec = GameRecord()
+        rec.SetSize(2)
+        rec.Save(0, self.MakeState(0))
+        s = self.MakeState(100)
+        rec.RestoreExceptPlayer(0, s, [1, 2, 3], 2)
+        expected = self.MakeState(0)
+        expected.ball = self.MakeState(100).ball
+        self.assertTrue(s == expected)
@@ -13,6 +13,35 @@ class GameStateTest(unittest.TestCase):
         self.assertTrue(o == expected_object)
 
 
+    def test_PlayerToObjectFast(self):
+        s = GameState()
+        roles = [GameState.ROLE_BALL,
+                GameState.ROLE_LEFT_PADDLE,
+                GameState.ROLE_RIGHT_PADDLE]
+        for i in range(0, 3):
+            self.assertTrue(s.PlayerToObjectFast(roles, i) is \
+                    s.PlayerToObject(roles, i))
+
+    def test_CopyExceptPlayerFast(self):
+        roles = [GameState.ROLE_LEFT_PADDLE,
+                GameState.ROLE_RIGHT_PADDLE,
+                GameState.ROLE_BALL]
+        s = GameState()
+        s.ball.pos_x = 100
+        s.paddle_left.pos_y = 90
+        s.paddle_right.vel_y = 7
+        s.frame = 30
+        t = GameState()
+        t.paddle_left.pos_y = 20
+        u = GameState()
+        u.paddle_left.pos_y = 20
+        s.CopyExceptPlayer(t, roles, 0)
+        s.CopyExceptPlayerFast(u, roles, 0)
+        self.assertTrue(t == u)
+        self.assertTrue(u.paddle_left.pos_y == 20)
+        self.assertTrue(u.ball.pos_x == s.ball.pos_x)
+        self.assertTrue(u.paddle_right.vel_y == s.paddle_right.vel_y)
+
     def test_Serialize_and_Deserialize(self):
         s = GameState()
         s.ball.pos_x = 100
@@ -25,7 +54,7 @@ class GameStateTest(unittest.TestCase):
         s.paddle_right.vel_y = 87
         s.key_flags = 3
         s.frame = 112734590
-        s.keybits = 1 << 63
+        s.bits[0] = 1 << 63
         # Ignore the EventType header.
         b = s.Serialize()[4:]
         t = GameState()
@@ -42,6 +71,81 @@ class GameStateTest(unittest.TestCase):
         self.assertTrue(t.frame == s.frame)
         pass
 
+    def test_Serialize_and_Deserialize_History(self):
+        s = GameState()
+        s.frame = 5000
+        s.bits[0] = 1 << 1023
+        s.bits[1] = 0
+        s.bits[2] = (1 << 100) + 3
+        # Trailing bytes, as in a padded datagram, are ignored.
+        b = s.Serialize()[4:] + bytes(16)
+        self.assertTrue(len(b) == s.GetSize() + 16)
+        t = GameState()
+        t.Deserialize(b)
+        self.assertTrue(t.bits[0:3] == s.bits[0:3])
+        self.assertTrue(t.frame == s.frame)
+
+    def test_SerializeInto(self):
+        s = GameState()
+        s.frame = 77
+        s.ball.vel_y = -3
+        s.bits[2] = (1 << 64) - 1
+        b = s.Serialize()
+        buf = bytearray(3 + len(b) + 5)
+        end = s.SerializeInto(buf, 3)
+        self.assertTrue(end == 3 + len(b))
+        self.assertTrue(buf[3:end] == b)
+        t = GameState()
+        # Read from a view at the offset of the state, after the event type.
+        t.Deserialize(memoryview(buf), 7)
+        self.assertTrue(t.frame == s.frame)
+        self.assertTrue(t.ball.vel_y == s.ball.vel_y)
+        self.assertTrue(t.bits[0:3] == s.bits[0:3])
+
+    def template_SerializeDelta(self, s, base, expected_size):
+        buf = bytearray(100)
+        end = s.SerializeDeltaInto(buf, 2, base, 9)
+        self.assertTrue(end - 2 == expected_size)
+        self.assertTrue(GameState.GetDeltaBase(buf, 6) == 9)
+        t = GameState()
+        t.DeserializeDelta(memoryview(buf), 6, base)
+        self.assertTrue(t == s)
+
+    def test_SerializeDelta_1(self):
+        base = GameState()
+        base.frame = 10
+        s = GameState()
+        s.frame = 12
+        self.template_SerializeDelta(s, base, GameState.DELTA_STRUCT.size)
+
+    def test_SerializeDelta_2(self):
+        base = GameState()
+        base.frame = 10
+        base.bits[1] = 7
+        s = GameState()
+        s.frame = 9
+        s.ball.pos_x = -5
+        s.key_flags = 2
+        s.bits[0] = 1 << 40
+        s.bits[1] = 7
+        s.bits[2] = 1
+        self.template_SerializeDelta(s, base,
+                GameState.DELTA_STRUCT.size + 2 * 2 + 2 * 8)
+
+    def test_SerializeDelta_3(self):
+        # Histories wider than 8 bytes are sent in full.
+        base = GameState()
+        s = GameState()
+        s.bits[2] = 1 << 100
+        buf = bytearray(100)
+        end = s.SerializeDeltaInto(buf, 0, base, 0)
+        self.assertTrue(bytes(buf[:end]) == s.Serialize())
+        # So are states too many frames apart.
+        s.bits[2] = 0
+        s.frame = GameState.MAX_FRAME_CHANGE + 1
+        end = s.SerializeDeltaInto(buf, 0, base, 0)
+        self.assertTrue(bytes(buf[:end]) == s.Serialize())
+
     def test_eq(self):
         s = GameState()
         s.ball.vel_x = 100
@@ -65,6 +169,18 @@ class GameStateTest(unittest.TestCase):
         self.assertTrue(s != t)
         pass
 
+    def test_hash(self):
+        s = GameState()
+        t = GameState()
+        t.bits[1] = 5
+        self.assertTrue(hash(s) == hash(GameState()))
+        self.assertTrue(hash(s) != hash(t))
+
+    def test_slots(self):
+        s = GameState()
+        self.assertFalse(hasattr(s, '__dict__'))
+        self.assertFalse(hasattr(s.ball, '__dict__'))
+
     def test_Copy(self):
         s = GameState()
         u = GameState()
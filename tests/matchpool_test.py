@@ -0,0 +1,133 @@
+import logging
+import multiprocessing
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from gameconfig import GameConfig
+from matchpool import MatchPool
+from matchpool import PoolWorker
+import tplogger
+from udpclient import UDPClient
+from udpsocket import UDPSocket
+sys.path.append(os.path.abspath('tests'))
+from mockkeyboard import MockKeyboard
+from nullrenderer import NullRenderer
+logger = tplogger.getTPLogger('matchpool_test.log', logging.DEBUG)
+
+def MatchPoolTestPickleJar_Run(svraddr, conf, q):
+    result = False
+    k = MockKeyboard()
+    k.inputs = [1]*30+[0]*100
+    try:
+        result = UDPClient().Run(svraddr, NullRenderer(), k, conf, 1, 1, 1.0)
+    except Exception as e:
+        logger.exception(e)
+    q.put(result)
+
+def MatchPoolTestPickleJar_Connect(svraddr, q):
+    '''Connect, but never answer the handshake.'''
+    s = UDPSocket()
+    s.Open()
+    q.put(s.Connect(svraddr, 1.0))
+    s.Close()
+
+class MatchPoolTest(unittest.TestCase):
+    def MakeConf(self, n):
+        conf = GameConfig()
+        conf.player_size = n
+        conf.frames_per_sec = 32767
+        conf.game_length = 0.05
+        conf.post_game_time = 0
+        conf.do_sync = False
+        return conf
+
+    def template_Run(self, n, matches, workers):
+        conf = self.MakeConf(n)
+        user_conf = GameConfig()
+        user_conf.do_sync = False
+        s = UDPSocket()
+        s.Open()
+        s.Bind(('127.0.0.1', 0))
+        ps = []
+        qs = []
+        for j in range(0, n * matches):
+            q = multiprocessing.Queue()
+            p = multiprocessing.Process(target=MatchPoolTestPickleJar_Run,
+                    args=(s.sock.getsockname(), user_conf, q))
+            p.start()
+            ps.append(p)
+            qs.append(q)
+        pool = MatchPool(conf, workers)
+        stats = pool.Run(s, 0.5, matches)
+        s.Close()
+        results = []
+        for j in range(0, n * matches):
+            results.append(qs[j].get())
+            ps[j].join()
+        self.assertTrue(len(stats) == matches)
+        self.assertTrue(pool.GetFailedCount() == 0)
+        for result in results:
+            self.assertTrue(result)
+        ids = sorted([int(line.split()[1][:-1]) for line in stats])
+        self.assertTrue(ids == list(range(0, matches)))
+        self.assertTrue(pool.frames > 0)
+        self.assertTrue(pool.GetCapacity() > 0)
+
+    def test_Run_1(self):
+        self.template_Run(1, 1, 1)
+
+    def test_Run_2(self):
+        self.template_Run(2, 2, 2)
+
+    def test_Run_3(self):
+        self.template_Run(1, 4, 2)
+
+    def test_Run_Failed(self):
+        s = UDPSocket()
+        s.Open()
+        s.Bind(('127.0.0.1', 0))
+        q = multiprocessing.Queue()
+        p = multiprocessing.Process(target=MatchPoolTestPickleJar_Connect,
+                args=(s.sock.getsockname(), q))
+        p.start()
+        pool = MatchPool(self.MakeConf(1), 1)
+        # Run() returns once the handshake of the match failed.
+        stats = pool.Run(s, 0.5, 1)
+        s.Close()
+        self.assertTrue(q.get())
+        p.join()
+        self.assertTrue(stats == [])
+
+    def test_ReadReports(self):
+        # Every pending report is read, so the latest load is used.
+        (conn, child) = multiprocessing.Pipe()
+        pool = MatchPool(self.MakeConf(1), 1)
+        w = PoolWorker(None, conn)
+        pool.workers.append(w)
+        child.send(('load', 0.1, 1, 1, 0, 0))
+        child.send(('load', 0.3, 2, 2, 0, 0))
+        pool.ReadReports(None, 1.0)
+        self.assertTrue(w.utilization == 0.3)
+        self.assertTrue(w.running == 2)
+        self.assertTrue(pool.ReadReports(None, 0) == [])
+        conn.close()
+        child.close()
+
+    def test_GetLoad(self):
+        idle = PoolWorker(None, None)
+        busy = PoolWorker(None, None)
+        busy.utilization = 0.4
+        busy.running = 2
+        busy.started = 2
+        busy.assigned = 2
+        self.assertTrue(idle.GetLoad() == 0)
+        self.assertTrue(abs(busy.GetLoad() - 0.4) < 1e-9)
+        # Matches not reported yet count at the average load of a match.
+        busy.assigned = 3
+        self.assertTrue(abs(busy.GetLoad() - 0.6) < 1e-9)
+        idle.assigned = 1
+        self.assertTrue(idle.GetLoad() == PoolWorker.MIN_MATCH_LOAD)
+
+if __name__ == '__main__':
+    unittest.main()
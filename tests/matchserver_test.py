@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from asyncudpclient import AsyncUDPClient
+from asyncudpsocket import AsyncUDPSocket
+from gameconfig import GameConfig
+from match import Match
+from matchserver import MatchServer
+import tplogger
+sys.path.append(os.path.abspath('tests'))
+from mockkeyboard import MockKeyboard
+from nullrenderer import NullRenderer
+logger = tplogger.getTPLogger('matchserver_test.log', logging.DEBUG)
+
+class MatchServerTest(unittest.TestCase):
+    def MakeConf(self, n):
+        conf = GameConfig()
+        conf.player_size = n
+        conf.frames_per_sec = 32767
+        conf.game_length = 0.05
+        conf.post_game_time = 0
+        conf.do_sync = False
+        return conf
+
+    def MakeKeyboard(self):
+        k = MockKeyboard()
+        k.inputs = [1]*30+[0]*100
+        return k
+
+    async def RunMatches(self, n, matches):
+        '''Run a MatchServer and matches * n clients in one event loop.'''
+        conf = self.MakeConf(n)
+        user_conf = GameConfig()
+        user_conf.do_sync = False
+        s = AsyncUDPSocket()
+        await s.Open(('127.0.0.1', 0))
+        svr = MatchServer(conf)
+        svr.buffer_time = 0
+        clients = []
+        for i in range(0, n * matches):
+            clients.append(AsyncUDPClient().Run(s.sock.getsockname(),
+                NullRenderer(), self.MakeKeyboard(), user_conf, 1, 1, 0.5))
+        results = await asyncio.gather(svr.Run(s, 0.5, matches), *clients)
+        s.Close()
+        return (svr, results)
+
+    def template_Run(self, n, matches):
+        (svr, results) = asyncio.run(self.RunMatches(n, matches))
+        self.assertTrue(len(results[0]) + svr.failed == matches)
+        self.assertTrue(svr.failed == 0)
+        for result in results[1:]:
+            self.assertTrue(result)
+        self.assertTrue(len(svr.matches) == 0)
+        self.assertTrue(svr.frames > 0)
+        self.assertTrue(svr.GetCapacity() > 0)
+        ids = sorted([int(stats.split()[1][:-1]) for stats in results[0]])
+        self.assertTrue(ids == list(range(0, matches)))
+
+    def test_Run_1(self):
+        self.template_Run(1, 1)
+
+    def test_Run_2(self):
+        self.template_Run(2, 2)
+
+    def test_Run_3(self):
+        self.template_Run(1, 3)
+
+    async def RunSilentClient(self):
+        '''Run a MatchServer and a client that connects but never answers
+        the handshake.'''
+        s = AsyncUDPSocket()
+        await s.Open(('127.0.0.1', 0))
+        svr = MatchServer(self.MakeConf(1))
+        c = AsyncUDPSocket()
+        await c.Open(('127.0.0.1', 0))
+        (finished, connected) = await asyncio.gather(svr.Run(s, 0.5, 1),
+                c.Connect(s.sock.getsockname(), 0.5))
+        c.Close()
+        s.Close()
+        return (svr, finished, connected)
+
+    def test_Run_Failed(self):
+        (svr, finished, connected) = asyncio.run(self.RunSilentClient())
+        self.assertTrue(connected)
+        self.assertTrue(finished == [])
+        self.assertTrue(svr.failed == 1)
+
+    def test_Match_Tick(self):
+        '''A match without clients plays to the end on its own.'''
+        conf = self.MakeConf(0)
+        conf.frames_per_sec = 60
+        conf.game_length = 1
+        conf.rounds = 1
+        m = Match(4, [], conf, 0.0)
+        deadline = m.GetDeadline()
+        now = m.scheduler.start + 0.5
+        self.assertTrue(deadline <= now)
+        m.Tick(now)
+        self.assertTrue(m.engine.state.frame == 30)
+        self.assertTrue(not m.is_done)
+        # One tick plays at most to the end of the rotation.
+        for i in range(0, 10):
+            m.Tick(now + 10.0)
+        self.assertTrue(m.is_done)
+        self.assertTrue(m.ticks == 4)
+        self.assertTrue(m.GetStats().startswith('match 4: frames 180'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,12 +6,18 @@ class MockEventSocket:
     def ReadEvent(self):
         raise Exception
 
+    def ReadEvents(self):
+        raise Exception
+
     def UnreadEvent(self):
         pass
 
     def WriteEvent(self, evt):
         raise Exception
 
+    def SendEvent(self, evt):
+        raise Exception
+
     def Close(self):
         pass
 
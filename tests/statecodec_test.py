@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from eventtype import EventType
+from gameconfig import GameConfig
+from gamestate import GameState
+from statecodec import StateCodec
+class StateCodecTest(unittest.TestCase):
+    def template_RoundTrip(self, s, base):
+        codec = StateCodec(GameConfig())
+        codec.state = s
+        codec.base = base
+        codec.base_seq = 517
+        codec.seq = 520
+        buf = bytearray(600)
+        end = codec.SerializeInto(buf, 2)
+        (event_type,) = EventType.STRUCT.unpack_from(buf, 2)
+        self.assertTrue(event_type == EventType.STATE_PACKED)
+        expected = None
+        if base != None:
+            expected = 517
+        self.assertTrue(StateCodec.GetBase(buf, 6, 520) == expected)
+        t = GameState()
+        # Trailing bytes are ignored.
+        codec.Deserialize(memoryview(buf)[:end + 7], 6, t, base)
+        self.assertTrue(t == s)
+        return end - 2
+
+    def MakeState(self):
+        s = GameState()
+        s.frame = 1234
+        s.ball.pos_x = -20
+        s.ball.vel_y = -32
+        s.paddle_right.pos_y = 500
+        s.paddle_right.vel_y = 16
+        s.key_flags = 5
+        s.bits[0] = (1 << 63) | 1
+        s.bits[2] = (1 << 64) - 1
+        return s
+
+    def test_RoundTrip_1(self):
+        size = self.template_RoundTrip(self.MakeState(), None)
+        self.assertTrue(size < len(self.MakeState().Serialize()))
+
+    def test_RoundTrip_2(self):
+        base = self.MakeState()
+        s = self.MakeState()
+        s.frame += 3
+        s.ball.pos_y = 7
+        s.bits[1] = 1 << 10
+        size = self.template_RoundTrip(s, base)
+        full = self.template_RoundTrip(s, None)
+        self.assertTrue(size < full)
+
+    def test_RoundTrip_3(self):
+        # An empty history takes the bits of its form and of its count.
+        s = GameState()
+        codec = StateCodec(GameConfig())
+        (_, n) = codec.PackState(s, None, 0)
+        fields = sum([width for (_, width) in codec.ranges])
+        self.assertTrue(n == 1 + codec.frame_bits + fields +
+                3 * (1 + codec.count_bits))
+
+    def test_OutOfRange(self):
+        codec = StateCodec(GameConfig())
+        s = GameState()
+        s.ball.vel_x = 100
+        self.assertTrue(codec.PackState(s, None, 0) == None)
+        # The state is written by GameState instead.
+        codec.state = s
+        buf = bytearray(600)
+        end = codec.SerializeInto(buf, 0)
+        self.assertTrue(bytes(buf[:end]) == s.Serialize())
+        s.ball.vel_x = 0
+        s.bits[0] = 1 << 64
+        self.assertTrue(codec.PackState(s, None, 0) == None)
+
+    def test_OutOfRange_Unchanged(self):
+        # A field out of range but equal to the baseline packs as a delta.
+        base = GameState()
+        base.ball.pos_y = -600
+        base.frame = 9
+        s = GameState()
+        base.Copy(s)
+        s.frame = 10
+        codec = StateCodec(GameConfig())
+        self.assertTrue(codec.PackState(s, None, 0) == None)
+        self.template_RoundTrip(s, base)
+
+    def test_Truncated(self):
+        codec = StateCodec(GameConfig())
+        codec.state = self.MakeState()
+        buf = bytearray(600)
+        end = codec.SerializeInto(buf, 0)
+        with self.assertRaises(ValueError):
+            codec.Deserialize(buf[:end - 4], 4, GameState())
+
+if __name__ == '__main__':
+    unittest.main()
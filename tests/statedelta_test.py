@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from gamestate import GameState
+from statedelta import StateDelta
+from udpsocket import UDPSocket
+class StateDeltaTest(unittest.TestCase):
+    def test_Save(self):
+        d = StateDelta(2)
+        s = GameState()
+        for seq in range(0, 3):
+            s.frame = seq
+            s.bits[0] = seq
+            d.Save(seq, s)
+        # The oldest state is overwritten.
+        self.assertTrue(d.Find(0) == None)
+        self.assertTrue(d.Find(2).frame == 2)
+        self.assertTrue(d.Find(2).bits[0] == 2)
+        self.assertTrue(d.Find(1) is not s)
+
+    def test_FindAcked(self):
+        d = StateDelta()
+        sock = UDPSocket()
+        s = GameState()
+        self.assertFalse(d.FindAcked(sock))
+        for seq in range(0, 5):
+            d.Save(seq, s)
+        self.assertFalse(d.FindAcked(sock))
+        # The peer received 1 and 3, but not 4.
+        sock.UpdatePeerAck(3, 1 << 31 >> 1)
+        self.assertTrue(d.FindAcked(sock))
+        self.assertTrue(d.base_seq == 3)
+        self.assertTrue(d.base is d.Find(3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from stepcache import StepCache
+class StepCacheTest(unittest.TestCase):
+    def test_Get(self):
+        c = StepCache(2)
+        self.assertTrue(c.Get(1) == None)
+        c.Put(1, 'a')
+        self.assertTrue(c.Get(1) == 'a')
+        self.assertTrue(c.hits == 1)
+        self.assertTrue(c.misses == 1)
+
+    def test_Put(self):
+        c = StepCache(2)
+        c.Put(1, 'a')
+        c.Put(2, 'b')
+        c.Put(1, 'c')
+        self.assertTrue(len(c.entries) == 2)
+        self.assertTrue(c.Get(1) == 'c')
+
+    def test_Evict(self):
+        c = StepCache(2)
+        c.Put(1, 'a')
+        c.Put(2, 'b')
+        # 1 is now more recently used than 2.
+        c.Get(1)
+        c.Put(3, 'c')
+        self.assertTrue(c.Get(2) == None)
+        self.assertTrue(c.Get(1) == 'a')
+        self.assertTrue(c.Get(3) == 'c')
+
+    def test_Clear(self):
+        c = StepCache(2)
+        c.Put(1, 'a')
+        c.Get(1)
+        c.Clear()
+        self.assertTrue(c.Get(1) == None)
+        self.assertTrue(c.hits == 1)
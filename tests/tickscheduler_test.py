@@ -0,0 +1,52 @@
+import os
+import selectors
+import sys
+import time
+import unittest
+sys.path.append(os.path.abspath('src'))
+from tickscheduler import TickScheduler
+from udpsocket import UDPSocket
+
+class TickSchedulerTest(unittest.TestCase):
+    def test_GetFrame(self):
+        sched = TickScheduler()
+        sched.SetStart(time.time() - 2.0, 60)
+        frame = sched.GetFrame(sched.Now())
+        self.assertTrue(120 <= frame and frame <= 125)
+        for i in range(0, 1000):
+            self.assertTrue(sched.GetFrame(sched.GetFrameTime(i)) == i)
+
+    def test_WaitUntil_Sleep(self):
+        sched = TickScheduler()
+        start = sched.Now()
+        deadline = start + 0.05
+        self.assertTrue(not sched.WaitUntil(deadline))
+        self.assertTrue(sched.Now() >= deadline)
+        self.assertTrue(sched.wakeups == 1)
+        self.assertTrue(sched.jitter_max >= 0)
+        # A deadline in the past does not wait.
+        self.assertTrue(not sched.WaitUntil(start))
+        self.assertTrue(sched.wakeups == 1)
+
+    def test_WaitUntil_Ready(self):
+        s, t = UDPSocket.Pair()
+        sel = selectors.DefaultSelector()
+        sel.register(t, selectors.EVENT_READ)
+        sched = TickScheduler()
+        try:
+            s.Send(b'')
+            start = sched.Now()
+            self.assertTrue(sched.WaitUntil(start + 5.0, sel))
+            self.assertTrue(sched.Now() - start < 1.0)
+            self.assertTrue(sched.wakeups == 0)
+        finally:
+            sel.close()
+            s.Close()
+            t.Close()
+
+    def test_GetJitterReport(self):
+        sched = TickScheduler()
+        self.assertTrue(sched.GetJitterReport().startswith('Wake-ups 0 '))
+
+if __name__ == '__main__':
+    unittest.main()
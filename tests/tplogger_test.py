@@ -0,0 +1,40 @@
+import logging
+import os
+import queue
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+import tplogger
+
+class TPLoggerTest(unittest.TestCase):
+    def test_getTPLogger(self):
+        logger = tplogger.getTPLogger('tplogger_test.log', logging.DEBUG)
+        logger.info('first %d', 1)
+        logger.debug('second')
+        tplogger.flushTPLoggers()
+        with open('tplogger_test.log') as f:
+            lines = f.readlines()
+        self.assertTrue(len(lines) == 2)
+        self.assertTrue(lines[0].strip().endswith('INFO first 1'))
+        self.assertTrue(lines[1].strip().endswith('DEBUG second'))
+
+    def test_getTPLogger_Twice(self):
+        a = tplogger.getTPLogger('tplogger_test.log', logging.DEBUG)
+        b = tplogger.getTPLogger('tplogger_test.log', logging.DEBUG)
+        self.assertTrue(a is b)
+        self.assertTrue(len(a.handlers) == 1)
+
+    def test_DroppingQueueHandler(self):
+        h = tplogger.DroppingQueueHandler(queue.Queue(2))
+        logger = logging.getLogger('tplogger_test_dropping')
+        logger.propagate = False
+        logger.addHandler(h)
+        for i in range(0, 5):
+            logger.warning('record %d', i)
+        logger.removeHandler(h)
+        self.assertTrue(h.queue.qsize() == 2)
+        self.assertTrue(h.dropped == 3)
+        self.assertTrue(h.queue.get().getMessage() == 'record 0')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,3 +24,14 @@ class TPMessageTest(unittest.TestCase):
         msg = TPMessage()
         msg.timestamp = 10
         self.template_SerializeAndDeserialize(msg)
+
+    def test_SerializeInto(self):
+        msg = TPMessage()
+        msg.method = TPMessage.METHOD_SYNC
+        msg.timestamp = 1 << 40
+        buf = bytearray(64)
+        end = msg.SerializeInto(buf, 10)
+        self.assertTrue(buf[10:end] == msg.Serialize())
+        t = TPMessage()
+        t.Deserialize(memoryview(buf), 14)
+        self.assertTrue(msg == t)
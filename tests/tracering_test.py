@@ -0,0 +1,72 @@
+import logging
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath('src'))
+from tracering import TraceRing
+import tplogger
+
+class TraceRingTest(unittest.TestCase):
+    def template_Record(self, capacity, n, expected_frames):
+        t = TraceRing(capacity)
+        for i in range(0, n):
+            t.Record(1, i, i + 1, -i)
+        records = t.GetRecords()
+        self.assertTrue([r[1] for r in records] == expected_frames)
+        for (code, frame, a, b, c) in records:
+            self.assertTrue(code == 1)
+            self.assertTrue(a == frame + 1)
+            self.assertTrue(b == -frame)
+            self.assertTrue(c == 0)
+        self.assertTrue(t.count == n)
+
+    def test_Record_1(self):
+        self.template_Record(4, 0, [])
+
+    def test_Record_2(self):
+        self.template_Record(4, 3, [0, 1, 2])
+
+    def test_Record_3(self):
+        self.template_Record(4, 4, [0, 1, 2, 3])
+
+    def test_Record_4(self):
+        self.template_Record(4, 10, [6, 7, 8, 9])
+
+    def test_Format(self):
+        t = TraceRing(8, {1: 'Sending frame {0}.', 2: '{1} < {2} - {3}'})
+        t.Record(1, 5)
+        t.Record(2, 0, 7, 2, 4)
+        t.Record(3, 9, 1)
+        self.assertTrue(t.Format() == ['Sending frame 5.', '7 < 2 - 4',
+            'trace 3: 9 1 0 0'])
+
+    def test_Clear(self):
+        t = TraceRing(2)
+        t.Record(1, 5)
+        t.Clear()
+        self.assertTrue(t.GetRecords() == [])
+
+    def test_Dump(self):
+        logger = tplogger.getTPLogger('tracering_test.log', logging.INFO)
+        t = TraceRing(2, {1: 'frame {0}'})
+        for i in range(0, 3):
+            t.Record(1, i)
+        with self.assertLogs(logger, logging.DEBUG) as cm:
+            t.Dump(logger, logging.INFO)
+        self.assertTrue(len(cm.output) == 3)
+        self.assertTrue(cm.output[2].endswith('frame 2'))
+        # Nothing is formatted below the level of the logger.
+        with self.assertLogs(logger, logging.WARNING) as cm:
+            t.Dump(logger, logging.INFO)
+            logger.warning('end')
+        self.assertTrue(len(cm.output) == 1)
+
+    def test_setTPLevel(self):
+        logger = tplogger.getTPLogger('tracering_test.log', logging.DEBUG)
+        tplogger.setTPLevel('warning')
+        self.assertTrue(logger.level == logging.WARNING)
+        tplogger.setTPLevel(logging.DEBUG)
+        self.assertTrue(logger.level == logging.DEBUG)
+
+if __name__ == '__main__':
+    unittest.main()
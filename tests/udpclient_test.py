@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 import unittest
 sys.path.append(os.path.abspath('src'))
 from udpgameengine import UDPGameEngine
@@ -8,7 +9,26 @@ from gamestate import GameState
 from udpclient import UDPClient
 from udpeventsocket import UDPEventSocket
 from udpsocket import UDPSocket
+class CountingClient(UDPClient):
+    '''Count the ticks of PlayFrames().'''
+    def __init__(self):
+        UDPClient.__init__(self)
+        self.ticks = 0
+
+    def PlayTick(self, e, s, now, target_frame, end_frame, msg):
+        self.ticks += 1
+        s.frame = min(max(s.frame, target_frame), end_frame)
+
 class UDPClientTest(unittest.TestCase):
+    def test_PlayFrames_NoServer(self):
+        # Without a server nothing is sent, so only the frames wake it up.
+        c = CountingClient()
+        e = UDPGameEngine()
+        s = GameState()
+        c.PlayFrames(e, s, time.time(), 6, 60)
+        self.assertTrue(s.frame == 6)
+        self.assertTrue(c.ticks <= 20)
+
     def template_ShouldApplyStateUpdate(self, unacked_1, unacked_2, 
             frame, update_frame, update_history, size, expected_unacked_1, 
             expected_unacked_2, expected_answer):
@@ -1,4 +1,5 @@
 import os
+import struct
 import sys
 import unittest
 sys.path.append(os.path.abspath('src'))
@@ -35,3 +36,51 @@ class UDPDatagramTest(unittest.TestCase):
     def test_SerializeAndDeserialize(self):
         self.template_SerializeAndDeserialize(0, 0, 0, 
                 b'0'*UDPDatagram.MAX_PAYLOAD)
+
+    def test_SerializeAndDeserialize_2(self):
+        self.template_SerializeAndDeserialize(65535, 7, (1 << 32) - 1, b'')
+
+    def test_SerializeAndDeserialize_3(self):
+        self.template_SerializeAndDeserialize(1, 2, 3, b'abc')
+
+    def test_Serialize_Size(self):
+        d = UDPDatagram()
+        d.payload = b'x' * 12
+        b = d.Serialize()
+        self.assertTrue(len(b) == UDPDatagram.HEADER_SIZE + 12)
+        self.assertTrue(b[0] == UDPDatagram.VERSION)
+        d.payload = b'x' * UDPDatagram.MAX_PAYLOAD
+        self.assertTrue(len(d.Serialize()) == UDPDatagram.MAX_DATAGRAM)
+
+    def test_Serialize_V0Size(self):
+        '''A datagram is never as long as one of version 0.'''
+        d = UDPDatagram()
+        d.seq = 300
+        d.payload = b'x' * (UDPDatagram.V0_DATAGRAM - UDPDatagram.HEADER_SIZE)
+        b = d.Serialize()
+        self.assertTrue(len(b) == UDPDatagram.V0_DATAGRAM + 1)
+        e = UDPDatagram()
+        e.Deserialize(b)
+        self.assertTrue(e.version == UDPDatagram.VERSION)
+        self.assertTrue(e.seq == 300)
+        self.assertTrue(e.payload[:-1] == d.payload)
+
+    def test_Deserialize_Version0(self):
+        '''A padded datagram without a version byte is still read, even if
+        the high byte of its sequence number is the current version.'''
+        b = struct.pack(UDPDatagram.HEADER_V0, 300, 4, 3) + b'abc'
+        b += b'\0' * (UDPDatagram.V0_DATAGRAM - len(b))
+        d = UDPDatagram()
+        d.Deserialize(b)
+        self.assertTrue(d.version == 0)
+        self.assertTrue((d.seq, d.ack, d.ackbits) == (300, 4, 3))
+        self.assertTrue(d.payload[:3] == b'abc')
+
+    def test_Deserialize_Version2(self):
+        d = UDPDatagram()
+        b = bytes([UDPDatagram.VERSION + 1]) + d.Serialize()[1:]
+        self.assertRaises(ValueError, d.Deserialize, b)
+
+    def test_Deserialize_Short(self):
+        d = UDPDatagram()
+        self.assertRaises(struct.error, d.Deserialize, b'xx')
@@ -1,13 +1,17 @@
 import logging
 import multiprocessing
 import os
+import select
 import sys
 import unittest
 sys.path.append(os.path.abspath('src'))
 from endgameevent import EndGameEvent
+from eventtype import EventType
 from gameconfig import GameConfig
 from gameevent import GameEvent
 from gamestate import GameState
+from statecodec import StateCodec
+from statedelta import StateDelta
 import tplogger
 from tpmessage import TPMessage
 from udpeventsocket import UDPEventSocket
@@ -42,6 +46,127 @@ class UDPEventSocketTest(unittest.TestCase):
         self.assertTrue(status == 0)
         self.assertTrue(evt == received)
     
+    def test_ReadEvents(self):
+        s, t = UDPSocket.Pair()
+        e = UDPEventSocket(s)
+        f = UDPEventSocket(t)
+        try:
+            self.assertTrue(f.ReadEvents() == [])
+            for i in range(0, 3):
+                evt = GameEvent()
+                evt.frame = i
+                e.WriteEvent(evt)
+            events = f.ReadEvents()
+            self.assertTrue([evt.frame for evt in events] == [0, 1, 2])
+            # An unread event is returned again first.
+            f.UnreadEvent()
+            evt.frame = 3
+            e.WriteEvent(evt)
+            events = f.ReadEvents()
+            self.assertTrue([evt.frame for evt in events] == [2, 3])
+        finally:
+            s.Close()
+            t.Close()
+
+    def test_ReadEvents_Pool(self):
+        s, t = UDPSocket.Pair()
+        e = UDPEventSocket(s)
+        f = UDPEventSocket(t)
+        try:
+            state = GameState()
+            for i in range(0, 3):
+                state.frame = i
+                e.WriteEvent(state)
+            events = f.ReadEvents()
+            self.assertTrue([evt.frame for evt in events] == [0, 1, 2])
+            self.assertTrue(len(set([id(evt) for evt in events])) == 3)
+            # The next read reuses the instances, except an unread one.
+            f.UnreadEvent()
+            for i in range(3, 5):
+                state.frame = i
+                e.WriteEvent(state)
+            again = f.ReadEvents()
+            self.assertTrue([evt.frame for evt in again] == [2, 3, 4])
+            self.assertTrue(again[0] is events[2])
+            self.assertTrue(any([again[1] is evt for evt in events[:2]]))
+            self.assertTrue(len(f.pools[state.event_type].events) == 3)
+            # Handshakes are not pooled.
+            msg = TPMessage()
+            e.WriteEvent(msg)
+            e.WriteEvent(msg)
+            [a, b] = f.ReadEvents()
+            self.assertTrue(a == msg and b == msg and a is not b)
+        finally:
+            s.Close()
+            t.Close()
+
+    def test_Write_Delta(self):
+        s, t = UDPSocket.Pair()
+        e = UDPEventSocket(s)
+        f = UDPEventSocket(t)
+        e.send_deltas = True
+        try:
+            state = GameState()
+            state.frame = 1
+            e.WriteEvent(state)
+            self.assertTrue(f.ReadEvent(1.0) == state)
+            # Nothing is acknowledged yet, so this is a full state too.
+            state.frame = 2
+            e.WriteEvent(state)
+            self.assertTrue(f.ReadEvent(1.0) == state)
+            # The peer acknowledges both states.
+            f.WriteEvent(GameEvent())
+            self.assertTrue(e.ReadEvent(1.0) != None)
+            state.frame = 3
+            state.ball.pos_y = 7
+            e.WriteEvent(state)
+            select.select([t.sock], [], [], 1.0)
+            datagram = t.Recv()
+            (event_type,) = EventType.STRUCT.unpack_from(datagram.payload)
+            self.assertTrue(event_type == EventType.STATE_DELTA)
+            self.assertTrue(GameState.GetDeltaBase(datagram.payload,
+                EventType.SIZE) == 1)
+            self.assertTrue(len(datagram.payload) < state.GetSize())
+            self.assertTrue(f.Decode(datagram) == state)
+            # A delta against a state that is not saved is dropped.
+            f.received_states = StateDelta()
+            self.assertTrue(f.Decode(datagram) == None)
+        finally:
+            s.Close()
+            t.Close()
+
+    def test_Write_Packed(self):
+        s, t = UDPSocket.Pair()
+        e = UDPEventSocket(s)
+        f = UDPEventSocket(t)
+        conf = GameConfig()
+        e.send_deltas = True
+        e.codec = StateCodec(conf)
+        try:
+            state = GameState()
+            state.frame = 1
+            # A packed state is dropped before the configuration.
+            e.WriteEvent(state)
+            self.assertTrue(f.ReadEvent(1.0) == None)
+            e.WriteEvent(conf)
+            self.assertTrue(f.ReadEvent(1.0) == conf)
+            self.assertTrue(f.codec != None)
+            e.WriteEvent(state)
+            self.assertTrue(f.ReadEvent(1.0) == state)
+            f.WriteEvent(GameEvent())
+            self.assertTrue(e.ReadEvent(1.0) != None)
+            state.frame = 2
+            state.bits[1] = 6
+            e.WriteEvent(state)
+            select.select([t.sock], [], [], 1.0)
+            datagram = t.Recv()
+            self.assertTrue(StateCodec.GetBase(datagram.payload,
+                EventType.SIZE, datagram.seq) == 2)
+            self.assertTrue(f.Decode(datagram) == state)
+        finally:
+            s.Close()
+            t.Close()
+
     def test_ReadAndWriteEvent_None(self):
         self.template_ReadAndWriteEvent(None)
 
@@ -72,6 +197,20 @@ class UDPEventSocketTest(unittest.TestCase):
         evt.key_flags = 4
         self.template_ReadAndWriteEvent(evt)
 
+    def test_ReadAndWriteEvent_Keyboard_3(self):
+        evt = GameEvent()
+        evt.frame = 5000
+        evt.keybits = (1 << 1023) | 1
+        self.template_ReadAndWriteEvent(evt)
+
+    def test_ReadAndWriteEvent_State_3(self):
+        evt = GameState()
+        evt.frame = 5000
+        evt.bits[0] = (1 << 1024) - 1
+        evt.bits[1] = 1 << 500
+        evt.bits[2] = 7
+        self.template_ReadAndWriteEvent(evt)
+
     def test_ReadAndWriteEvent_EndGame_1(self):
         evt = EndGameEvent()
         self.template_ReadAndWriteEvent(evt)
@@ -1,12 +1,15 @@
 import copy
 import logging
 import os
+import random
 import socket
 import sys
 import time
 import unittest
 sys.path.append(os.path.abspath('src'))
+from bitrecord import BitRecord
 from endgameevent import EndGameEvent
+from gameconfig import GameConfig
 from udpgameengine import UDPGameEngine
 from gamerecord import GameRecord
 from gamestate import GameState
@@ -55,6 +58,176 @@ class UDPGameEngineTest(unittest.TestCase):
         result = e.IsAcked(frame, history, history_frame, size) 
         self.assertTrue(result == expected_result)
 
+    def template_GetEventTable(self, roles):
+        e = UDPGameEngine()
+        s = GameState()
+        s.roles = roles
+        table = e.GetEventTable(roles)
+        for i in range(0, 8):
+            bits = [i & 1, (i >> 1) & 1, (i >> 2) & 1]
+            self.assertTrue(table[i] == e.BitsToEvent(s, bits))
+
+    def template_WindowMask(self, start, count, size, expected_mask):
+        e = UDPGameEngine()
+        self.assertTrue(e.WindowMask(start, count, size) == expected_mask)
+
+    def template_EarliestBitFrame(self, bits, frame, size, expected_frame):
+        e = UDPGameEngine()
+        self.assertTrue(e.EarliestBitFrame(bits, frame, size) == \
+                expected_frame)
+
+    def template_Trajectory(self, pos, vel, frames, gravity):
+        e = UDPGameEngine()
+        e.should_apply_gravity = gravity
+        term = UDPGameEngine.BALL_TERM_VELOCITY
+        (p, v) = (pos, vel)
+        for i in range(0, frames):
+            if gravity and v < term:
+                v += 1
+            p += v
+        self.assertTrue(e.Trajectory(pos, vel, frames, term) == (p, v))
+
+    def template_PlayInputFree(self, ball_y, ball_vel_x, ball_vel_y,
+            paddle_y, paddle_vel_y, gravity, collision, frames):
+        e = UDPGameEngine()
+        e.should_apply_gravity = gravity
+        e.should_apply_collision = collision
+        s = GameState()
+        s.ball.pos_y = ball_y
+        s.ball.vel_x = ball_vel_x
+        s.ball.vel_y = ball_vel_y
+        s.paddle_left.pos_y = paddle_y
+        s.paddle_left.vel_y = paddle_vel_y
+        t = copy.deepcopy(s)
+        b1 = BitRecord()
+        b2 = BitRecord()
+        for i in range(0, frames):
+            e.PlayFrame(s, GameEvent.EVENT_NO_OP, b1)
+        e.PlayInputFree(t, frames, b2)
+        self.assertTrue(s == t)
+        self.assertTrue(b1.bits == b2.bits)
+
+    def template_SpecializePlayFrame(self, conf, gravity, collision, frames,
+            seed):
+        rand = random.Random(seed)
+        e = UDPGameEngine()
+        e.should_apply_gravity = gravity
+        e.should_apply_collision = collision
+        conf.Apply(e)
+        s = copy.deepcopy(e.state)
+        t = copy.deepcopy(e.state)
+        b1 = BitRecord()
+        b2 = BitRecord()
+        for i in range(0, frames):
+            keys = GameEvent.EVENT_NO_OP
+            if rand.random() < 0.05:
+                keys |= GameEvent.EVENT_FLAP_LEFT_PADDLE
+            if rand.random() < 0.05:
+                keys |= GameEvent.EVENT_FLAP_RIGHT_PADDLE
+            if rand.random() < 0.1:
+                keys |= GameEvent.EVENT_FLAP_BALL
+            if rand.random() < 0.01:
+                s.is_ended = not s.is_ended
+                t.is_ended = s.is_ended
+            e.PlayFrame(s, keys, b1)
+            e.play_frame(t, keys, b2)
+            self.assertTrue(s == t)
+            self.assertTrue(b1.bits == b2.bits)
+
+    def template_PlayFrameCached(self, capacity, frames, replays, seed):
+        '''Replay the same frames several times, as in a rewind, and compare
+        with PlayFrame.'''
+        rand = random.Random(seed)
+        e = UDPGameEngine()
+        conf = GameConfig()
+        conf.step_cache_size = capacity
+        conf.Apply(e)
+        keys = []
+        for i in range(0, frames):
+            keys.append(rand.choice([GameEvent.EVENT_NO_OP,
+                GameEvent.EVENT_NO_OP, GameEvent.EVENT_FLAP_BALL,
+                GameEvent.EVENT_FLAP_LEFT_PADDLE]))
+        for r in range(0, replays):
+            s = copy.deepcopy(e.state)
+            t = copy.deepcopy(e.state)
+            b1 = BitRecord()
+            b2 = BitRecord()
+            for k in keys:
+                e.PlayFrame(s, k, b1)
+                e.play_frame(t, k, b2)
+                self.assertTrue(s == t)
+                self.assertTrue(b1.bits == b2.bits)
+        return e.step_cache
+
+    def template_FastMode(self, size, ops, seed):
+        '''Compare the unchecked variants with the checked methods on random
+        arguments.'''
+        rand = random.Random(seed)
+        e = UDPGameEngine()
+        for i in range(0, ops):
+            bits = rand.getrandbits(size)
+            n = rand.randrange(0, size)
+            b = rand.randint(0, 1)
+            self.assertTrue(e.SetBit(bits, n, b, size) == \
+                    e.SetBitFast(bits, n, b, size))
+            self.assertTrue(e.GetBit(bits, n) == e.GetBitFast(bits, n))
+            self.assertTrue(e.RotateBits(bits, n, size) == \
+                    e.RotateBitsFast(bits, n, size))
+            frame = rand.randrange(size, 4 * size)
+            update_frame = rand.randrange(frame - size, frame + 1)
+            update = rand.getrandbits(size)
+            self.assertTrue(
+                    e.UpdateHistory(frame, bits, update_frame, update, size) ==
+                    e.UpdateHistoryFast(frame, bits, update_frame, update,
+                        size))
+            acked = rand.randrange(0, frame + 2)
+            self.assertTrue(e.IsAcked(acked, bits, frame, size) == \
+                    e.IsAckedFast(acked, bits, frame, size))
+
+    def template_PlayFromStateFast(self, size, frames, seed):
+        '''Replay the same inputs with a checked and a fast engine.'''
+        rand = random.Random(seed)
+        engines = []
+        for fast in [False, True]:
+            e = UDPGameEngine()
+            conf = GameConfig()
+            conf.buffer_size = size
+            conf.fast_mode = fast
+            conf.Apply(e)
+            engines.append(e)
+        (e, f) = engines
+        self.assertTrue(not e.fast_mode)
+        self.assertTrue(f.fast_mode)
+        bitrec = BitRecord()
+        bitrec.frame = frames
+        for i in range(0, 4):
+            bitrec.bits[i] = rand.getrandbits(size)
+        s = copy.deepcopy(e.state)
+        t = copy.deepcopy(f.state)
+        start = max(0, frames - size)
+        s.frame = start
+        t.frame = start
+        e.PlayFromState(s, copy.deepcopy(bitrec), e.rec, frames, size)
+        f.PlayFromState(t, copy.deepcopy(bitrec), f.rec, frames, size)
+        self.assertTrue(s == t)
+        self.assertTrue(e.rec.available == f.rec.available)
+        self.assertTrue(e.rec.rows == f.rec.rows)
+        for n in range(0, size):
+            u = copy.deepcopy(s)
+            v = copy.deepcopy(t)
+            e.rec.RestoreExceptPlayer(n, u, u.roles, 1)
+            f.rec.RestoreExceptPlayer(n, v, v.roles, 1)
+            self.assertTrue(u == v)
+        # The client replays with bits[3] flagging its own frames.
+        s.frame = start
+        t.frame = start
+        e.PlayFromStateWithPlayer(s, copy.deepcopy(bitrec), e.rec, frames, 1,
+                size)
+        f.PlayFromStateWithPlayer(t, copy.deepcopy(bitrec), f.rec, frames, 1,
+                size)
+        self.assertTrue(s == t)
+        self.assertTrue(e.rec.rows == f.rec.rows)
+
     def template_UpdateBitRecordBit(self, bits, frame, update, 
             update_frame, size, expected_bits):
         e = UDPGameEngine()
@@ -287,3 +460,118 @@ class UDPGameEngineTest(unittest.TestCase):
     def test_UpdateBitRecordFrame_4(self):
         self.template_UpdateBitRecordFrame([int('1'*64,2),0,0,0,0],100,120,64,
                 [int('1'*8+'0'*20+'1'*36,2),0,0,0,0])
+
+    def test_EarliestBitFrame_1(self):
+        self.template_EarliestBitFrame(0, 100, 64, -1)
+
+    def test_EarliestBitFrame_2(self):
+        self.template_EarliestBitFrame(int('1001',2), 4, 4, 0)
+
+    def test_EarliestBitFrame_3(self):
+        self.template_EarliestBitFrame(int('1001',2), 5, 4, 3)
+
+    def test_EarliestBitFrame_4(self):
+        self.template_EarliestBitFrame(int('0'*27+'1'+'0'*35+'1',2), 150, 64,
+                100)
+
+    def test_Trajectory_1(self):
+        self.template_Trajectory(0, 0, 0, True)
+
+    def test_Trajectory_2(self):
+        self.template_Trajectory(100, -20, 10, True)
+
+    def test_Trajectory_3(self):
+        self.template_Trajectory(100, -20, 100, True)
+
+    def test_Trajectory_4(self):
+        self.template_Trajectory(100, -3, 50, False)
+
+    def test_PlayInputFree_1(self):
+        self.template_PlayInputFree(240, 4, 0, 240, 0, True, True, 0)
+
+    def test_PlayInputFree_2(self):
+        self.template_PlayInputFree(240, 4, 0, 240, 0, True, True, 1000)
+
+    def test_PlayInputFree_3(self):
+        self.template_PlayInputFree(100, -6, -8, 100, -12, True, True, 3000)
+
+    def test_PlayInputFree_4(self):
+        self.template_PlayInputFree(300, 6, 3, 30, 0, False, True, 2000)
+
+    def test_PlayInputFree_5(self):
+        self.template_PlayInputFree(200, -4, 10, 400, 5, True, False, 500)
+
+    def test_SpecializePlayFrame_1(self):
+        self.template_SpecializePlayFrame(GameConfig(), True, True, 2000, 0)
+
+    def test_SpecializePlayFrame_2(self):
+        self.template_SpecializePlayFrame(GameConfig(), False, True, 2000, 1)
+
+    def test_SpecializePlayFrame_3(self):
+        self.template_SpecializePlayFrame(GameConfig(), True, False, 500, 2)
+
+    def test_SpecializePlayFrame_4(self):
+        conf = GameConfig()
+        conf.screen_width = 320
+        conf.screen_height = 200
+        conf.paddle_height = 20
+        conf.ball_size = 8
+        conf.ball_vel = 6
+        self.template_SpecializePlayFrame(conf, True, True, 2000, 3)
+
+    def test_PlayFrameCached_1(self):
+        c = self.template_PlayFrameCached(4096, 1000, 3, 0)
+        self.assertTrue(c.misses == 1000)
+        self.assertTrue(c.hits == 2000)
+
+    def test_PlayFrameCached_2(self):
+        c = self.template_PlayFrameCached(16, 1000, 2, 1)
+        self.assertTrue(len(c.entries) == 16)
+        self.assertTrue(c.hits == 0)
+
+    def test_FastMode_1(self):
+        self.template_FastMode(64, 500, 0)
+
+    def test_FastMode_2(self):
+        self.template_FastMode(1024, 200, 1)
+
+    def test_PlayFromStateFast_1(self):
+        self.template_PlayFromStateFast(64, 300, 0)
+
+    def test_PlayFromStateFast_2(self):
+        self.template_PlayFromStateFast(256, 200, 1)
+
+    def test_WindowMask_1(self):
+        self.template_WindowMask(0, 0, 4, 0)
+
+    def test_WindowMask_2(self):
+        self.template_WindowMask(1, 2, 4, int('0110',2))
+
+    def test_WindowMask_3(self):
+        self.template_WindowMask(3, 2, 4, int('1001',2))
+
+    def test_WindowMask_4(self):
+        self.template_WindowMask(3, 5, 4, int('1111',2))
+
+    def test_WindowMask_5(self):
+        self.template_WindowMask(60, 8, 64, int('1111'+'0'*56+'1111',2))
+
+    def test_GetEventTable_1(self):
+        self.template_GetEventTable([GameState.ROLE_LEFT_PADDLE,
+            GameState.ROLE_RIGHT_PADDLE, GameState.ROLE_BALL])
+
+    def test_GetEventTable_2(self):
+        self.template_GetEventTable([GameState.ROLE_BALL,
+            GameState.ROLE_LEFT_PADDLE, GameState.ROLE_RIGHT_PADDLE])
+
+    def test_GetEventTable_3(self):
+        self.template_GetEventTable([GameState.ROLE_NONE,
+            GameState.ROLE_BALL, GameState.ROLE_NONE])
+
+    def test_GetEventTable_RotateRoles(self):
+        e = UDPGameEngine()
+        s = GameState()
+        e.GetEventTable(s.roles)
+        e.RotateRoles(s)
+        self.assertTrue(e.event_table_roles == tuple(s.roles))
+        self.assertTrue(e.event_table[1] == e.RoleToEvent(s.roles[0]))
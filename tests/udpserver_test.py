@@ -5,9 +5,11 @@ import sys
 import unittest
 sys.path.append(os.path.abspath('src'))
 from gameconfig import GameConfig
+from gameevent import GameEvent
 import tplogger
 from udpclient import UDPClient
 from udpeventsocket import UDPEventSocket
+from udpgameengine import UDPGameEngine
 from udpserver import UDPServer
 from udpsocket import UDPSocket
 sys.path.append(os.path.abspath('tests'))
@@ -188,6 +190,54 @@ class UDPServerTest(unittest.TestCase):
         for i in range(0, n):
             self.assertTrue(results[i])
 
+    def template_Rewind(self, frame, s_frame, bitrec_frame, size,
+            expected_frame):
+        e = UDPGameEngine()
+        conf = GameConfig()
+        conf.buffer_size = size
+        conf.Apply(e)
+        s = e.state
+        for i in range(0, s_frame):
+            e.rec.Save(i % e.buffer_size, s)
+            e.PlayFrame(s, 0, e.bitrec)
+        e.bitrec.frame = bitrec_frame
+        svr = UDPServer()
+        svr.Rewind(e, s, frame)
+        self.assertTrue(s.frame == expected_frame)
+        self.assertTrue(svr.replay_count == s_frame - expected_frame)
+
+    def test_Rewind_1(self):
+        self.template_Rewind(90, 100, 100, 64, 90)
+
+    def test_Rewind_2(self):
+        '''Too old for the record.'''
+        self.template_Rewind(30, 100, 100, 64, 36)
+
+    def test_Rewind_3(self):
+        self.template_Rewind(0, 10, 10, 64, 0)
+
+    def test_Rewind_4(self):
+        '''A deeper record reaches further back.'''
+        self.template_Rewind(30, 300, 300, 512, 30)
+
+    def test_MergeKeyboardEvent(self):
+        e = UDPGameEngine()
+        e.bitrec.frame = 100
+        svr = UDPServer()
+        evt = GameEvent()
+        evt.frame = 100
+        evt.keybits = (1 << (90 % 64)) | (1 << (95 % 64))
+        self.assertTrue(svr.MergeKeyboardEvent(e, evt, 1, 100) == 90)
+        self.assertTrue(svr.MergeKeyboardEvent(e, evt, 1, 100) == -1)
+        self.assertTrue(svr.unchanged_count == 1)
+        evt.frame = 101
+        evt.keybits |= 1 << (100 % 64)
+        self.assertTrue(svr.MergeKeyboardEvent(e, evt, 1, 100) == 100)
+        self.assertTrue(e.bitrec.frame == 102)
+        evt.frame = 10
+        self.assertTrue(svr.MergeKeyboardEvent(e, evt, 2, 100) == -1)
+        self.assertTrue(svr.unchanged_count == 1)
+
     def test_AcceptN_1(self):
         self.template_AcceptN(0)
     
@@ -4,6 +4,8 @@ import os
 import sys
 import unittest
 sys.path.append(os.path.abspath('src'))
+from eventtype import EventType
+from gameevent import GameEvent
 import tplogger
 from udpsocket import UDPSocket
 from udpdatagram import UDPDatagram
@@ -32,6 +34,38 @@ class UDPSocketTest(unittest.TestCase):
         self.assertTrue(s.ack == expected_ack)
         self.assertTrue(s.ackbits == expected_ackbits)
 
+    def test_PackEvent(self):
+        '''An event packed in place matches its serialized payload.'''
+        s = UDPSocket()
+        s.seq = 9
+        s.prefix = b'abcd'
+        evt = GameEvent()
+        evt.frame = 12
+        evt.keybits = (1 << 70) + 1
+        expected = bytes(s.Pack(evt.Serialize()))
+        view = s.PackEvent(evt)
+        self.assertTrue(view == expected)
+        self.assertTrue(len(view) == 4 + UDPDatagram.HEADER_SIZE +
+                GameEvent.STRUCT.size + evt.GetHistoryWidth())
+        d = UDPDatagram()
+        d.Deserialize(bytes(view[4:]))
+        self.assertTrue(d.seq == 9)
+        t = GameEvent()
+        t.Deserialize(d.payload, EventType.SIZE)
+        self.assertTrue(t == evt)
+
+    def test_Pack_V0Size(self):
+        '''A datagram as long as one of version 0 gets an extra byte.'''
+        s = UDPSocket()
+        s.prefix = b'abcd'
+        payload = b'x' * (UDPDatagram.V0_DATAGRAM - UDPDatagram.HEADER_SIZE)
+        s.send_buf[4 + UDPDatagram.V0_DATAGRAM] = 7
+        view = s.Pack(payload)
+        self.assertTrue(len(view) == 4 + UDPDatagram.V0_DATAGRAM + 1)
+        self.assertTrue(view[-1] == 0)
+        self.assertTrue(len(s.Pack(payload[1:])) ==
+                4 + UDPDatagram.V0_DATAGRAM - 1)
+
     def template_SendAndRecv(self, seq, ack, ackbits, payload,
             expected_ack, expected_ackbits):
         s = UDPSocket()
@@ -120,6 +154,30 @@ class UDPSocketTest(unittest.TestCase):
         self.template_UpdateAck(0, int('0'*31+'1',2), UDPDatagram.MAX_SEQ - 1,
                 0, int('1'+'0'*30+'1',2))
 
+    def test_IsAckedByPeer(self):
+        s = UDPSocket()
+        # A peer that received nothing acknowledges nothing.
+        s.UpdatePeerAck(0, 0)
+        self.assertFalse(s.IsAckedByPeer(0))
+        # The ackbits follow UpdateAck().
+        t = UDPSocket()
+        for seq in [3, 20, 40]:
+            t.UpdateAck(seq)
+        s.UpdatePeerAck(t.ack, t.ackbits)
+        acked = [seq for seq in range(0, 50) if s.IsAckedByPeer(seq)]
+        self.assertTrue(acked == [20, 40])
+        # An older ack is ignored, and the bits of the same ack are merged.
+        s.UpdatePeerAck(5, 1 << 30)
+        self.assertTrue(s.peer_ack == 40)
+        s.UpdatePeerAck(40, 1 << 31)
+        acked = [seq for seq in range(0, 50) if s.IsAckedByPeer(seq)]
+        self.assertTrue(acked == [20, 39, 40])
+        # The acks wrap around.
+        s = UDPSocket()
+        s.UpdatePeerAck(1, 1)
+        self.assertTrue(s.IsAckedByPeer(UDPDatagram.MAX_SEQ - 31))
+        self.assertFalse(s.IsAckedByPeer(UDPDatagram.MAX_SEQ - 32))
+
     def test_SendAndRecv_1(self):
         self.template_SendAndRecv(0, 0, int('0'*32,2),
                 b'0'*UDPDatagram.MAX_PAYLOAD, 0, int('0'*32,2))
@@ -150,6 +208,20 @@ class UDPSocketTest(unittest.TestCase):
         self.assertTrue(status == 0)
         self.assertTrue(count == 1, 'Counted {0}'.format(count))
 
+    def test_RecvAll(self):
+        s, t = UDPSocket.Pair()
+        try:
+            self.assertTrue(t.RecvAll() == [])
+            for i in range(0, 5):
+                s.Send(bytes([i]))
+            datagrams = t.RecvAll()
+            self.assertTrue([d.seq for d in datagrams] == [0, 1, 2, 3, 4])
+            self.assertTrue(t.ack == 4)
+            self.assertTrue(t.RecvAll() == [])
+        finally:
+            s.Close()
+            t.Close()
+
     def test_ConnectAndAccept(self):
         sock = UDPSocket()
         sock.Open()